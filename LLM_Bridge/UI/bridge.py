@@ -1,17 +1,29 @@
 import os
+import sys
 import time
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from typing import Any, Dict, List
 
 import requests
 from requests import Session, RequestException
 
+try:
+    from LLM_Bridge import tracing
+except ImportError:  # run as a script: python LLM_Bridge/UI/bridge.py
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    import tracing
+
 # --- Configuration ---
 API_KEY = os.getenv("API_KEY", "secret")  # Replace or set via environment
 THREADS_BASE_URL = os.getenv("THREADS_BASE_URL", "http://localhost:8000/api")
 # THREADS_BASE_URL = os.getenv("THREADS_BASE_URL", "http://localhost/api")
 LLM_API_URL = os.getenv("LLM_API_URL", "http://localhost:5001/ai")
 POLL_INTERVAL = int(os.getenv("POLL_INTERVAL", "5"))  # seconds
+# LLM answers routinely take longer than 10 s; llm_app queues up to LLM_APP_QUEUE_TIMEOUT on top
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "180"))  # seconds
+# pending threads answered in parallel (llm_app bounds the actual LLM concurrency)
+BRIDGE_CONCURRENCY = int(os.getenv("BRIDGE_CONCURRENCY", "4"))
 
 # --- Logging Setup ---
 logging.basicConfig(
@@ -19,6 +31,7 @@ logging.basicConfig(
     format="%(asctime)s %(levelname)s %(message)s",
 )
 logger = logging.getLogger(__name__)
+tracing.set_service("bridge")
 
 # --- HTTP Session ---
 session = Session()
@@ -28,14 +41,18 @@ session.headers.update({
 })
 
 
-def get_llm_response(prompt: str, timeout: float = 10.0) -> str:
+def get_llm_response(prompt: str, timeout: float = LLM_TIMEOUT) -> str:
     """
     Send a prompt to the LLM backend and return its response.
     Raises on network errors or unexpected payloads.
     """
     try:
         logger.debug(f"Sending prompt to LLM: {prompt}")
-        resp = session.post(LLM_API_URL, json={"Prompt": prompt}, timeout=timeout)
+        resp = session.post(LLM_API_URL, json={"Prompt": prompt}, timeout=(5, timeout),
+                            headers=tracing.headers())
+        if resp.status_code == 503:
+            # llm_app is at capacity; the thread stays pending and is retried next poll
+            raise RequestException(f"LLM busy (Retry-After {resp.headers.get('Retry-After', '?')}s)")
         resp.raise_for_status()
         data = resp.json()
         if not isinstance(data, dict) or "Response" not in data:
@@ -72,26 +89,34 @@ def process_thread(thread: Dict[str, Any]) -> None:
     if thread_id is None:
         logger.warning("Skipping thread without 'id'")
         return
+    # joins the trace threads_service started for this question (or starts one)
+    parent = tracing.parse(thread.get("traceparent"))
 
     try:
-        # Get prompt messages for this thread
-        resp = session.get(f"{THREADS_BASE_URL}/thread/{thread_id}/prompt/messages")
-        resp.raise_for_status()
-        messages = resp.json().get("messages", [])
-
-        if not messages:
-            logger.info(f"No messages in thread {thread_id}")
-            return
-
-        latest_content = messages[-1].get("content", "")
-        answer = get_llm_response(latest_content)
-
-        # Post the answer
-        post_resp = session.post(
-            f"{THREADS_BASE_URL}/thread/{thread_id}/prompt/answer",
-            json={"content": answer}
-        )
-        post_resp.raise_for_status()
+        with tracing.span("bridge.process_thread", parent=parent, thread_id=thread_id):
+            # Get prompt messages for this thread
+            with tracing.span("bridge.fetch_messages"):
+                resp = session.get(f"{THREADS_BASE_URL}/thread/{thread_id}/prompt/messages",
+                                   headers=tracing.headers(parent))
+                resp.raise_for_status()
+                messages = resp.json().get("messages", [])
+
+            if not messages:
+                logger.info(f"No messages in thread {thread_id}")
+                return
+
+            latest_content = messages[-1].get("content", "")
+            with tracing.span("bridge.llm_call", prompt_chars=len(latest_content)):
+                answer = get_llm_response(latest_content)
+
+            # Post the answer
+            with tracing.span("bridge.post_answer", answer_chars=len(answer)):
+                post_resp = session.post(
+                    f"{THREADS_BASE_URL}/thread/{thread_id}/prompt/answer",
+                    json={"content": answer},
+                    headers=tracing.headers(parent),
+                )
+                post_resp.raise_for_status()
         logger.info(f"Answered thread {thread_id}")
 
     except RequestException as e:
@@ -103,15 +128,16 @@ def process_thread(thread: Dict[str, Any]) -> None:
 def main() -> None:
     """Main polling loop."""
     logger.info("Starting bridge service...")
-    while True:
-        threads = fetch_pending_threads()
-        if not threads:
-            logger.debug("No pending threads.")
-        else:
-            logger.info(f"Processing {len(threads)} threads.")
-            for thread in threads:
-                process_thread(thread)
-        time.sleep(POLL_INTERVAL)
+    with ThreadPoolExecutor(max_workers=BRIDGE_CONCURRENCY) as pool:
+        while True:
+            threads = fetch_pending_threads()
+            if not threads:
+                logger.debug("No pending threads.")
+            else:
+                logger.info(f"Processing {len(threads)} threads.")
+                # wait for the whole batch so the next poll doesn't pick them up again
+                list(pool.map(process_thread, threads))
+            time.sleep(POLL_INTERVAL)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,435 @@
+# LLM_Bridge/answer_store.py
+# Pre-generated answers for the questions we know are coming: the curated FAQ
+# (faq.csv) and the most frequent real queries. chat() looks the normalized question
+# up here first and only runs retrieval + generation on a miss.
+#
+# Each entry records the kb_chunks rows (id + md5 of the content) its prompt was
+# built from. After an ingestion publishes, refresh() re-checks only the entries
+# whose chunks were replaced or edited: if retrieval now returns chunks with the same
+# content, the entry is re-pointed at the new ids; otherwise it is regenerated (or
+# dropped when the KB no longer answers it confidently).
+#
+# The warming job runs in the server (ANSWER_WARM_HOURS window, or the admin endpoint)
+# or from the command line, at most ANSWER_WARM_CONCURRENCY generations at a time:
+#   python -m LLM_Bridge.answer_store warm|refresh
+import os
+import re
+import csv
+import json
+import time
+import hashlib
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+DB_URL = os.getenv("RAG_DB_URL")
+MODEL_NAME = os.getenv("OLLAMA_MODEL", "llama3.2:latest")
+ANSWER_STORE = os.getenv("ANSWER_STORE", "true").lower() == "true"
+FAQ_CSV_PATH = os.getenv("FAQ_CSV_PATH", os.path.join(os.path.dirname(__file__), "faq.csv"))
+WARM_TOP = int(os.getenv("ANSWER_WARM_TOP", "200"))            # most frequent real queries
+WARM_MIN_HITS = int(os.getenv("ANSWER_WARM_MIN_HITS", "3"))     # asked at least this often
+WARM_CONCURRENCY = int(os.getenv("ANSWER_WARM_CONCURRENCY", "2"))
+# "2-5": warm once a day between 02:00 and 05:00 server time; "" = only when asked
+WARM_HOURS = os.getenv("ANSWER_WARM_HOURS", "")
+WARM_YIELD_MAX = float(os.getenv("ANSWER_WARM_YIELD_MAX", "5"))  # max wait for chats per question
+STATS_FLUSH_SECONDS = float(os.getenv("ANSWER_STATS_FLUSH_SECONDS", "60"))
+# count real queries for popular-question warming: only the normalized key and a hit count
+# are kept, questions longer than ANSWER_QUERY_KEY_MAX are not counted, and keys not asked
+# for ANSWER_QUERY_STATS_DAYS are dropped on every warm
+QUERY_STATS = os.getenv("ANSWER_QUERY_STATS", "false").lower() == "true"
+QUERY_STATS_DAYS = int(os.getenv("ANSWER_QUERY_STATS_DAYS", "30"))
+QUERY_KEY_MAX = int(os.getenv("ANSWER_QUERY_KEY_MAX", "200"))
+
+DDL = """
+CREATE TABLE IF NOT EXISTS kb_answers (
+  query_key TEXT PRIMARY KEY,
+  question TEXT NOT NULL,
+  answer TEXT NOT NULL,
+  sources JSONB,
+  chunk_ids BIGINT[] NOT NULL,
+  chunk_hashes TEXT[] NOT NULL,
+  model TEXT NOT NULL,
+  origin TEXT,
+  generated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+CREATE TABLE IF NOT EXISTS kb_query_stats (
+  query_key TEXT PRIMARY KEY,
+  hits BIGINT NOT NULL DEFAULT 0,
+  last_seen TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+-- earlier versions also kept the raw question text
+ALTER TABLE kb_query_stats DROP COLUMN IF EXISTS question;
+"""
+
+# entries with a chunk that was deleted, replaced (new id) or edited in place
+_CHANGED = """
+    EXISTS (
+        SELECT 1 FROM unnest(a.chunk_ids, a.chunk_hashes) AS d(id, hash)
+        WHERE NOT EXISTS (SELECT 1 FROM kb_chunks k WHERE k.id = d.id AND md5(k.content) = d.hash)
+    )
+"""
+# a changed entry is never served, even before refresh() gets to it
+_LOOKUP = f"""
+    SELECT answer, sources, {_CHANGED} AS changed FROM kb_answers a
+    WHERE query_key = :key AND model = :model
+"""
+_UPSERT = """
+    INSERT INTO kb_answers (query_key, question, answer, sources, chunk_ids, chunk_hashes, model, origin, generated_at)
+    VALUES (:key, :question, :answer, CAST(:sources AS JSONB), :ids, :hashes, :model, :origin, now())
+    ON CONFLICT (query_key) DO UPDATE SET
+      question = EXCLUDED.question, answer = EXCLUDED.answer, sources = EXCLUDED.sources,
+      chunk_ids = EXCLUDED.chunk_ids, chunk_hashes = EXCLUDED.chunk_hashes,
+      model = EXCLUDED.model, origin = EXCLUDED.origin, generated_at = now()
+"""
+_STALE = f"SELECT query_key, question, origin, chunk_hashes FROM kb_answers a WHERE {_CHANGED}"
+_FLUSH_STATS = """
+    INSERT INTO kb_query_stats (query_key, hits, last_seen)
+    VALUES (:key, :hits, now())
+    ON CONFLICT (query_key) DO UPDATE SET hits = kb_query_stats.hits + EXCLUDED.hits, last_seen = now()
+"""
+_PRUNE_STATS = "DELETE FROM kb_query_stats WHERE last_seen < now() - make_interval(days => :days)"
+_LOCK_ID = 0x6b625f616e73  # pg advisory lock: one warming run across workers
+
+_ready = False  # tables created (init() at startup, never on the request path)
+_stats_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0, "stale": 0, "errors": 0}
+_asked: Counter = Counter()    # query_key -> times asked since the last flush
+
+
+def normalize(question: str) -> str:
+    """Lookup key: case, whitespace and trailing punctuation don't matter."""
+    return re.sub(r"\s+", " ", question).strip().lower().rstrip(" ?!.")
+
+
+def chunk_deps(rows: Sequence) -> Tuple[List[int], List[str]]:
+    """kb_chunks ids and content md5s (same as Postgres md5(content)) the answer was built from."""
+    ids = [int(r["id"]) for r in rows]
+    hashes = [hashlib.md5((r["content"] or "").encode("utf-8")).hexdigest() for r in rows]
+    return ids, hashes
+
+
+def _get_engine():
+    from . import retrieval_db
+    return retrieval_db.get_write_engine()  # shared with ingest_admin's publish
+
+
+def init() -> None:
+    """Create the tables. Runs at server start (Warmer.start) and before a CLI warm/refresh."""
+    global _ready
+    if _ready:
+        return
+    from sqlalchemy import text
+    with _get_engine().begin() as conn:
+        conn.execute(text(DDL))
+    _ready = True
+
+
+def _count(key: str) -> None:
+    with _stats_lock:
+        _stats[key] += 1
+
+
+# ---------------- request path ----------------
+def lookup(question: str) -> Optional[Tuple[str, List[Dict]]]:
+    """(answer, source dicts) pre-generated for this question by the current model, or None."""
+    if not (ANSWER_STORE and DB_URL and _ready):
+        return None
+    from sqlalchemy import text
+    from . import retrieval_db
+    try:
+        with retrieval_db.read_connection() as conn:
+            row = conn.execute(text(_LOOKUP), {"key": normalize(question), "model": MODEL_NAME}).first()
+    except Exception as e:
+        _count("errors")
+        print(f"[ANSWER STORE] lookup failed: {e}")
+        return None
+    if row is None:
+        _count("misses")
+        return None
+    if row.changed:
+        _count("stale")  # waiting for refresh(); answer from the current KB meanwhile
+        return None
+    _count("hits")
+    sources = row.sources if not isinstance(row.sources, str) else json.loads(row.sources)
+    return row.answer, sources or []
+
+
+def record(question: str) -> None:
+    """Count a real query (ANSWER_QUERY_STATS); written to kb_query_stats in batches by the warmer thread."""
+    if not (ANSWER_STORE and QUERY_STATS and DB_URL):
+        return
+    key = normalize(question)
+    if not key or len(key) > QUERY_KEY_MAX:
+        return
+    with _stats_lock:
+        _asked[key] += 1
+
+
+def flush_stats() -> int:
+    global _asked
+    if not _ready:
+        return 0  # kept until the tables exist
+    with _stats_lock:
+        asked, _asked = _asked, Counter()
+    if not asked:
+        return 0
+    from sqlalchemy import text
+    try:
+        with _get_engine().begin() as conn:
+            conn.execute(text(_FLUSH_STATS), [{"key": k, "hits": n} for k, n in asked.items()])
+    except Exception as e:
+        print(f"[ANSWER STORE] could not save query counts: {e}")
+        with _stats_lock:  # keep them for the next flush
+            _asked.update(asked)
+        return 0
+    return len(asked)
+
+
+def stats() -> Dict:
+    with _stats_lock:
+        out = dict(_stats)
+        out["pending_query_counts"] = len(_asked)
+    n = out["hits"] + out["misses"] + out["stale"]
+    out["hit_rate"] = out["hits"] / n if n else None
+    return out
+
+
+# ---------------- store ----------------
+def _save(question: str, answer: str, sources: List[Dict], ids: List[int], hashes: List[str],
+          origin: str) -> None:
+    from sqlalchemy import text
+    with _get_engine().begin() as conn:
+        conn.execute(text(_UPSERT), {
+            "key": normalize(question), "question": question, "answer": answer,
+            "sources": json.dumps(sources, ensure_ascii=False), "ids": ids, "hashes": hashes,
+            "model": MODEL_NAME, "origin": origin,
+        })
+
+
+def _relink(question: str, ids: List[int]) -> None:
+    from sqlalchemy import text
+    with _get_engine().begin() as conn:
+        conn.execute(text("UPDATE kb_answers SET chunk_ids = :ids WHERE query_key = :key"),
+                     {"ids": ids, "key": normalize(question)})
+
+
+def _delete(question: str) -> None:
+    from sqlalchemy import text
+    with _get_engine().begin() as conn:
+        conn.execute(text("DELETE FROM kb_answers WHERE query_key = :key"), {"key": normalize(question)})
+
+
+def faq_questions(path: str = FAQ_CSV_PATH) -> List[str]:
+    if not os.path.isfile(path):
+        return []
+    with open(path, newline="", encoding="utf-8") as f:
+        reader = csv.DictReader(f)
+        col = next((c for c in reader.fieldnames or [] if c.lower().strip() == "question"), None)
+        return [row[col].strip() for row in reader if col and (row[col] or "").strip()]
+
+
+def popular_questions(top: int = WARM_TOP, min_hits: int = WARM_MIN_HITS) -> List[str]:
+    """The most asked normalized questions; the key itself is what gets generated."""
+    from sqlalchemy import text
+    with _get_engine().connect() as conn:
+        return list(conn.execute(text(
+            "SELECT query_key FROM kb_query_stats WHERE hits >= :min ORDER BY hits DESC LIMIT :top"),
+            {"min": min_hits, "top": top}).scalars())
+
+
+# ---------------- warming job ----------------
+def _in_window(spec: str, hour: int) -> bool:
+    start, _, end = spec.partition("-")
+    start = int(start)
+    end = int(end) if end else start + 1
+    return start <= hour < end if start < end else hour >= start or hour < end
+
+
+class Warmer:
+    """
+    Runs the RAG pipeline offline for known questions and keeps the store current.
+    `retrieve(question)` returns the rows chat() would send to the LLM;
+    `answer(question, rows)` returns (text or None, source dicts) and must raise
+    rather than return a degraded answer. `busy()` is the number of interactive
+    requests in flight; each question waits (up to ANSWER_WARM_YIELD_MAX) for it to be 0.
+    """
+
+    def __init__(self, retrieve: Callable, answer: Callable, busy: Optional[Callable[[], int]] = None,
+                 concurrency: int = WARM_CONCURRENCY):
+        self.retrieve = retrieve
+        self.answer = answer
+        self.busy = busy
+        self.concurrency = concurrency
+        self.last: Dict[str, Dict] = {}   # kind -> result of the latest run
+        self.running: Optional[str] = None
+        self.refresh_pending = False      # a refresh was asked for while it could not run
+        self._run_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._warmed_on: Optional[str] = None
+
+    def _yield(self) -> None:
+        deadline = time.monotonic() + WARM_YIELD_MAX
+        while self.busy is not None and self.busy() > 0 and time.monotonic() < deadline:
+            time.sleep(0.05)
+
+    def _one(self, question: str, origin: str, known_hashes: Optional[List[str]] = None) -> str:
+        self._yield()
+        rows = self.retrieve(question)
+        ids, hashes = chunk_deps(rows)
+        if known_hashes is not None and hashes == known_hashes:
+            _relink(question, ids)  # same content under new ids: the answer still holds
+            return "relinked"
+        output, sources = self.answer(question, rows) if rows else (None, [])
+        if not output:
+            if known_hashes is not None:
+                _delete(question)
+            return "no_answer"
+        _save(question, output, sources, ids, hashes, origin)
+        return "generated"
+
+    def _run_all(self, items: List[Tuple]) -> Dict:
+        counts: Counter = Counter()
+
+        def work(item):
+            try:
+                return self._one(*item)
+            except Exception as e:
+                print(f"[ANSWER STORE] '{item[0][:60]}' failed: {e}")
+                return "failed"
+
+        with ThreadPoolExecutor(max_workers=max(1, self.concurrency)) as pool:
+            for outcome in pool.map(work, items):
+                counts[outcome] += 1
+        return dict(counts)
+
+    def warm(self) -> Dict:
+        """Generate the FAQ and popular questions that have no entry for the current model."""
+        from sqlalchemy import text
+        with _get_engine().begin() as conn:
+            pruned = conn.execute(text(_PRUNE_STATS), {"days": QUERY_STATS_DAYS}).rowcount
+            have = set(conn.execute(text("SELECT query_key FROM kb_answers WHERE model = :model"),
+                                    {"model": MODEL_NAME}).scalars())
+        todo: Dict[str, Tuple] = {}
+        for origin, questions in (("faq", faq_questions()), ("popular", popular_questions())):
+            for q in questions:
+                key = normalize(q)
+                if key and key not in have and key not in todo:
+                    todo[key] = (q, origin)
+        result = self._run_all(list(todo.values()))
+        result["candidates"] = len(todo) + len(have)
+        result["query_stats_pruned"] = pruned
+        return result
+
+    def refresh(self) -> Dict:
+        """Re-check the entries whose source chunks changed since they were generated."""
+        from sqlalchemy import text
+        self.refresh_pending = False  # chunks published from here on are seen by the next refresh
+        with _get_engine().connect() as conn:
+            stale = conn.execute(text(_STALE)).all()
+        result = self._run_all([(r.question, r.origin or "faq", list(r.chunk_hashes)) for r in stale])
+        result["stale"] = len(stale)
+        return result
+
+    def run(self, kind: str) -> Dict:
+        """
+        One warm/refresh at a time per process, and across processes via an advisory lock.
+        A refresh that finds either taken is not lost: it is marked pending and runs after
+        the current run here, or on a later background tick when another process holds the lock.
+        """
+        if kind not in ("warm", "refresh"):
+            raise ValueError("kind must be 'warm' or 'refresh'")
+        if not DB_URL:
+            raise RuntimeError("RAG_DB_URL not set")
+        if not self._run_lock.acquire(blocking=False):
+            if kind == "refresh":
+                self.refresh_pending = True
+                return {"pending": "refresh"}
+            raise RuntimeError(f"answer store {self.running} already running")
+        from sqlalchemy import text
+        t0 = time.time()
+        init()  # already done at server start; needed from the command line
+        self.running = kind
+        ran = False
+        try:
+            with _get_engine().connect().execution_options(isolation_level="AUTOCOMMIT") as lock_conn:
+                if not lock_conn.execute(text("SELECT pg_try_advisory_lock(:id)"), {"id": _LOCK_ID}).scalar():
+                    if kind == "refresh":
+                        self.refresh_pending = True
+                    result = {"skipped": "running in another process", "pending": self.refresh_pending}
+                else:
+                    ran = True
+                    try:
+                        result = self.warm() if kind == "warm" else self.refresh()
+                    finally:
+                        lock_conn.execute(text("SELECT pg_advisory_unlock(:id)"), {"id": _LOCK_ID})
+        finally:
+            self.running = None
+            self._run_lock.release()
+        result.update(started=t0, seconds=round(time.time() - t0, 1))
+        self.last[kind] = result
+        print(f"[ANSWER STORE] {kind}: {result}")
+        if ran and self.refresh_pending and not self._stop.is_set():
+            self.run_async("refresh")
+        return result
+
+    def run_async(self, kind: str) -> threading.Thread:
+        def _run():
+            try:
+                self.run(kind)
+            except Exception as e:
+                print(f"[ANSWER STORE] {kind} failed: {e}")
+
+        t = threading.Thread(target=_run, name=f"answer-{kind}", daemon=True)
+        t.start()
+        return t
+
+    # background: flush query counts, retry a pending refresh, warm once a day inside ANSWER_WARM_HOURS
+    def _loop(self) -> None:
+        while not self._stop.wait(STATS_FLUSH_SECONDS):
+            if not _ready:
+                self._init()
+            flush_stats()
+            if self.refresh_pending and self.running is None:
+                self.run_async("refresh")
+            today = time.strftime("%Y-%m-%d")
+            if WARM_HOURS and self._warmed_on != today and _in_window(WARM_HOURS, time.localtime().tm_hour):
+                self._warmed_on = today
+                self.run_async("warm")
+
+    def _init(self) -> None:
+        try:
+            init()
+        except Exception as e:  # lookups stay off until the background loop gets the tables in
+            print(f"[ANSWER STORE] could not create tables: {e}")
+
+    def start(self) -> None:
+        if not (ANSWER_STORE and DB_URL) or self._thread is not None:
+            return
+        self._init()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="answer-store", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+        if ANSWER_STORE and DB_URL:
+            flush_stats()
+
+    def status(self) -> Dict:
+        return {"enabled": ANSWER_STORE, "ready": _ready, "query_stats": QUERY_STATS,
+                "model": MODEL_NAME, "running": self.running,
+                "refresh_pending": self.refresh_pending,
+                "warm_hours": WARM_HOURS or None, "last": self.last, **stats()}
+
+
+if __name__ == "__main__":
+    import sys
+    if len(sys.argv) != 2 or sys.argv[1] not in ("warm", "refresh"):
+        sys.exit("usage: python -m LLM_Bridge.answer_store warm|refresh")
+    from .server import warmer  # the same retrieval and generation as /api/chat
+    print(json.dumps(warmer.run(sys.argv[1]), indent=2))
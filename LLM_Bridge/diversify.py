@@ -0,0 +1,98 @@
+# LLM_Bridge/diversify.py
+# Post-retrieval stage: pick fewer, less redundant snippets before they reach the LLM.
+#   1) adaptive k  - a clear winner (big score gap) sends 1-2 snippets, a flat score
+#                    distribution sends up to max_k
+#   2) MMR         - among those, prefer chunks that add new information over
+#                    near-duplicates (same URL, overlapping chunk windows)
+import os
+import threading
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+MMR_LAMBDA = float(os.getenv("KB_MMR_LAMBDA", "0.7"))       # 1.0 = relevance only
+MIN_K = int(os.getenv("KB_MIN_K", "1"))
+CLEAR_GAP = float(os.getenv("KB_CLEAR_GAP", "0.08"))         # top1 - top2 score gap
+SCORE_WINDOW = float(os.getenv("KB_SCORE_WINDOW", "0.10"))   # keep scores within top1 - window
+DUP_SIM = float(os.getenv("KB_DUP_SIM", "0.97"))             # never send two chunks this similar
+
+_stats_lock = threading.Lock()
+_stats = {"queries": 0, "rows_fetched": 0, "snippets_sent": 0}
+
+
+def adaptive_k(scores: Sequence[float], max_k: int, min_k: int = MIN_K,
+               clear_gap: float = CLEAR_GAP, window: float = SCORE_WINDOW) -> int:
+    """How many results the score distribution justifies sending."""
+    n = min(len(scores), max_k)
+    if n <= min_k:
+        return n
+    top = scores[0]
+    if top - scores[1] >= clear_gap:
+        return max(min_k, 1)
+    k = sum(1 for s in scores[:n] if s >= top - window)
+    return max(min_k, min(n, k))
+
+
+def mmr_select(query_vec: np.ndarray, doc_vecs: np.ndarray, k: int,
+               lambda_: float = MMR_LAMBDA, dup_sim: float = DUP_SIM,
+               relevance: Optional[np.ndarray] = None) -> List[int]:
+    """
+    Greedy maximal marginal relevance over cosine similarity. The similarity
+    matrices are computed once; each step is a vectorized max over the picks so far.
+    Candidates at least dup_sim similar to a pick are skipped, so fewer than k
+    indices come back when the rest are near-duplicates. `relevance` overrides the
+    query cosine (e.g. scores already computed by the database).
+    """
+    n = len(doc_vecs)
+    if n == 0 or k <= 0:
+        return []
+    docs = doc_vecs / (np.linalg.norm(doc_vecs, axis=1, keepdims=True) + 1e-12)
+    q = query_vec / (np.linalg.norm(query_vec) + 1e-12)
+    rel = docs @ q if relevance is None else np.asarray(relevance, dtype="float32")
+    sim = docs @ docs.T
+
+    picked = [int(np.argmax(rel))]
+    redundancy = sim[picked[0]].copy()  # max similarity of each doc to anything picked
+    available = np.ones(n, dtype=bool)
+    available[picked[0]] = False
+    while len(picked) < min(k, n):
+        score = lambda_ * rel - (1 - lambda_) * redundancy
+        score[~available | (redundancy >= dup_sim)] = -np.inf
+        i = int(np.argmax(score))
+        if score[i] == -np.inf:
+            break
+        picked.append(i)
+        available[i] = False
+        np.maximum(redundancy, sim[i], out=redundancy)
+    return picked
+
+
+def diversify(query_vec: Sequence[float], rows: Sequence[Dict], max_k: int) -> List[Dict]:
+    """
+    rows: retrieval results ordered by score, each carrying its `embedding`.
+    Returns at most max_k rows (embedding dropped), still ordered by score.
+    """
+    if not rows:
+        return []
+    scores = [float(r.get("score") or 0.0) for r in rows]
+    k = adaptive_k(scores, max_k)
+    # MMR may swap a near-duplicate for a slightly less relevant chunk, but never
+    # for one far below the top score
+    pool = max(k, sum(1 for s in scores if s >= scores[0] - 2 * SCORE_WINDOW))
+    vecs = np.asarray([r["embedding"] for r in rows[:pool]], dtype="float32")
+    picked = sorted(mmr_select(np.asarray(query_vec, dtype="float32"), vecs, k,
+                               relevance=np.asarray(scores[:pool])))
+    out = [{c: v for c, v in dict(rows[i]).items() if c != "embedding"} for i in picked]
+    with _stats_lock:
+        _stats["queries"] += 1
+        _stats["rows_fetched"] += len(rows)
+        _stats["snippets_sent"] += len(out)
+    return out
+
+
+def stats() -> Dict:
+    with _stats_lock:
+        s = dict(_stats)
+    s["avg_snippets_sent"] = s["snippets_sent"] / (s["queries"] or 1)
+    s["avg_rows_fetched"] = s["rows_fetched"] / (s["queries"] or 1)
+    return s
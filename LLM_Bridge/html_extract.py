@@ -0,0 +1,183 @@
+# LLM_Bridge/html_extract.py
+# One-pass page extraction (title, readable text, links, chunks) for the crawlers,
+# optionally on a process pool so parsing uses every core instead of one.
+#
+#   EXTRACT_PROCS=0   extract in the calling thread (default)
+#   EXTRACT_PROCS=N   ship the raw HTML bytes to N worker processes
+#   EXTRACT_FAST=true lxml-only extractor instead of BeautifulSoup (same rules:
+#                     drop script/style/noscript, keep <main>, else <article>, else <body>)
+#
+# Benchmark against the ingest.py functions on a folder of saved pages:
+#   python -m LLM_Bridge.html_extract bench LLM_Bridge/html_fixtures [--procs 4]
+# html_fixtures/ holds a few small pages (nav-heavy, <article> only, no <main>, a
+# latin-1 page, script-heavy) for a quick run; save real pages for real numbers.
+import os
+import re
+import sys
+import importlib
+import time
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Tuple, Union
+from urllib.parse import urljoin
+
+EXTRACT_PROCS = int(os.getenv("EXTRACT_PROCS", "0"))
+EXTRACT_FAST = os.getenv("EXTRACT_FAST", "false").lower() == "true"
+CHUNK_SIZE = int(os.getenv("CHUNK_SIZE", "800"))
+CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", "120"))
+
+Html = Union[str, bytes]
+_DROP = ("script", "style", "noscript")
+
+
+def chunk_text(text: str, size: int = CHUNK_SIZE, overlap: int = CHUNK_OVERLAP) -> List[str]:
+    text = re.sub(r"\s+", " ", text).strip()
+    out, i = [], 0
+    while i < len(text):
+        out.append(text[i:i + size])
+        i += max(1, size - overlap)
+    return out
+
+
+def _same_prefix_links(hrefs, base: str) -> List[str]:
+    """Absolute, anchor-free links under `base` (what ingest.extract_links keeps)."""
+    links = set()
+    for href in hrefs:
+        if href.startswith("#"):  # same-page anchor
+            continue
+        absolute = urljoin(base, href)
+        if absolute.startswith(base):
+            links.add(absolute.split("#")[0])
+    return sorted(links)
+
+
+def _extract_bs4(html: Html, url: str) -> Tuple[str, str, List[str]]:
+    from bs4 import BeautifulSoup
+    soup = BeautifulSoup(html, "lxml")  # parsed once for links and text
+    title = (soup.title.string.strip() if soup.title and soup.title.string else "")
+    links = _same_prefix_links((a["href"] for a in soup.select("a[href]")), url)
+    for tag in soup(list(_DROP)):
+        tag.decompose()
+    main = soup.select_one("main") or soup.select_one("article") or soup.body
+    text = main.get_text(separator=" ", strip=True) if main else soup.get_text(separator=" ", strip=True)
+    return title, text, links
+
+
+def _extract_lxml(html: Html, url: str) -> Tuple[str, str, List[str]]:
+    from lxml import etree, html as lxml_html
+    if isinstance(html, str):
+        html = html.encode("utf-8")  # str input with an XML encoding declaration is rejected
+    try:
+        doc = lxml_html.document_fromstring(html)
+    except (etree.ParserError, ValueError):  # empty or whitespace-only document
+        return "", "", []
+    title_el = doc.find(".//title")
+    title = title_el.text.strip() if title_el is not None and title_el.text else ""
+    links = _same_prefix_links(doc.xpath("//a/@href"), url)
+    etree.strip_elements(doc, etree.Comment, *_DROP, with_tail=False)
+    main = doc.find(".//main")
+    if main is None:
+        main = doc.find(".//article")
+    if main is None:
+        main = doc.find(".//body")
+    if main is None:
+        main = doc
+    text = " ".join(s.strip() for s in main.itertext() if s.strip())
+    return title, text, links
+
+
+def extract_page(html: Html, url: str, fast: bool = EXTRACT_FAST,
+                 size: int = CHUNK_SIZE, overlap: int = CHUNK_OVERLAP) -> Dict:
+    """Title, readable text, same-prefix links and text chunks of one page."""
+    title, text, links = (_extract_lxml if fast else _extract_bs4)(html, url)
+    return {"title": title, "text": text, "links": links,
+            "chunks": chunk_text(text, size, overlap) if text else []}
+
+
+class Extractor:
+    """extract_page() inline (procs=0) or on a lazily started process pool."""
+
+    def __init__(self, procs: int = EXTRACT_PROCS, fast: bool = EXTRACT_FAST):
+        self.procs = procs
+        self.fast = fast
+        self._pool = None
+        self._lock = threading.Lock()
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                # spawn: the crawlers call this from fetch threads, and forking a threaded process is unsafe
+                self._pool = ProcessPoolExecutor(max_workers=self.procs,
+                                                 mp_context=multiprocessing.get_context("spawn"))
+            return self._pool
+
+    def extract(self, html: Html, url: str, size: int = CHUNK_SIZE, overlap: int = CHUNK_OVERLAP) -> Dict:
+        if self.procs <= 0:
+            return extract_page(html, url, self.fast, size, overlap)
+        return self._get_pool().submit(extract_page, html, url, self.fast, size, overlap).result()
+
+    def shutdown(self) -> None:
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown()
+                self._pool = None
+
+
+_extractor = None
+
+
+def get_extractor() -> Extractor:
+    global _extractor
+    if _extractor is None:
+        _extractor = Extractor()
+    return _extractor
+
+
+# ---------------- benchmark ----------------
+def _legacy(html: str, url: str) -> Dict:
+    """The ingest.py path: two BeautifulSoup parses, then chunking."""
+    from . import ingest
+    title, text = ingest.extract_readable_content(html)
+    links = ingest.extract_links(html, url)
+    return {"title": title, "text": text, "links": links, "chunks": ingest.chunk_text(text) if text else []}
+
+
+def _bench(folder: str, procs: int) -> None:
+    files = sorted(os.path.join(folder, f) for f in os.listdir(folder) if f.endswith((".html", ".htm")))
+    if not files:
+        sys.exit(f"no .html files in {folder}")
+    pages = []
+    for path in files:
+        with open(path, "rb") as f:
+            pages.append((f.read(), "https://example.com/" + os.path.basename(path)))
+    mb = sum(len(b) for b, _ in pages) / 1e6
+    print(f"{len(pages)} pages, {mb:.1f} MB, {procs} procs")
+    importlib.import_module(f"{__package__}.ingest")  # _legacy's import, kept out of the timing
+
+    def run(name, fn, n_procs):
+        t0 = time.perf_counter()
+        results = fn()
+        dt = time.perf_counter() - t0
+        rate = len(pages) / dt
+        print(f"  {name:<22} {rate:8.1f} pages/s  {rate / n_procs:8.1f} pages/s/core")
+        return results
+
+    base = run("ingest.py (bs4 x2)", lambda: [_legacy(b.decode("utf-8", "replace"), u) for b, u in pages], 1)
+    for fast in (False, True):
+        label = "lxml" if fast else "bs4"
+        one = run(f"{label} one-pass", lambda: [extract_page(b, u, fast) for b, u in pages], 1)
+        with ProcessPoolExecutor(max_workers=procs, mp_context=multiprocessing.get_context("spawn")) as pool:
+            # start the workers and import the parsers outside the timing
+            list(pool.map(extract_page, [pages[0][0]] * procs, [pages[0][1]] * procs))
+            run(f"{label} x{procs} procs",
+                lambda: list(pool.map(extract_page, *zip(*pages), [fast] * len(pages), chunksize=4)), procs)
+        same = sum(a["chunks"] == b["chunks"] and a["links"] == b["links"] for a, b in zip(base, one))
+        print(f"    identical to ingest.py output: {same}/{len(pages)}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3 or sys.argv[1] != "bench":
+        sys.exit("usage: python -m LLM_Bridge.html_extract bench <folder> [--procs N]")
+    n = int(sys.argv[sys.argv.index("--procs") + 1]) if "--procs" in sys.argv else (os.cpu_count() or 1)
+    _bench(sys.argv[2], n)
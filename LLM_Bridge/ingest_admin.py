@@ -0,0 +1,307 @@
+# LLM_Bridge/ingest_admin.py
+# Background ingestion for the admin API in server.py.
+#
+# Jobs (CSV upload, sitemap, crawl) run in a separate process pool at a lower OS
+# priority (INGEST_NICE) and write embedded chunks to kb_chunks_staging, tagged with
+# the job id. Embedding requests from ingestion wait while chat requests are in
+# flight (up to INGEST_YIELD_MAX seconds per call), so interactive traffic gets
+# Ollama first. When a job finishes, one transaction swaps its chunks into
+# kb_chunks - readers see either the old or the new set, never half of it - and the
+# registered publish hooks refresh in-process caches.
+import os
+import time
+import uuid
+import threading
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional
+
+DB_URL = os.getenv("RAG_DB_URL")
+EMBED_MODEL = os.getenv("EMBED_MODEL", "nomic-embed-text")
+INGEST_PROCS = int(os.getenv("INGEST_PROCS", "1"))              # concurrent jobs
+INGEST_NICE = int(os.getenv("INGEST_NICE", "10"))               # added to worker niceness
+INGEST_YIELD_MAX = float(os.getenv("INGEST_YIELD_MAX", "2.0"))  # max wait per embedding call
+INGEST_UPLOAD_DIR = os.getenv("INGEST_UPLOAD_DIR", os.path.join(os.path.dirname(__file__), "uploads"))
+
+STAGING_DDL = """
+CREATE TABLE IF NOT EXISTS kb_chunks_staging (
+  job_id TEXT NOT NULL,
+  source_type TEXT NOT NULL,
+  url TEXT,
+  title TEXT,
+  section_anchor TEXT,
+  content TEXT NOT NULL,
+  embedding VECTOR(768)
+);
+CREATE INDEX IF NOT EXISTS idx_kb_staging_job ON kb_chunks_staging (job_id);
+"""
+# publish dedupes on this index ("Add a content hash and a unique index.sql"); kb_chunks
+# tables created by ingest.py / ingest_sitemap.py don't have it, so apply it idempotently.
+# Rows inserted later by those scripts get their hash on the next check.
+CONTENT_HASH_DDL = """
+ALTER TABLE kb_chunks ADD COLUMN IF NOT EXISTS content_hash TEXT;
+UPDATE kb_chunks SET content_hash = md5(content) WHERE content_hash IS NULL;
+CREATE UNIQUE INDEX IF NOT EXISTS uq_kb_unique ON kb_chunks (source_type, COALESCE(url,''), content_hash);
+"""
+_SCHEMA_LOCK_ID = 0x6b625f736368  # pg advisory lock: one schema check at a time across workers
+
+# Replace what the job re-ingested: every row of the CSV source, or the pages it fetched
+_PUBLISH_DELETE = {
+    "csv": "DELETE FROM kb_chunks WHERE source_type = 'csv'",
+    "pages": """
+        DELETE FROM kb_chunks k
+        USING (SELECT DISTINCT source_type, url FROM kb_chunks_staging WHERE job_id = :job) s
+        WHERE k.source_type = s.source_type AND k.url = s.url
+    """,
+}
+_PUBLISH_INSERT = """
+    INSERT INTO kb_chunks (source_type, url, title, section_anchor, content, embedding, content_hash)
+    SELECT source_type, url, title, section_anchor, content, embedding, md5(content)
+    FROM kb_chunks_staging WHERE job_id = :job
+    ON CONFLICT (source_type, COALESCE(url,''), content_hash) DO NOTHING
+"""
+
+# ---------------- schema ----------------
+_ready = False   # schema checked in this process
+
+
+def ensure_schema() -> None:
+    """Staging table and the content_hash column + unique index publish needs; raises RuntimeError."""
+    global _ready
+    if _ready:
+        return
+    from sqlalchemy import text
+    from . import retrieval_db
+    try:
+        with retrieval_db.get_write_engine().begin() as conn:
+            conn.execute(text("SELECT pg_advisory_xact_lock(:id)"), {"id": _SCHEMA_LOCK_ID})
+            conn.execute(text(STAGING_DDL))
+            conn.execute(text(CONTENT_HASH_DDL))
+    except Exception as e:
+        raise RuntimeError(f"kb_chunks is not ready for ingestion jobs ({e}); if duplicate rows block "
+                           f"the unique index, see db_management_instructions.md") from e
+    _ready = True
+
+
+# ---------------- worker process side ----------------
+_busy = None     # multiprocessing.Value: chat requests in flight in the server
+
+
+def _init_worker(busy) -> None:
+    global _busy
+    _busy = busy
+    try:
+        os.nice(INGEST_NICE)
+    except (AttributeError, OSError):
+        pass
+    from .ollama_router import get_router
+    get_router().gate = _yield_to_chat
+
+
+def _yield_to_chat() -> None:
+    deadline = time.monotonic() + INGEST_YIELD_MAX
+    while _busy is not None and _busy.value > 0 and time.monotonic() < deadline:
+        time.sleep(0.05)
+
+
+def _get_engine():
+    from . import retrieval_db
+    return retrieval_db.get_write_engine()  # schema checked by submit() before the job was queued
+
+
+def _stager(job_id: str) -> Callable[[Dict], None]:
+    from sqlalchemy import text
+    from .ollama_router import routed_embeddings
+
+    emb = routed_embeddings(EMBED_MODEL)
+    engine = _get_engine()
+
+    def stage(row: Dict) -> None:
+        vec = emb.embed_query(row["content"])
+        with engine.begin() as conn:
+            conn.execute(text("""
+                INSERT INTO kb_chunks_staging (job_id, source_type, url, title, section_anchor, content, embedding)
+                VALUES (:job_id, :source_type, :url, :title, :section_anchor, :content, :embedding)
+            """), {**row, "job_id": job_id, "embedding": vec})
+
+    return stage
+
+
+def _publish(job_id: str, scope: str) -> int:
+    from sqlalchemy import text
+    with _get_engine().begin() as conn:
+        conn.execute(text(_PUBLISH_DELETE[scope]), {"job": job_id})
+        n = conn.execute(text(_PUBLISH_INSERT), {"job": job_id}).rowcount
+        conn.execute(text("DELETE FROM kb_chunks_staging WHERE job_id = :job"), {"job": job_id})
+    return n
+
+
+def _discard(job_id: str) -> None:
+    from sqlalchemy import text
+    try:
+        with _get_engine().begin() as conn:
+            conn.execute(text("DELETE FROM kb_chunks_staging WHERE job_id = :job"), {"job": job_id})
+    except Exception as e:
+        print(f"[INGEST JOB] could not clear staging for {job_id}: {e}")
+
+
+def _run_job(job_id: str, kind: str, params: Dict) -> Dict:
+    """Runs in a pool process: ingest into staging, then publish atomically."""
+    checkpoint = f"admin-{job_id}"
+    try:
+        stage = _stager(job_id)
+        if kind == "csv":
+            from .ingest_csv_to_kb import ingest_csv
+            stats = {"chunks": ingest_csv(params["path"], store=stage)}
+            scope = "csv"
+        elif kind == "sitemap":
+            from . import ingest_sitemap
+            workers = int(params.get("workers") or 1)
+            urls = (ingest_sitemap.parse_sitemap_parallel(params["url"]) if workers > 1
+                    else ingest_sitemap.parse_sitemap(params["url"]))
+            stats = ingest_sitemap.ingest_pages(urls, job=checkpoint, workers=workers, store=stage)
+            scope = "pages"
+        elif kind == "crawl":
+            from .ingest import crawl_site
+            stats = crawl_site(params["seeds"], max_pages=int(params.get("max_pages") or 100),
+                               job=checkpoint, store=stage)
+            scope = "pages"
+        else:
+            raise ValueError(f"unknown ingestion job kind '{kind}'")
+        stats = dict(stats or {})
+        stats["published"] = _publish(job_id, scope)
+    except BaseException:
+        _discard(job_id)
+        raise
+    finally:
+        # each admin job has its own checkpoint name, so nothing will ever resume it;
+        # the page counts live on in the job result
+        from .ingest_jobs import remove_checkpoint
+        remove_checkpoint(checkpoint)
+    return stats
+
+
+# ---------------- server side ----------------
+class IngestManager:
+    """Submits jobs to the pool, tracks their status and runs publish hooks."""
+
+    def __init__(self, procs: int = INGEST_PROCS):
+        self.procs = procs
+        self._ctx = multiprocessing.get_context("spawn")  # no fork of a threaded server
+        self.busy = self._ctx.Value("i", 0)
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._jobs: Dict[str, Dict] = {}
+        self._hooks: List[Callable[[Dict], None]] = []
+        self._lock = threading.Lock()
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=self.procs, mp_context=self._ctx,
+                                                 initializer=_init_worker, initargs=(self.busy,))
+            return self._pool
+
+    @contextmanager
+    def serving(self) -> Iterator[None]:
+        """Mark an interactive request in flight; ingestion embeddings hold back meanwhile."""
+        with self.busy.get_lock():
+            self.busy.value += 1
+        try:
+            yield
+        finally:
+            with self.busy.get_lock():
+                self.busy.value -= 1
+
+    def on_publish(self, hook: Callable[[Dict], None]) -> None:
+        self._hooks.append(hook)
+
+    def submit(self, kind: str, params: Dict) -> Dict:
+        if not DB_URL:
+            raise RuntimeError("RAG_DB_URL not set")
+        ensure_schema()
+        job_id = time.strftime("%Y%m%d%H%M%S") + "-" + uuid.uuid4().hex[:6]
+        job = {"id": job_id, "kind": kind, "params": params, "status": "queued",
+               "submitted": time.time(), "finished": None, "result": None, "error": None, "future": None}
+        with self._lock:
+            self._jobs[job_id] = job
+        job["future"] = future = self._get_pool().submit(_run_job, job_id, kind, params)
+        future.add_done_callback(lambda f: self._finished(job_id, f))
+        return self.status(job_id)
+
+    def _finished(self, job_id: str, future: Future) -> None:
+        job = self._jobs[job_id]
+        try:
+            job["result"] = future.result()
+            job["status"] = "done"
+        except Exception as e:
+            job["status"], job["error"] = "failed", str(e)
+            print(f"[INGEST JOB] {job_id} failed: {e}")
+            if isinstance(e, BrokenProcessPool):
+                # a worker died (OOM kill, segfault); start a fresh pool for the next job
+                with self._lock:
+                    self._pool = None
+        job["finished"] = time.time()
+        if job["status"] == "done":
+            for hook in self._hooks:
+                try:
+                    hook(dict(job))
+                except Exception as e:
+                    print(f"[INGEST JOB] publish hook failed: {e}")
+
+    def _progress(self, job: Dict) -> Dict:
+        """Chunks staged so far, plus page counts from the job's checkpoint file."""
+        progress: Dict = {}
+        if job["kind"] != "csv":
+            from .ingest_jobs import load_state
+            name = f"admin-{job['id']}"
+            try:
+                state = load_state(name) or load_state(f"{name}.done")
+            except (OSError, ValueError, KeyError):
+                state = None  # mid-compaction; next poll will read it
+            if state is not None:
+                progress.update(pages_done=len(state["done"]), pages_queued=len(state["frontier"]),
+                                pages_failed=len(state["dead"]))
+        if job["status"] in ("queued", "running"):
+            try:
+                from sqlalchemy import text
+                from . import retrieval_db
+                with retrieval_db.read_connection() as conn:
+                    progress["chunks_staged"] = conn.execute(
+                        text("SELECT count(*) FROM kb_chunks_staging WHERE job_id = :job"),
+                        {"job": job["id"]}).scalar()
+            except Exception:
+                pass  # staging table not created yet
+        return progress
+
+    def status(self, job_id: str) -> Optional[Dict]:
+        job = self._jobs.get(job_id)
+        if job is None:
+            return None
+        out = {k: v for k, v in job.items() if k not in ("params", "future")}
+        if out["status"] == "queued" and job["future"].running():
+            out["status"] = "running"
+        out["progress"] = self._progress(out)
+        return out
+
+    def list(self) -> List[Dict]:
+        return [self.status(j) for j in sorted(self._jobs, reverse=True)]
+
+    def shutdown(self) -> None:
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
+
+
+manager = IngestManager()
+
+
+def save_upload(data: bytes, filename: str) -> str:
+    os.makedirs(INGEST_UPLOAD_DIR, exist_ok=True)
+    base = os.path.basename(filename or "upload.csv")
+    path = os.path.join(INGEST_UPLOAD_DIR, f"{time.strftime('%Y%m%d%H%M%S')}-{uuid.uuid4().hex[:6]}-{base}")
+    with open(path, "wb") as f:
+        f.write(data)
+    return path
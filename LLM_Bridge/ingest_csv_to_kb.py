@@ -3,7 +3,7 @@ import os
 import re
 import sys
 import pandas as pd
-from typing import Dict, List
+from typing import Callable, Dict, List
 
 from sqlalchemy import create_engine, text, event
 from sqlalchemy.engine import Engine
@@ -23,7 +23,10 @@ except Exception as e:
     print("ERROR: Python package 'pgvector' not installed. Run: pip install pgvector")
     raise
 
-from langchain_community.embeddings import OllamaEmbeddings
+try:
+    from .ollama_router import routed_embeddings
+except ImportError:  # run as a script: python LLM_Bridge/ingest_csv_to_kb.py
+    from ollama_router import routed_embeddings
 
 # --- Config ---
 DB_URL = os.getenv("RAG_DB_URL")  # must be set in environment or .env
@@ -48,7 +51,7 @@ def register_vector_on_connect(dbapi_connection, connection_record):
     except Exception:
         pass
 
-emb = OllamaEmbeddings(model=EMBED_MODEL)
+emb = routed_embeddings(EMBED_MODEL)  # OLLAMA_HOSTS / OLLAMA_HOST
 
 def ensure_table():
     with engine.begin() as conn:
@@ -90,7 +93,11 @@ def upsert_chunk(row: Dict):
             ON CONFLICT (source_type, COALESCE(url,''), content_hash) DO NOTHING
         """), row)
 
-def ingest_csv(csv_path: str) -> int:
+def embed_and_store(row: Dict):
+    # requires `ollama serve` and the embedding model pulled
+    upsert_chunk({**row, "embedding": emb.embed_query(row["content"])})
+
+def ingest_csv(csv_path: str, store: Callable[[Dict], None] = embed_and_store) -> int:
     if not os.path.isfile(csv_path):
         raise FileNotFoundError(f"CSV not found at {csv_path}")
 
@@ -115,14 +122,12 @@ def ingest_csv(csv_path: str) -> int:
 
         text_block = f"Q: {q}\nA: {a}"
         for chunk in chunk_text(text_block):
-            vec = emb.embed_query(chunk)  # requires `ollama serve` and the embedding model pulled
-            upsert_chunk({
+            store({
                 "source_type": "csv",
                 "url": None,               # no URL for CSV; can map to a doc later if you want
                 "title": "FAQ CSV",
                 "section_anchor": None,
                 "content": chunk,
-                "embedding": vec,
             })
             inserted += 1
 
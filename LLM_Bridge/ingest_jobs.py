@@ -0,0 +1,260 @@
+# LLM_Bridge/ingest_jobs.py
+# Checkpointed, resumable ingestion runner shared by ingest.py and ingest_sitemap.py.
+#
+# State per job under INGEST_CHECKPOINT_DIR:
+#   frontier  URLs still to fetch (crawl order)
+#   done      URLs fully embedded and stored
+#   pending   url -> chunk rows fetched but not yet stored
+#   dead      url -> last error, for pages that failed to fetch or parse
+# <name>.json is a snapshot; every change after it is appended to <name>.journal
+# (one small fsynced line per page or stored chunk), and the journal is folded into
+# a new snapshot every INGEST_COMPACT_EVERY entries and at the end of a run. So a
+# crash (Ollama or Postgres going away, Ctrl-C, OOM) resumes exactly where it
+# stopped without rewriting the whole state per chunk.
+#
+# A page that can't be fetched or parsed is dead-lettered. A chunk that can't be
+# stored (embedding or DB down) stops the run with StoreError and keeps its rows
+# pending for the next run: that failure is not the page's fault.
+#
+# The snapshot records a fingerprint of the seed URLs; a run started with different
+# seeds (another crawl start, a changed sitemap) sets the old checkpoint aside as
+# <name>.stale.json and starts fresh instead of resuming a different job.
+import os
+import json
+import time
+import hashlib
+import random
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+CHECKPOINT_DIR = os.getenv("INGEST_CHECKPOINT_DIR", os.path.join(os.path.dirname(__file__), "checkpoints"))
+MAX_RETRIES = int(os.getenv("INGEST_MAX_RETRIES", "5"))
+BACKOFF_BASE = float(os.getenv("INGEST_BACKOFF_BASE", "1.0"))   # seconds
+BACKOFF_MAX = float(os.getenv("INGEST_BACKOFF_MAX", "60"))
+COMPACT_EVERY = int(os.getenv("INGEST_COMPACT_EVERY", "1000"))  # journal entries per snapshot
+
+
+class PermanentError(Exception):
+    """A page that will never succeed (404, bad content); goes straight to the dead-letter list."""
+
+
+class StoreError(Exception):
+    """Storing a chunk kept failing after retries; the run stops and the rows stay pending."""
+
+
+def _replay(state: Dict, entry: Dict, taken: set) -> None:
+    op, url = entry["op"], entry.get("url")
+    if op == "page":      # fetched: rows pending, new links queued
+        taken.add(url)
+        state["pending"][url] = entry["rows"]
+        state["frontier"].extend(entry["links"])
+    elif op == "stored":  # first pending row of url stored
+        state["pending"][url].pop(0)
+    elif op == "done":
+        state["pending"].pop(url, None)
+        state["done"].append(url)
+    elif op == "dead":
+        taken.add(url)
+        state["pending"].pop(url, None)
+        state["dead"][url] = entry["error"]
+
+
+def load_state(name: str, checkpoint_dir: str = CHECKPOINT_DIR) -> Optional[Dict]:
+    """Snapshot plus journal of a job, or None when it has no checkpoint."""
+    path = os.path.join(checkpoint_dir, f"{name}.json")
+    if not os.path.isfile(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        state = json.load(f)
+    taken: set = set()
+    journal = os.path.join(checkpoint_dir, f"{name}.journal")
+    if os.path.isfile(journal):
+        with open(journal, "r", encoding="utf-8") as f:
+            for line in f:
+                if not line.endswith("\n"):
+                    break  # torn last write of a crash
+                _replay(state, json.loads(line), taken)
+    if taken:
+        state["frontier"] = [u for u in state["frontier"] if u not in taken]
+    return state
+
+
+def seeds_fingerprint(seeds: List[str]) -> str:
+    return hashlib.sha1("\n".join(sorted(set(seeds))).encode("utf-8")).hexdigest()
+
+
+def remove_checkpoint(name: str, checkpoint_dir: str = CHECKPOINT_DIR) -> None:
+    """Delete every file of a job's checkpoint (snapshot, journal, archived copy)."""
+    for suffix in (".json", ".journal", ".done.json", ".stale.json"):
+        try:
+            os.remove(os.path.join(checkpoint_dir, f"{name}{suffix}"))
+        except FileNotFoundError:
+            pass
+
+
+def retry(fn: Callable, *args, retries: int = MAX_RETRIES, what: str = ""):
+    """Call fn(*args), retrying transient failures with exponential backoff + jitter."""
+    attempt = 0
+    while True:
+        try:
+            return fn(*args)
+        except PermanentError:
+            raise
+        except Exception as e:
+            attempt += 1
+            if attempt > retries:
+                raise
+            delay = min(BACKOFF_MAX, BACKOFF_BASE * (2 ** (attempt - 1)))
+            delay += random.uniform(0, delay / 2)
+            print(f"[INGEST RETRY] {what} attempt {attempt}/{retries} failed: {e} (sleep {delay:.1f}s)")
+            time.sleep(delay)
+
+
+class IngestJob:
+    """
+    Runs prepare(url) -> (rows, links) and store(row) over a URL frontier with a
+    persistent checkpoint. Rows are chunk dicts without embeddings; store() embeds
+    and inserts one row. A finished job is archived as <name>.done.json so the next
+    run starts fresh; so does a run whose seeds differ from the checkpoint's.
+    """
+
+    def __init__(self, name: str, seeds: Optional[List[str]] = None, checkpoint_dir: str = CHECKPOINT_DIR):
+        self.name = name
+        self.path = os.path.join(checkpoint_dir, f"{name}.json")
+        self.journal_path = os.path.join(checkpoint_dir, f"{name}.journal")
+        self._journal = None
+        self._entries = 0
+        self.state = load_state(name, checkpoint_dir)
+        fingerprint = seeds_fingerprint(seeds or [])
+        if self.state is not None and self.state.get("seeds") != fingerprint:
+            print(f"[INGEST] job '{name}' was checkpointed with other seeds; starting fresh "
+                  f"(old checkpoint kept as {name}.stale.json)")
+            self.save(os.path.join(checkpoint_dir, f"{name}.stale.json"))
+            os.remove(self.path)
+            self.state = None
+        if self.state is None:
+            self.state = {"frontier": [], "done": [], "pending": {}, "dead": {}, "seeds": fingerprint}
+            self.add(seeds or [])
+            self.save()
+        else:
+            print(f"[INGEST] resuming job '{name}': {len(self.state['done'])} done, "
+                  f"{len(self.state['frontier'])} queued, {len(self.state['pending'])} partial")
+        self._seen = set(self.state["frontier"]) | set(self.state["done"]) | set(self.state["dead"]) | set(self.state["pending"])
+
+    # ---------- persistence ----------
+    def save(self, path: Optional[str] = None) -> None:
+        """Write a full snapshot (to `path`, default the job's) and start an empty journal."""
+        self._close_journal()
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(self.path), prefix=f".{self.name}.", suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(self.state, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path or self.path)
+        if os.path.exists(self.journal_path):
+            os.remove(self.journal_path)  # folded into the snapshot
+        self._entries = 0
+
+    def _log(self, entry: Dict) -> None:
+        """Apply one change to the state and append it to the journal."""
+        _replay(self.state, entry, set())
+        if self._journal is None:
+            self._journal = open(self.journal_path, "a", encoding="utf-8")
+        self._journal.write(json.dumps(entry) + "\n")
+        self._journal.flush()
+        os.fsync(self._journal.fileno())
+        self._entries += 1
+        if self._entries >= COMPACT_EVERY:
+            self.save()
+
+    def _close_journal(self) -> None:
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+
+    def _archive(self) -> None:
+        self.save()
+        os.replace(self.path, os.path.join(os.path.dirname(self.path), f"{self.name}.done.json"))
+
+    # ---------- frontier ----------
+    def add(self, urls: List[str]) -> None:
+        seen = getattr(self, "_seen", set())
+        for u in urls:
+            if u not in seen:
+                seen.add(u)
+                self.state["frontier"].append(u)
+        self._seen = seen
+
+    def _dead(self, url: str, err: Exception) -> None:
+        print(f"[INGEST DEAD] {url}: {err}")
+        self._log({"op": "dead", "url": url, "error": str(err)})
+
+    # ---------- run ----------
+    def _store_batch(self, url: str, store: Callable[[Dict], None]) -> None:
+        rows = self.state["pending"][url]
+        while rows:
+            try:
+                retry(store, rows[0], what=f"store {url}")
+            except Exception as e:
+                # Ollama/Postgres trouble, not the page's: keep the rows for the next run
+                raise StoreError(f"storing a chunk of {url} failed: {e}") from e
+            self._log({"op": "stored", "url": url})
+        self._log({"op": "done", "url": url})
+
+    def run(self,
+            prepare: Callable[[str], Tuple[List[Dict], List[str]]],
+            store: Callable[[Dict], None],
+            max_pages: Optional[int] = None,
+            workers: int = 1) -> Dict:
+        """
+        With workers > 1, prepare() (fetch + extract) runs ahead on the next
+        `workers` frontier URLs in a thread pool; results are still consumed and
+        stored in frontier order so the checkpoint stays exact.
+        max_pages bounds the pages fetched by this run; the rest stay queued for
+        the next one. Raises StoreError (checkpoint kept) when storing fails.
+        """
+        frontier = self.state["frontier"]
+        workers = max(1, workers)
+        inflight = {}
+        pages = 0
+        try:
+            # finish chunk batches interrupted by the previous run first
+            for url in list(self.state["pending"]):
+                self._store_batch(url, store)
+
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                try:
+                    while frontier:
+                        if max_pages is not None and pages >= max_pages:
+                            break
+                        for u in frontier[:workers]:
+                            if u not in inflight:
+                                inflight[u] = pool.submit(retry, prepare, u, what=f"fetch {u}")
+                        url = frontier[0]
+                        pages += 1
+                        try:
+                            rows, links = inflight.pop(url).result()
+                        except Exception as e:
+                            frontier.pop(0)
+                            self._dead(url, e)
+                            continue
+                        frontier.pop(0)
+                        new = [u for u in links if u not in self._seen]
+                        self._seen.update(new)
+                        self._log({"op": "page", "url": url, "rows": rows, "links": new})
+                        self._store_batch(url, store)
+                finally:
+                    for f in inflight.values():
+                        f.cancel()
+        finally:
+            self.save()
+
+        if not frontier and not self.state["pending"]:
+            self._archive()
+        return {
+            "done": len(self.state["done"]),
+            "queued": len(frontier),
+            "dead": len(self.state["dead"]),
+        }
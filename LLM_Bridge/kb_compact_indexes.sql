@@ -0,0 +1,32 @@
+-- Compact ANN indexes for kb_chunks (pgvector >= 0.7).
+-- The float32 `embedding` column stays the source of truth for exact re-ranking;
+-- these expression indexes are what server.py scans when KB_VECTOR_MODE is set.
+--
+-- The dimension is read from the column type (VECTOR(768) for EMBED_MODEL=nomic-embed-text).
+-- server.py casts with EMBED_DIM, which must be the same number or the planner will not
+-- use these indexes. After switching EMBED_MODEL, re-embed, drop both indexes and rerun.
+-- Check recall before switching: python LLM_Bridge/retrieval_loadtest.py --mode halfvec|binary
+DO $$
+DECLARE
+  dim int := (SELECT atttypmod FROM pg_attribute
+              WHERE attrelid = 'kb_chunks'::regclass AND attname = 'embedding');
+BEGIN
+  IF dim IS NULL OR dim <= 0 THEN
+    RAISE EXCEPTION 'kb_chunks.embedding has no fixed dimension; declare it as VECTOR(n)';
+  END IF;
+
+  -- KB_VECTOR_MODE=halfvec : 2 bytes/dim, ~half the index size, near-identical recall
+  EXECUTE format('CREATE INDEX IF NOT EXISTS idx_kb_embed_halfvec ON kb_chunks
+    USING hnsw ((embedding::halfvec(%s)) halfvec_cosine_ops)', dim);
+
+  -- KB_VECTOR_MODE=binary : 1 bit/dim, ~1/32 of float32; relies on re-ranking
+  -- (raise KB_RERANK_CANDIDATES if recall drops)
+  EXECUTE format('CREATE INDEX IF NOT EXISTS idx_kb_embed_binary ON kb_chunks
+    USING hnsw ((binary_quantize(embedding)::bit(%s)) bit_hamming_ops)', dim);
+
+  RAISE NOTICE 'compact indexes for % dimensions; EMBED_DIM must be %', dim, dim;
+END $$;
+
+-- Compare sizes against the full-precision index:
+-- SELECT indexrelname, pg_size_pretty(pg_relation_size(indexrelid))
+-- FROM pg_stat_user_indexes WHERE relname = 'kb_chunks';
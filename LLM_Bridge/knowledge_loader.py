@@ -1,15 +1,54 @@
 # LLM_Bridge/knowledge_loader.py
+# FAQ FAISS index. Recall / size / latency of the FAQ_INDEX_QUANT options:
+#   python -m LLM_Bridge.knowledge_loader bench [--csv faq.csv | --synthetic 20000] [--k 3]
 import os
+import sys
+import json
+import time
+import shutil
+import hashlib
+import tempfile
+import threading
+import faiss
+import numpy as np
 import pandas as pd
-from typing import Optional, Tuple, List
+from typing import Optional, Tuple, List, Dict
 
-from langchain_community.embeddings import OllamaEmbeddings
+from langchain_core.embeddings import Embeddings
 from langchain_community.vectorstores import FAISS
+from langchain_community.docstore.in_memory import InMemoryDocstore
 from langchain_core.documents import Document
 
+try:
+    from .ollama_router import routed_embeddings
+except ImportError:
+    from ollama_router import routed_embeddings
+
 DEFAULT_CSV = os.getenv("FAQ_CSV_PATH", os.path.join(os.path.dirname(__file__), "faq.csv"))
 EMBED_MODEL = os.getenv("EMBED_MODEL", "nomic-embed-text")
 INDEX_DIR = os.getenv("FAQ_INDEX_DIR", os.path.join(os.path.dirname(__file__), "faiss_index"))
+INDEX_KEEP = int(os.getenv("FAQ_INDEX_KEEP", "3"))  # snapshot versions kept on disk
+
+# Compact index: none (IndexFlatL2) | fp16 | sq8 (scalar quantized) | pq (product quantized).
+# Quantized indexes answer with FAQ_RERANK_FACTOR * k candidates, which search_faq()
+# re-ranks against a memory-mapped float32 copy of the vectors (vectors.npy).
+INDEX_QUANT = os.getenv("FAQ_INDEX_QUANT", "none").lower()
+PQ_M = int(os.getenv("FAQ_INDEX_PQ_M", "16"))   # sub-quantizers; must divide the embed dim
+RERANK_FACTOR = int(os.getenv("FAQ_RERANK_FACTOR", "4"))
+
+# Snapshot layout:
+#   INDEX_DIR/CURRENT            name of the live version (swapped with os.replace)
+#   INDEX_DIR/v<ts>-<hash>/      index.faiss, index.pkl, manifest.json
+# A version directory is fully written under a temp name and renamed into place,
+# so a crash mid-save never leaves a half-written index behind CURRENT.
+CURRENT_FILE = os.path.join(INDEX_DIR, "CURRENT")
+MANIFEST = "manifest.json"
+VECTORS = "vectors.npy"
+
+# Live index: (vectorstore, manifest, full-precision vectors). Readers take a reference, builders replace the
+# whole tuple in one assignment, so readers never lock or see a partial swap.
+_active: Optional[Tuple[FAISS, Dict, np.ndarray]] = None
+_build_lock = threading.Lock()
 
 def load_faq_csv(csv_path: Optional[str] = None) -> List[Document]:
     csv_path = csv_path or DEFAULT_CSV
@@ -28,24 +67,313 @@ def load_faq_csv(csv_path: Optional[str] = None) -> List[Document]:
         if not q or not a:
             continue
         # We index by Question text; store the Answer in metadata
-        docs.append(Document(page_content=q, metadata={"answer": a}))
+        docs.append(Document(page_content=q, metadata={"answer": a, "row_id": _row_id(q)}))
     return docs
 
-def build_or_load_vectorstore(csv_path: Optional[str] = None) -> Tuple[FAISS, OllamaEmbeddings]:
-    embeddings = OllamaEmbeddings(model=EMBED_MODEL)  # Uses OLLAMA_HOST if set
-    # Try loading existing index
-    if os.path.isdir(INDEX_DIR) and os.listdir(INDEX_DIR):
-        try:
-            vs = FAISS.load_local(INDEX_DIR, embeddings, allow_dangerous_deserialization=True)
-            return vs, embeddings
-        except Exception:
-            pass  # fallthrough and rebuild
+def _row_id(question: str) -> str:
+    """Stable document id: hash of the normalized question (the embedded text)."""
+    return hashlib.sha1(" ".join(question.lower().split()).encode("utf-8")).hexdigest()
+
+def _answer_hash(answer: str) -> str:
+    return hashlib.sha1(answer.encode("utf-8")).hexdigest()
+
+# ---------------- Snapshots ----------------
+def _csv_hash(csv_path: str) -> str:
+    h = hashlib.sha256()
+    with open(csv_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+def _current_version() -> Optional[str]:
+    try:
+        with open(CURRENT_FILE, "r", encoding="utf-8") as f:
+            name = f.read().strip()
+    except FileNotFoundError:
+        return None
+    return name if name and os.path.isdir(os.path.join(INDEX_DIR, name)) else None
+
+def _read_manifest(version: str) -> Optional[Dict]:
+    try:
+        with open(os.path.join(INDEX_DIR, version, MANIFEST), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def _is_fresh(manifest: Optional[Dict], csv_hash: str) -> bool:
+    return bool(manifest) and manifest.get("csv_sha256") == csv_hash and _same_model(manifest)
+
+def _same_model(manifest: Dict) -> bool:
+    return manifest.get("embed_model") == EMBED_MODEL and manifest.get("quant", "none") == INDEX_QUANT
+
+def _publish(version: str) -> None:
+    fd, tmp = tempfile.mkstemp(dir=INDEX_DIR, prefix=".CURRENT.")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        f.write(version)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, CURRENT_FILE)
+
+def _prune(keep: str) -> None:
+    versions = sorted(d for d in os.listdir(INDEX_DIR) if d.startswith("v") and d != keep)
+    for d in versions[:max(0, len(versions) - (INDEX_KEEP - 1))]:
+        shutil.rmtree(os.path.join(INDEX_DIR, d), ignore_errors=True)
+
+# ---------------- Index construction ----------------
+def _new_index(vectors: np.ndarray, quant: Optional[str] = None) -> "faiss.Index":
+    n, dim = vectors.shape
+    quant = quant or INDEX_QUANT
+    if quant == "sq8":
+        index = faiss.IndexScalarQuantizer(dim, faiss.ScalarQuantizer.QT_8bit)
+    elif quant == "fp16":
+        index = faiss.IndexScalarQuantizer(dim, faiss.ScalarQuantizer.QT_fp16)
+    elif quant == "pq":
+        # k-means needs at least 2**nbits training points; small FAQs get fewer centroids
+        nbits = max(1, min(8, int(np.log2(max(2, n)))))
+        index = faiss.IndexPQ(dim, PQ_M if dim % PQ_M == 0 else 1, nbits)
+    else:
+        index = faiss.IndexFlatL2(dim)
+    if not index.is_trained:
+        index.train(vectors)
+    return index
+
+def _add(vs: FAISS, docs: Dict[str, Document], ids: List[str], vectors: np.ndarray) -> None:
+    vs.add_embeddings(
+        list(zip([docs[i].page_content for i in ids], vectors.tolist())),
+        metadatas=[docs[i].metadata for i in ids],
+        ids=ids,
+    )
+
+def _embed(embeddings: Embeddings, docs: Dict[str, Document], ids: List[str]) -> np.ndarray:
+    if not ids:
+        return np.zeros((0, 0), dtype="float32")
+    return np.asarray(embeddings.embed_documents([docs[i].page_content for i in ids]), dtype="float32")
+
+def _write_snapshot(vs: FAISS, csv_path: str, csv_hash: str, rows: Dict[str, str],
+                    vectors: np.ndarray, vector_ids: List[str]) -> Dict:
+    manifest = {
+        "version": f"v{int(time.time() * 1000)}-{csv_hash[:12]}",
+        "csv_path": os.path.abspath(csv_path),
+        "csv_sha256": csv_hash,
+        "embed_model": EMBED_MODEL,
+        "quant": INDEX_QUANT,
+        "doc_count": len(rows),
+        "created_at": time.time(),
+        "rows": rows,  # row_id -> answer hash; the id map used for incremental diffs
+        "vector_ids": vector_ids,  # row order of vectors.npy
+    }
+    os.makedirs(INDEX_DIR, exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(dir=INDEX_DIR, prefix=".build-")
+    try:
+        vs.save_local(tmp_dir)
+        np.save(os.path.join(tmp_dir, VECTORS), vectors)
+        manifest["index_bytes"] = os.path.getsize(os.path.join(tmp_dir, "index.faiss"))
+        manifest["vector_bytes"] = int(vectors.nbytes)
+        with open(os.path.join(tmp_dir, MANIFEST), "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=2)
+        os.rename(tmp_dir, os.path.join(INDEX_DIR, manifest["version"]))
+    except Exception:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+    _publish(manifest["version"])
+    _prune(manifest["version"])
+    return manifest
+
+def _load_snapshot(version: str, embeddings: Embeddings) -> Tuple[FAISS, np.ndarray]:
+    path = os.path.join(INDEX_DIR, version)
+    vs = FAISS.load_local(path, embeddings, allow_dangerous_deserialization=True)
+    return vs, np.load(os.path.join(path, VECTORS), mmap_mode="r")
+
+def _unique_docs(csv_path: str) -> Dict[str, Document]:
+    # duplicate questions collapse onto one id; the last row wins
+    return {d.metadata["row_id"]: d for d in load_faq_csv(csv_path)}
 
-    docs = load_faq_csv(csv_path)
-    vs = FAISS.from_documents(docs, embeddings)
-    vs.save_local(INDEX_DIR)
-    return vs, embeddings
+def _build_snapshot(csv_path: str, csv_hash: str, embeddings: Embeddings) -> Tuple[FAISS, Dict, np.ndarray]:
+    docs = _unique_docs(csv_path)
+    ids = list(docs)
+    vectors = _embed(embeddings, docs, ids)
+    vs = FAISS(embeddings, _new_index(vectors), InMemoryDocstore(), {})
+    _add(vs, docs, ids, vectors)
+    rows = {i: _answer_hash(d.metadata["answer"]) for i, d in docs.items()}
+    return vs, _write_snapshot(vs, csv_path, csv_hash, rows, vectors, ids), vectors
+
+def _update_snapshot(version: str, manifest: Dict, csv_path: str, csv_hash: str,
+                     embeddings: Embeddings) -> Tuple[FAISS, Dict, np.ndarray]:
+    """
+    Apply a CSV diff to a private copy of the published snapshot: embed only new
+    questions, drop removed ones from the index, and swap the docstore entry for
+    rows whose answer alone changed (no embedding needed, the question is the key).
+    """
+    vs, old_vectors = _load_snapshot(version, embeddings)
+    docs = _unique_docs(csv_path)
+    old = manifest["rows"]
+    rows = {i: _answer_hash(d.metadata["answer"]) for i, d in docs.items()}
+
+    removed = [i for i in old if i not in rows]
+    added = [i for i in rows if i not in old]
+    changed = [i for i in rows if i in old and old[i] != rows[i]]
+
+    if removed:
+        vs.delete(removed)  # FAISS.remove_ids + id map compaction
+    for i in changed:
+        vs.docstore.delete([i])
+        vs.docstore.add({i: docs[i]})
+    new_vectors = _embed(embeddings, docs, added)
+    if added:
+        _add(vs, docs, added, new_vectors)
+
+    gone = set(removed)
+    keep = [n for n, i in enumerate(manifest["vector_ids"]) if i not in gone]
+    vector_ids = [manifest["vector_ids"][n] for n in keep] + added
+    vectors = np.asarray(old_vectors[keep], dtype="float32")
+    if added:
+        vectors = np.vstack([vectors, new_vectors])
+    print(f"[FAQ INDEX] incremental update: +{len(added)} -{len(removed)} ~{len(changed)}")
+    return vs, _write_snapshot(vs, csv_path, csv_hash, rows, vectors, vector_ids), vectors
+
+def build_or_load_vectorstore(csv_path: Optional[str] = None) -> Tuple[FAISS, Embeddings]:
+    """
+    Return the index for csv_path. An unchanged CSV loads the live snapshot, a changed
+    one is diffed against it by row id, and only a new embed model (or a missing or
+    unreadable snapshot) triggers a full rebuild.
+    """
+    global _active
+    csv_path = csv_path or DEFAULT_CSV
+    embeddings = routed_embeddings(EMBED_MODEL)  # OLLAMA_HOSTS, else OLLAMA_HOST
+    csv_hash = _csv_hash(csv_path)
+
+    active = _active
+    if active and _is_fresh(active[1], csv_hash):
+        return active[0], embeddings
+
+    with _build_lock:
+        # Try loading the published snapshot
+        version = _current_version()
+        manifest = _read_manifest(version) if version else None
+        if _is_fresh(manifest, csv_hash):
+            try:
+                vs, vectors = _load_snapshot(version, embeddings)
+                _active = (vs, manifest, vectors)
+                return vs, embeddings
+            except Exception as e:
+                print(f"[FAQ INDEX] snapshot {version} unreadable, rebuilding: {e}")
+        elif manifest and _same_model(manifest) and "vector_ids" in manifest:
+            try:
+                _active = _update_snapshot(version, manifest, csv_path, csv_hash, embeddings)
+                vs = _active[0]
+                return vs, embeddings
+            except Exception as e:
+                print(f"[FAQ INDEX] incremental update failed, rebuilding: {e}")
+
+        _active = _build_snapshot(csv_path, csv_hash, embeddings)
+        return _active[0], embeddings
+
+def get_vectorstore() -> FAISS:
+    """Live index for readers; loads (or builds) it on first use."""
+    active = _active
+    if active:
+        return active[0]
+    return build_or_load_vectorstore()[0]
+
+def search_faq(query: str, k: int = 3) -> List[Tuple[Document, float]]:
+    """
+    (doc, L2 distance) pairs for query, nearest first. With a quantized index the
+    compressed codes only pick RERANK_FACTOR * k candidates; their final order and
+    distances come from the full-precision vectors.
+    """
+    if _active is None:
+        build_or_load_vectorstore()
+    vs, manifest, full = _active  # one read: index, id order and vectors always match
+    qv = np.asarray(vs.embedding_function.embed_query(query), dtype="float32")
+    if manifest.get("quant", "none") == "none":
+        return vs.similarity_search_with_score_by_vector(qv.tolist(), k=k)
+
+    cands = vs.similarity_search_with_score_by_vector(qv.tolist(), k=k * RERANK_FACTOR)
+    pos = {i: n for n, i in enumerate(manifest["vector_ids"])}
+    rows = [pos[d.metadata["row_id"]] for d, _ in cands]
+    dists = ((np.asarray(full[rows]) - qv) ** 2).sum(axis=1)
+    order = np.argsort(dists)[:k]
+    return [(cands[n][0], float(dists[n])) for n in order]
+
+def current_manifest() -> Optional[Dict]:
+    active = _active
+    return dict(active[1]) if active else None
 
 def reload_vectorstore(csv_path: Optional[str] = None) -> FAISS:
     vs, _ = build_or_load_vectorstore(csv_path)
     return vs
+
+def reload_vectorstore_async(csv_path: Optional[str] = None) -> threading.Thread:
+    """
+    Build the new snapshot on a background thread. Readers keep using the old index
+    until the new one is published, then pick it up on their next get_vectorstore().
+    """
+    def _run():
+        try:
+            reload_vectorstore(csv_path)
+        except Exception as e:
+            print(f"[FAQ INDEX] background rebuild failed: {e}")
+
+    t = threading.Thread(target=_run, name="faq-index-build", daemon=True)
+    t.start()
+    return t
+
+# ---------------- benchmark ----------------
+def _bench_vectors(csv_path: Optional[str], synthetic: int, dim: int, n_queries: int) -> Tuple[np.ndarray, np.ndarray]:
+    """(index vectors, queries). From the CSV: the real question embeddings, queried with
+    slightly perturbed copies (paraphrases land near their question). Synthetic: clustered
+    random vectors, so quantization has realistic structure to lose."""
+    rng = np.random.default_rng(0)
+    if csv_path:
+        docs = _unique_docs(csv_path)
+        vectors = _embed(routed_embeddings(EMBED_MODEL), docs, list(docs))
+    else:
+        centers = rng.standard_normal((max(1, synthetic // 50), dim)).astype("float32")
+        vectors = centers[rng.integers(0, len(centers), synthetic)]
+        vectors = vectors + 0.5 * rng.standard_normal(vectors.shape).astype("float32")
+    picks = vectors[rng.integers(0, len(vectors), n_queries)]
+    noise = rng.standard_normal(picks.shape).astype("float32") * float(np.std(vectors)) * 0.3
+    return np.ascontiguousarray(vectors, dtype="float32"), np.ascontiguousarray(picks + noise, dtype="float32")
+
+def _bench(csv_path: Optional[str], synthetic: int, dim: int, n_queries: int, k: int) -> None:
+    vectors, queries = _bench_vectors(csv_path, synthetic, dim, n_queries)
+    n, dim = vectors.shape
+    exact = faiss.IndexFlatL2(dim)
+    exact.add(vectors)
+    _, truth = exact.search(queries, k)
+    print(f"{n} vectors x {dim} dims, {len(queries)} queries, recall@{k} against exact search, "
+          f"float32 vectors {vectors.nbytes / 1e6:.2f} MB")
+    print(f"  {'quant':<6} {'index MB':>9} {'raw recall':>11} {'reranked':>9} {'p50 ms':>7} {'p99 ms':>7}")
+    for quant in ("none", "fp16", "sq8", "pq"):
+        index = _new_index(vectors, quant)
+        index.add(vectors)
+        size = faiss.serialize_index(index).nbytes
+        raw_hits = hits = 0
+        times = []
+        for qv, want in zip(queries, truth):
+            t0 = time.perf_counter()
+            # the search_faq() path: compressed codes pick the candidates, float32 orders them
+            _, cand = index.search(qv[None, :], k if quant == "none" else k * RERANK_FACTOR)
+            cand = cand[0][cand[0] >= 0]
+            if quant != "none":
+                dists = ((vectors[cand] - qv) ** 2).sum(axis=1)
+                top = cand[np.argsort(dists)[:k]]
+            else:
+                top = cand
+            times.append((time.perf_counter() - t0) * 1000)
+            raw_hits += len(set(cand[:k].tolist()) & set(want.tolist()))
+            hits += len(set(top.tolist()) & set(want.tolist()))
+        times.sort()
+        total = len(queries) * k
+        print(f"  {quant:<6} {size / 1e6:>9.2f} {raw_hits / total:>11.3f} {hits / total:>9.3f} "
+              f"{times[len(times) // 2]:>7.3f} {times[min(len(times) - 1, int(0.99 * len(times)))]:>7.3f}")
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] != "bench":
+        sys.exit("usage: python -m LLM_Bridge.knowledge_loader bench [--csv faq.csv | --synthetic N] "
+                 "[--dim 768] [--queries 500] [--k 3]")
+    def _arg(name: str, default):
+        return type(default)(sys.argv[sys.argv.index(name) + 1]) if name in sys.argv else default
+    csv_arg = _arg("--csv", "") or None
+    _bench(csv_arg, _arg("--synthetic", 0 if csv_arg else 20000), _arg("--dim", 768),
+           _arg("--queries", 500), _arg("--k", 3))
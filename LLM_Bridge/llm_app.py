@@ -1,10 +1,38 @@
 import os
+import time
+import logging
+import threading
 from dotenv import load_dotenv
 from langchain_community.llms import Ollama
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
-from flask import Flask, request, render_template
+from flask import Flask, Response, jsonify, request, stream_with_context
 
+load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), ".env"))
+
+try:
+    from . import tracing
+except ImportError:  # run as a script: python LLM_Bridge/llm_app.py
+    import tracing
+
+MODEL_NAME = os.getenv("OLLAMA_MODEL", "llama3.2:latest")
+OLLAMA_HOST = os.getenv("OLLAMA_HOST", "http://127.0.0.1:11434")
+HOST = os.getenv("LLM_APP_HOST", "127.0.0.1")
+PORT = int(os.getenv("LLM_APP_PORT", "5001"))
+# At most LLM_APP_CONCURRENCY generations at once; a request that can't get a slot
+# within LLM_APP_QUEUE_TIMEOUT seconds gets 503 + Retry-After instead of piling up.
+CONCURRENCY = int(os.getenv("LLM_APP_CONCURRENCY", "4"))
+QUEUE_TIMEOUT = float(os.getenv("LLM_APP_QUEUE_TIMEOUT", "30"))
+# threads serving HTTP (waiting callers included); keep it above CONCURRENCY
+SERVER_THREADS = int(os.getenv("LLM_APP_THREADS", "32"))
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+
+logging.basicConfig(
+    level=LOG_LEVEL,
+    format="%(asctime)s %(levelname)s %(name)s %(message)s",
+)
+logger = logging.getLogger("llm_app")
+tracing.set_service("llm_app")
 
 llm_app = Flask(__name__)
 
@@ -16,38 +44,155 @@ def initialize_chatbot():
             ("user", "Prompt: {query}")
         ]
     )
-    
-    llm = Ollama(model="llama3.2:latest")
+
+    llm = Ollama(model=MODEL_NAME, base_url=OLLAMA_HOST)
     output_parser = StrOutputParser()
-    
+
     chain = prompt | llm | output_parser
     return chain
 
 # Initialize chatbot
 chain = initialize_chatbot()
+_slots = threading.BoundedSemaphore(CONCURRENCY)
+_stats_lock = threading.Lock()
+_stats = {"in_flight": 0, "served": 0, "rejected": 0, "errors": 0}
+
+
+def _count(key: str, delta: int = 1) -> None:
+    with _stats_lock:
+        _stats[key] += delta
+
+
+def _busy():
+    _count("rejected")
+    logger.warning("event=rejected reason=queue_timeout wait_s=%.1f", QUEUE_TIMEOUT)
+    resp = jsonify({"error": "LLM busy, retry later"})
+    resp.status_code = 503
+    resp.headers["Retry-After"] = str(max(1, int(QUEUE_TIMEOUT // 2)))
+    return resp
+
+
+def _read_prompt():
+    data = request.get_json(silent=True) or {}
+    prompt = data.get("Prompt")
+    if not isinstance(prompt, str) or not prompt.strip():
+        return None
+    return prompt
+
+
+def _acquire_slot(parent) -> bool:
+    with tracing.span("llm_app.queue_wait", parent=parent) as span:
+        ok = _slots.acquire(timeout=QUEUE_TIMEOUT)
+        span.set(acquired=ok)
+    return ok
+
 
 @llm_app.route('/ai', methods=['POST'])
 def home():
-   
-    request_data = request.get_json()
-    output = chain.invoke({'query': request_data['Prompt']})
-   
-    answer= {"Prompt": request_data["Prompt"],
-             "Response":output}
-    
-    print(answer["Prompt"])
-    print(output)
-    print("----------")
-    print(answer["Response"])
-    
-      
-    # both return outputs work
-    return answer  
-    # return output, 200, answer 
+    prompt = _read_prompt()
+    if prompt is None:
+        return jsonify({"error": "JSON body with a non-empty 'Prompt' is required"}), 400
 
-if __name__ == '__main__':
-    llm_app.run(debug=True, port = 5001)
+    with tracing.span("POST /ai", parent=tracing.extract(request.headers), prompt_chars=len(prompt)) as span:
+        t0 = time.perf_counter()
+        if not _acquire_slot(span.context):
+            span.set(status=503)
+            return _busy()
+        waited = time.perf_counter() - t0
+        _count("in_flight")
+        try:
+            with tracing.span("llm_app.generate", model=MODEL_NAME):
+                output = chain.invoke({'query': prompt})
+        except Exception:
+            _count("errors")
+            logger.exception("event=error endpoint=/ai prompt_chars=%d", len(prompt))
+            span.set(status=502)
+            return jsonify({"error": "LLM call failed"}), 502
+        finally:
+            _count("in_flight", -1)
+            _slots.release()
+        span.set(status=200, response_chars=len(output))
+
+    _count("served")
+    logger.info("event=answered endpoint=/ai prompt_chars=%d response_chars=%d queue_ms=%.0f total_ms=%.0f",
+                len(prompt), len(output), waited * 1000, (time.perf_counter() - t0) * 1000)
+    logger.debug("prompt=%r response=%r", prompt, output)
+    return {"Prompt": prompt, "Response": output}
+
+
+@llm_app.route('/ai/stream', methods=['POST'])
+def stream():
+    """Same as /ai, but the answer is sent as plain text chunks while it is generated."""
+    prompt = _read_prompt()
+    if prompt is None:
+        return jsonify({"error": "JSON body with a non-empty 'Prompt' is required"}), 400
 
+    # the request span outlives this function: it ends when the stream is released
+    span = tracing.span("POST /ai/stream", parent=tracing.extract(request.headers), prompt_chars=len(prompt))
+    t0 = time.perf_counter()
+    if not _acquire_slot(span.context):
+        span.set(status=503)
+        span.end()
+        return _busy()
+    waited = time.perf_counter() - t0
+    _count("in_flight")
+    released = threading.Lock()
 
+    def release():
+        # from the generator's finally or from Response.close(), whichever runs first
+        # (a generator closed before its first chunk never reaches its finally)
+        if released.acquire(blocking=False):
+            _count("in_flight", -1)
+            _slots.release()
+            span.end()
 
+    def generate():
+        chars, first_ms = 0, None
+        gen_span = tracing.span("llm_app.generate", parent=span.context, model=MODEL_NAME)
+        try:
+            for piece in chain.stream({'query': prompt}):
+                if first_ms is None:
+                    first_ms = (time.perf_counter() - t0) * 1000
+                    gen_span.set(first_token_ms=round(first_ms, 1))
+                chars += len(piece)
+                yield piece
+            _count("served")
+            span.set(status=200, response_chars=chars)
+            logger.info("event=streamed endpoint=/ai/stream prompt_chars=%d response_chars=%d "
+                        "queue_ms=%.0f first_token_ms=%.0f total_ms=%.0f",
+                        len(prompt), chars, waited * 1000, first_ms or 0, (time.perf_counter() - t0) * 1000)
+        except Exception as e:
+            _count("errors")
+            gen_span.fail(e)
+            span.fail(e)
+            logger.exception("event=error endpoint=/ai/stream prompt_chars=%d", len(prompt))
+        finally:
+            gen_span.end()
+            release()
 
+    resp = Response(stream_with_context(generate()), mimetype="text/plain; charset=utf-8",
+                    headers={"X-Accel-Buffering": "no"})
+    resp.call_on_close(release)
+    return resp
+
+
+@llm_app.route('/health', methods=['GET'])
+def health():
+    with _stats_lock:
+        stats = dict(_stats)
+    return {"status": "ok", "model": MODEL_NAME, "concurrency": CONCURRENCY, **stats}
+
+
+def serve():
+    """waitress (in requirements.txt) if installed, else Werkzeug's threaded server."""
+    try:
+        from waitress import serve as waitress_serve
+    except ImportError:
+        logger.warning("event=startup server=werkzeug-threaded hint='pip install waitress for production'")
+        llm_app.run(host=HOST, port=PORT, threaded=True, debug=False)
+        return
+    logger.info("event=startup server=waitress port=%d threads=%d concurrency=%d", PORT, SERVER_THREADS, CONCURRENCY)
+    waitress_serve(llm_app, host=HOST, port=PORT, threads=SERVER_THREADS)
+
+if __name__ == '__main__':
+    serve()
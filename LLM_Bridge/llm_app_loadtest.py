@@ -0,0 +1,91 @@
+# LLM_Bridge/llm_app_loadtest.py
+# Throughput / latency of llm_app.py /ai at several caller concurrencies.
+#
+#   python LLM_Bridge/llm_app_loadtest.py                       # 1, 8 and 32 callers
+#   python LLM_Bridge/llm_app_loadtest.py --levels 1,4 --requests 20 --stream
+#
+# Each level runs `--requests` calls per caller (at least --min-total overall) and
+# prints requests/s, latency percentiles and how many calls got 503 (queue timeout).
+import os
+import time
+import argparse
+import statistics
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+import requests
+
+URL = os.getenv("LLM_API_URL", "http://localhost:5001/ai")
+PROMPT = "In two sentences, what is an aseptic bag-in-box?"
+
+
+def _call(session: requests.Session, url: str, stream: bool, timeout: float) -> Dict:
+    t0 = time.perf_counter()
+    first = None
+    try:
+        if stream:
+            with session.post(url + "/stream", json={"Prompt": PROMPT}, stream=True, timeout=timeout) as r:
+                for chunk in r.iter_content(chunk_size=None):
+                    if first is None and chunk:
+                        first = time.perf_counter() - t0
+                status = r.status_code
+        else:
+            status = session.post(url, json={"Prompt": PROMPT}, timeout=timeout).status_code
+    except requests.RequestException:
+        status = 0
+    return {"status": status, "s": time.perf_counter() - t0, "first_s": first}
+
+
+def run_level(url: str, callers: int, per_caller: int, stream: bool, timeout: float) -> Dict:
+    def caller(_):
+        with requests.Session() as s:
+            return [_call(s, url, stream, timeout) for _ in range(per_caller)]
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=callers) as pool:
+        results: List[Dict] = [r for batch in pool.map(caller, range(callers)) for r in batch]
+    wall = time.perf_counter() - t0
+
+    ok = [r for r in results if r["status"] == 200]
+    lat = sorted(r["s"] for r in ok) or [0.0]
+    pct = lambda p: lat[min(len(lat) - 1, int(p * len(lat)))]
+    out = {
+        "callers": callers,
+        "requests": len(results),
+        "ok": len(ok),
+        "busy_503": sum(r["status"] == 503 for r in results),
+        "errors": sum(r["status"] not in (200, 503) for r in results),
+        "rps": len(ok) / wall,
+        "p50_s": pct(0.50),
+        "p95_s": pct(0.95),
+        "max_s": lat[-1],
+    }
+    firsts = [r["first_s"] for r in ok if r["first_s"] is not None]
+    if firsts:
+        out["first_chunk_p50_s"] = statistics.median(firsts)
+    return out
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Load test for llm_app.py /ai")
+    ap.add_argument("--url", default=URL)
+    ap.add_argument("--levels", default="1,8,32")
+    ap.add_argument("--requests", type=int, default=4, help="calls per caller")
+    ap.add_argument("--min-total", type=int, default=8, help="minimum calls per level")
+    ap.add_argument("--stream", action="store_true", help="use /ai/stream")
+    ap.add_argument("--timeout", type=float, default=300)
+    args = ap.parse_args()
+
+    print(f"{'callers':>7} {'reqs':>5} {'ok':>5} {'503':>5} {'err':>5} {'req/s':>8} {'p50 s':>7} {'p95 s':>7} {'max s':>7}")
+    for callers in (int(x) for x in args.levels.split(",")):
+        per_caller = max(args.requests, -(-args.min_total // callers))
+        r = run_level(args.url, callers, per_caller, args.stream, args.timeout)
+        line = (f"{r['callers']:>7} {r['requests']:>5} {r['ok']:>5} {r['busy_503']:>5} {r['errors']:>5} "
+                f"{r['rps']:>8.2f} {r['p50_s']:>7.2f} {r['p95_s']:>7.2f} {r['max_s']:>7.2f}")
+        if "first_chunk_p50_s" in r:
+            line += f"  first chunk p50 {r['first_chunk_p50_s']:.2f}s"
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,246 @@
+# LLM_Bridge/ollama_router.py
+# Spreads Ollama traffic over several hosts.
+#
+#   OLLAMA_HOSTS="http://gpu1:11434=gen,embed;http://cpu1:11434=embed"
+#
+# Each host is tagged for embedding and/or generation (no tag = both). Requests go to
+# the healthy host with the fewest outstanding requests. A host that fails
+# OLLAMA_CB_FAILURES times in a row is skipped for OLLAMA_CB_OPEN_SECONDS (circuit
+# open), then gets a single trial request (half-open) whose outcome closes or reopens
+# the circuit; a background checker pings /api/tags to close circuits early. Embedding calls are idempotent and retried on another host.
+# Without OLLAMA_HOSTS the router has the single OLLAMA_HOST, i.e. the old behaviour.
+import os
+import time
+import random
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional
+
+import requests
+
+ROLES = ("gen", "embed")
+CB_FAILURES = int(os.getenv("OLLAMA_CB_FAILURES", "3"))
+CB_OPEN_SECONDS = float(os.getenv("OLLAMA_CB_OPEN_SECONDS", "30"))
+HEALTH_INTERVAL = float(os.getenv("OLLAMA_HEALTH_INTERVAL", "10"))
+EMBED_TIMEOUT = float(os.getenv("OLLAMA_EMBED_TIMEOUT", "120"))
+
+
+class NoBackendError(RuntimeError):
+    pass
+
+
+class Backend:
+    def __init__(self, url: str, roles):
+        self.url = url.rstrip("/")
+        self.roles = set(roles)
+        self.outstanding = 0
+        self.failures = 0
+        self.open_until = 0.0
+        self.probing = False  # the half-open trial request is in flight
+        self.last_error: Optional[str] = None
+
+    @property
+    def closed(self) -> bool:
+        return self.failures < CB_FAILURES
+
+    @property
+    def available(self) -> bool:
+        # after the open period the circuit is half-open: one request at a time is a probe
+        return self.closed or (time.time() >= self.open_until and not self.probing)
+
+    def status(self) -> Dict:
+        return {
+            "url": self.url,
+            "roles": sorted(self.roles),
+            "outstanding": self.outstanding,
+            "failures": self.failures,
+            "circuit": "closed" if self.closed else ("open" if time.time() < self.open_until else "half-open"),
+            "last_error": self.last_error,
+        }
+
+
+def parse_hosts(spec: str) -> List[Backend]:
+    backends = []
+    for part in filter(None, (p.strip() for p in spec.split(";"))):
+        url, _, tags = part.partition("=")
+        roles = [t.strip() for t in tags.split(",") if t.strip()] or list(ROLES)
+        unknown = set(roles) - set(ROLES)
+        if unknown:
+            raise ValueError(f"OLLAMA_HOSTS: unknown role(s) {sorted(unknown)} for {url}")
+        backends.append(Backend(url.strip(), roles))
+    return backends
+
+
+class OllamaRouter:
+    def __init__(self, backends: List[Backend]):
+        if not backends:
+            raise ValueError("OllamaRouter needs at least one backend")
+        self.backends = backends
+        # called before every embedding request; background ingestion sets it to
+        # wait while interactive traffic is in flight (ingest_admin.py)
+        self.gate: Optional[Callable[[], None]] = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    # ---------- selection ----------
+    def backends_for(self, role: str) -> List[Backend]:
+        return [b for b in self.backends if role in b.roles]
+
+    def pick(self, role: str, exclude=()) -> Backend:
+        """Least outstanding requests among hosts for `role` with a closed or half-open circuit."""
+        with self._lock:
+            cands = [b for b in self.backends_for(role) if b.available and b not in exclude]
+            if not cands:
+                raise NoBackendError(f"no available Ollama host for '{role}'")
+            low = min(b.outstanding for b in cands)
+            b = random.choice([b for b in cands if b.outstanding == low])
+            b.outstanding += 1
+            if not b.closed:
+                b.probing = True
+            return b
+
+    def _release(self, b: Backend, ok: bool, err: Optional[Exception]) -> None:
+        """ok: the call succeeded; err: it failed; neither: abandoned (e.g. a closed stream)."""
+        with self._lock:
+            b.outstanding -= 1
+            b.probing = False
+            if ok:
+                b.failures, b.open_until, b.last_error = 0, 0.0, None
+            elif err is not None:
+                self._fail(b, err)
+
+    def _fail(self, b: Backend, err: Exception) -> None:
+        b.failures += 1
+        b.last_error = str(err)
+        if b.failures >= CB_FAILURES:
+            b.open_until = time.time() + CB_OPEN_SECONDS
+
+    @contextmanager
+    def use(self, role: str, exclude=()) -> Iterator[Backend]:
+        b = self.pick(role, exclude)
+        ok, err = False, None
+        try:
+            yield b
+            ok = True
+        except Exception as e:
+            err = e
+            raise
+        finally:
+            self._release(b, ok, err)
+
+    # ---------- embeddings (idempotent, retried on another host) ----------
+    def embed(self, model: str, texts: List[str], batch: bool = False, keep_alive: Optional[str] = None) -> List[List[float]]:
+        """
+        batch=False: one /api/embeddings call per text (the vectors LangChain's
+        OllamaEmbeddings produces). batch=True: a single /api/embed call
+        (normalized vectors; fine for cosine search).
+        """
+        if self.gate is not None:
+            self.gate()
+        tried: List[Backend] = []
+        last: Optional[Exception] = None
+        for _ in range(len(self.backends_for("embed"))):
+            try:
+                with self.use("embed", exclude=tried) as b:
+                    tried.append(b)
+                    return self._embed_on(b, model, texts, batch, keep_alive)
+            except NoBackendError:
+                break
+            except Exception as e:
+                last = e
+                print(f"[OLLAMA ROUTER] embed on {tried[-1].url} failed: {e}")
+        raise last or NoBackendError("no available Ollama host for 'embed'")
+
+    @staticmethod
+    def _embed_on(b: Backend, model: str, texts: List[str], batch: bool, keep_alive: Optional[str]) -> List[List[float]]:
+        extra = {"keep_alive": keep_alive} if keep_alive else {}
+        if batch:
+            r = requests.post(f"{b.url}/api/embed", json={"model": model, "input": texts, **extra}, timeout=EMBED_TIMEOUT)
+            if r.status_code != 404:  # Ollama < 0.3 has no /api/embed
+                r.raise_for_status()
+                return r.json()["embeddings"]
+        out = []
+        for t in texts:
+            r = requests.post(f"{b.url}/api/embeddings", json={"model": model, "prompt": t, **extra}, timeout=EMBED_TIMEOUT)
+            r.raise_for_status()
+            out.append(r.json()["embedding"])
+        return out
+
+    # ---------- health ----------
+    def check(self) -> None:
+        for b in self.backends:
+            try:
+                requests.get(f"{b.url}/api/tags", timeout=3).raise_for_status()
+                with self._lock:
+                    b.failures, b.open_until, b.last_error = 0, 0.0, None
+            except Exception as e:
+                with self._lock:
+                    self._fail(b, e)
+
+    def _run(self) -> None:
+        while not self._stop.wait(HEALTH_INTERVAL):
+            self.check()
+
+    def start(self) -> None:
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="ollama-health", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def status(self) -> List[Dict]:
+        with self._lock:
+            return [b.status() for b in self.backends]
+
+
+# ---------------- process-wide router ----------------
+_router: Optional[OllamaRouter] = None
+_router_lock = threading.Lock()
+
+
+def get_router() -> OllamaRouter:
+    global _router
+    if _router is None:
+        with _router_lock:
+            if _router is None:
+                spec = os.getenv("OLLAMA_HOSTS") or os.getenv("OLLAMA_HOST", "http://127.0.0.1:11434")
+                _router = OllamaRouter(parse_hosts(spec))
+    return _router
+
+
+_embeddings_cls = None
+
+
+def routed_embeddings(model: str, router: Optional[OllamaRouter] = None):
+    """
+    Drop-in for OllamaEmbeddings(model=...) (same "query: "/"passage: " prefixes and
+    per-text endpoint, so vectors match existing indexes) that goes through the router.
+    """
+    global _embeddings_cls
+    if _embeddings_cls is None:
+        from langchain_core.embeddings import Embeddings  # deferred: keeps importers light
+
+        class RoutedOllamaEmbeddings(Embeddings):
+            embed_instruction = "passage: "
+            query_instruction = "query: "
+
+            def __init__(self, model: str, router: Optional[OllamaRouter] = None):
+                self.model = model
+                self._router = router
+
+            @property
+            def router(self) -> OllamaRouter:
+                return self._router or get_router()
+
+            def embed_documents(self, texts: List[str]) -> List[List[float]]:
+                return self.router.embed(self.model, [f"{self.embed_instruction}{t}" for t in texts])
+
+            def embed_query(self, text: str) -> List[float]:
+                return self.router.embed(self.model, [f"{self.query_instruction}{text}"])[0]
+
+        _embeddings_cls = RoutedOllamaEmbeddings
+    return _embeddings_cls(model, router)
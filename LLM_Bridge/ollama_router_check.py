@@ -0,0 +1,138 @@
+# LLM_Bridge/ollama_router_check.py
+# Failover check for ollama_router.py against local fake Ollama hosts (no Ollama needed):
+#
+#   python LLM_Bridge/ollama_router_check.py
+#
+# Two stub hosts on 127.0.0.1 serve /api/embeddings, /api/embed and /api/tags; one is
+# made to fail. Checks that embeddings fail over, the circuit opens after
+# OLLAMA_CB_FAILURES errors, a half-open host gets exactly one trial request, a
+# successful trial closes the circuit and an abandoned call still releases its host.
+import os
+import sys
+import json
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+os.environ["OLLAMA_CB_FAILURES"] = "2"
+os.environ["OLLAMA_CB_OPEN_SECONDS"] = "0.5"
+
+try:
+    from .ollama_router import Backend, NoBackendError, OllamaRouter
+except ImportError:  # run as a script: python LLM_Bridge/ollama_router_check.py
+    from ollama_router import Backend, NoBackendError, OllamaRouter
+
+
+class FakeOllama:
+    """Threaded stub server; `failing` makes every call a 500, `delay` slows it down."""
+
+    def __init__(self):
+        self.failing = False
+        self.delay = 0.0
+        self.hits = 0
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _send(self, obj, code=200):
+                body = json.dumps(obj).encode()
+                self.send_response(code)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                self._send({"error": "down"}, 500) if fake.failing else self._send({"models": []})
+
+            def do_POST(self):
+                payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                fake.hits += 1
+                time.sleep(fake.delay)
+                if fake.failing:
+                    return self._send({"error": "down"}, 500)
+                if self.path == "/api/embed":
+                    return self._send({"embeddings": [[1.0, 0.0]] * len(payload["input"])})
+                self._send({"embedding": [0.5, 0.5]})
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+
+def check(name: str, cond: bool) -> None:
+    print(f"{'ok  ' if cond else 'FAIL'} {name}")
+    if not cond:
+        sys.exit(1)
+
+
+def main() -> None:
+    good, bad = FakeOllama(), FakeOllama()
+    bad.failing = True
+    router = OllamaRouter([Backend(good.url, ["embed"]), Backend(bad.url, ["embed"])])
+    b_good, b_bad = router.backends
+
+    # 1) every call succeeds while one host fails, by retrying on the other
+    vectors = [router.embed("m", ["x"]) for _ in range(20)]
+    check("embeddings fail over to the healthy host", all(v == [[0.5, 0.5]] for v in vectors))
+    check("failing host's circuit opened", not b_bad.closed and b_bad.status()["circuit"] == "open")
+    hits = bad.hits
+    for _ in range(10):
+        router.embed("m", ["x"])
+    check("open circuit gets no traffic", bad.hits == hits)
+    check("no host left in flight", b_good.outstanding == 0 and b_bad.outstanding == 0)
+
+    # 2) half-open: only one trial request reaches the host while it is in flight
+    bad.failing, bad.delay = False, 0.5
+    time.sleep(0.6)
+    check("circuit half-open after the open period", b_bad.status()["circuit"] == "half-open")
+    hits = bad.hits
+    threads = [threading.Thread(target=router.embed, args=("m", ["x"])) for _ in range(10)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    check("exactly one trial request while half-open", bad.hits - hits == 1)
+    check("successful trial closes the circuit", b_bad.closed and b_bad.status()["circuit"] == "closed")
+
+    # 3) a failed trial reopens the circuit at once
+    bad.failing, bad.delay = True, 0.0
+    for _ in range(10):
+        router.embed("m", ["x"])
+    time.sleep(0.6)
+    hits = bad.hits
+    for _ in range(6):
+        router.embed("m", ["x"])
+    check("failed trial reopens the circuit", bad.hits - hits == 1 and b_bad.status()["circuit"] == "open")
+
+    # 4) a call abandoned without an exception (a closed stream) still releases its host
+    def stream():
+        with router.use("embed", exclude=[b_bad]):
+            yield "token"
+            yield "token"
+
+    gen = stream()
+    next(gen)
+    check("host counted while streaming", b_good.outstanding == 1)
+    gen.close()  # GeneratorExit inside use()
+    check("closed stream releases the host", b_good.outstanding == 0)
+
+    # 5) nothing healthy left
+    good.failing = True
+    for _ in range(5):
+        try:
+            router.embed("m", ["x"])
+        except Exception:
+            pass
+    try:
+        router.pick("embed")
+        check("NoBackendError with every circuit open", False)
+    except NoBackendError:
+        check("NoBackendError with every circuit open", True)
+    print("all router checks passed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+# LLM_Bridge/ollama_warmup.py
+# Preloads the chat and embedding models and keeps them resident in Ollama, so the
+# first /api/chat after a restart or an idle period doesn't pay the model load time.
+import os
+import time
+import threading
+from typing import Dict, Optional
+
+import requests
+
+KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")          # passed to Ollama on every ping
+KEEPALIVE_INTERVAL = float(os.getenv("OLLAMA_KEEPALIVE_INTERVAL", "240"))  # seconds
+WARMUP_TIMEOUT = float(os.getenv("OLLAMA_WARMUP_TIMEOUT", "300"))        # model load can be slow
+RETRY_INTERVAL = float(os.getenv("OLLAMA_WARMUP_RETRY", "5"))
+
+
+class OllamaWarmup:
+    """
+    Background thread that loads gen_model and/or embed_model on start, then re-pings
+    them every KEEPALIVE_INTERVAL seconds with keep_alive=KEEP_ALIVE. An empty
+    /api/generate prompt loads the model without generating any tokens.
+    """
+
+    def __init__(self, host: str, gen_model: Optional[str], embed_model: Optional[str],
+                 keep_alive: str = KEEP_ALIVE, interval: float = KEEPALIVE_INTERVAL):
+        self.host = host.rstrip("/")
+        self.keep_alive = keep_alive
+        self.interval = interval
+        self._models = {}
+        if gen_model:
+            self._models[gen_model] = self._ping_generate
+        if embed_model:
+            self._models[embed_model] = self._ping_embed
+        self._status: Dict[str, Dict] = {m: {"ready": False, "last_ok": None, "error": None} for m in self._models}
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    # ---------- pings ----------
+    def _ping_generate(self, model: str) -> None:
+        r = requests.post(f"{self.host}/api/generate",
+                          json={"model": model, "prompt": "", "keep_alive": self.keep_alive},
+                          timeout=WARMUP_TIMEOUT)
+        r.raise_for_status()
+
+    def _ping_embed(self, model: str) -> None:
+        r = requests.post(f"{self.host}/api/embeddings",
+                          json={"model": model, "prompt": "warmup", "keep_alive": self.keep_alive},
+                          timeout=WARMUP_TIMEOUT)
+        r.raise_for_status()
+
+    def ping_all(self) -> bool:
+        for model, ping in self._models.items():
+            st = self._status[model]
+            try:
+                ping(model)
+                st.update(ready=True, last_ok=time.time(), error=None)
+            except Exception as e:
+                st.update(ready=False, error=str(e))
+                print(f"[OLLAMA WARMUP] {model}: {e}")
+        return self.ready
+
+    # ---------- lifecycle ----------
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            ok = self.ping_all()
+            # retry quickly until both models are loaded, then settle into keep-alive
+            self._stop.wait(self.interval if ok else RETRY_INTERVAL)
+
+    def start(self) -> None:
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="ollama-warmup", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    # ---------- status ----------
+    @property
+    def ready(self) -> bool:
+        return all(st["ready"] for st in self._status.values())
+
+    def is_ready(self, model: str) -> bool:
+        return bool(self._status.get(model, {}).get("ready"))
+
+    def status(self) -> Dict:
+        return {"host": self.host, "ready": self.ready, "models": {m: dict(st) for m, st in self._status.items()}}
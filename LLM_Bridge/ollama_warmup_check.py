@@ -0,0 +1,101 @@
+# LLM_Bridge/ollama_warmup_check.py
+# Warm-up check for /api/health against a local fake Ollama whose models load slowly
+# (no Ollama or database needed):
+#
+#   python LLM_Bridge/ollama_warmup_check.py
+#
+# The stub takes GEN_LOAD / EMBED_LOAD seconds to answer the first call for each model,
+# like Ollama loading it into memory. /api/health must say 503 "warming" until both
+# models are loaded, also while only the chat model is, and 200 "ok" from then on.
+import os
+import sys
+import json
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+GEN_LOAD = 1.0
+EMBED_LOAD = 2.0
+
+
+class SlowOllama:
+    """First /api/generate or /api/embeddings call per model blocks for its load time."""
+
+    def __init__(self):
+        self.loaded = set()
+        self._lock = threading.Lock()
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                self._send({"models": []})
+
+            def do_POST(self):
+                payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                fake.load(payload["model"], GEN_LOAD if self.path == "/api/generate" else EMBED_LOAD)
+                if self.path == "/api/generate":
+                    return self._send({"model": payload["model"], "response": "", "done": True})
+                self._send({"embedding": [0.0] * 8})
+
+            def _send(self, obj):
+                body = json.dumps(obj).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def load(self, model: str, seconds: float) -> None:
+        with self._lock:
+            if model in self.loaded:
+                return
+        time.sleep(seconds)
+        with self._lock:
+            self.loaded.add(model)
+
+
+def check(name: str, cond: bool) -> None:
+    print(f"{'ok  ' if cond else 'FAIL'} {name}")
+    if not cond:
+        sys.exit(1)
+
+
+def main() -> None:
+    ollama = SlowOllama()
+    # before the server module reads its configuration
+    os.environ.update(OLLAMA_HOST=ollama.url, OLLAMA_HOSTS=ollama.url, OLLAMA_WARMUP="true",
+                      HEALTH_REQUIRE_WARM="true", OLLAMA_WARMUP_RETRY="0.2", OLLAMA_MODEL="gen-model",
+                      EMBED_MODEL="embed-model", RAG_DB_URL="", EAGER_INIT="false")
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from fastapi.testclient import TestClient
+    from LLM_Bridge.server import app
+
+    seen = []  # (seconds since start, status code, status, models loaded in the stub)
+    t0 = time.monotonic()
+    with TestClient(app) as client:  # runs the lifespan, which starts the warm-up threads
+        while time.monotonic() - t0 < GEN_LOAD + EMBED_LOAD + 10:
+            r = client.get("/api/health")
+            seen.append((time.monotonic() - t0, r.status_code, r.json()["status"], set(ollama.loaded)))
+            if r.status_code == 200:
+                break
+            time.sleep(0.1)
+
+    first = seen[0]
+    check("503 'warming' while the models load", first[1] == 503 and first[2] == "warming")
+    check("still 503 with only the chat model loaded",
+          any(code == 503 and loaded == {"gen-model"} for _, code, _, loaded in seen))
+    last = seen[-1]
+    check("200 'ok' once both models are loaded",
+          last[1] == 200 and last[2] == "ok" and last[3] == {"gen-model", "embed-model"})
+    print(f"ready after {last[0]:.1f}s ({len(seen)} health calls)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,307 @@
+# LLM_Bridge/profiling.py
+# On-demand diagnostics for the live server (admin endpoints in server.py):
+#   - sampling CPU profiler: for N seconds (all threads) or the next N requests (only
+#     the threads serving them); exported as collapsed stacks, the input format of
+#     flamegraph.pl and speedscope
+#   - slow-request log: per-endpoint threshold, with a breakdown by stage
+#   - tracemalloc snapshots diffed against the previous one
+# Nothing runs unless switched on: request() and lap() only check a module flag
+# and return a shared no-op object, and the sampler/tracemalloc are not started.
+import os
+import sys
+import time
+import functools
+import threading
+import tracemalloc
+from collections import Counter, deque
+from typing import Dict, List, Optional
+
+SLOW_REQUEST_MS = float(os.getenv("SLOW_REQUEST_MS", "0"))  # 0 = off
+# per-endpoint thresholds, e.g. "/api/chat=1500,/api/chat/batch=60000"
+SLOW_REQUEST_THRESHOLDS = os.getenv("SLOW_REQUEST_THRESHOLDS", "")
+SLOW_LOG_SIZE = int(os.getenv("SLOW_LOG_SIZE", "100"))
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+PROFILE_MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", "120"))
+
+# leaf frames of a thread that is parked, not working
+_IDLE_FILES = ("threading.py", "selectors.py", "queue.py", "thread.py")
+
+
+def _parse_thresholds(spec: str) -> Dict[str, float]:
+    out = {}
+    for part in filter(None, (p.strip() for p in spec.split(","))):
+        path, _, ms = part.rpartition("=")
+        out[path] = float(ms)
+    return out
+
+
+_thresholds: Dict[str, float] = _parse_thresholds(SLOW_REQUEST_THRESHOLDS)
+_slow_default = SLOW_REQUEST_MS
+_slow_log: deque = deque(maxlen=SLOW_LOG_SIZE)
+_local = threading.local()
+_lock = threading.Lock()
+_keep_stages = False  # laps wanted by another consumer (query_log.py)
+_active = bool(_slow_default or _thresholds)  # the only thing checked when off
+
+
+class _Null:
+    """Shared no-op returned while profiling is off."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL = _Null()
+
+
+class _Request:
+    def __init__(self, endpoint: str):
+        self.endpoint = endpoint
+        self.stages: List[tuple] = []
+
+    def __enter__(self):
+        self.start = self.last = time.perf_counter()
+        _local.rec = self
+        if _sampler is not None:
+            _sampler.request_started()
+        return self
+
+    def lap(self, stage: str) -> None:
+        now = time.perf_counter()
+        self.stages.append((stage, (now - self.last) * 1000))
+        self.last = now
+
+    def __exit__(self, exc_type, exc, tb):
+        _local.rec = None
+        now = time.perf_counter()
+        if now - self.last > 0.0005:
+            self.stages.append(("other", (now - self.last) * 1000))
+        total_ms = (now - self.start) * 1000
+        limit = _thresholds.get(self.endpoint, _slow_default)
+        if limit and total_ms >= limit:
+            entry = {"endpoint": self.endpoint, "ms": round(total_ms, 1), "at": time.time(),
+                     "error": exc_type.__name__ if exc_type else None,
+                     "stages": {s: round(ms, 1) for s, ms in self.stages}}
+            _slow_log.append(entry)
+            breakdown = " ".join(f"{s}={ms:.0f}ms" for s, ms in self.stages)
+            print(f"[SLOW] {self.endpoint} {total_ms:.0f}ms {breakdown}")
+        if _sampler is not None:
+            _sampler.request_finished()
+        return False
+
+
+def request(endpoint: str):
+    """Context for one request; stage laps inside it go to the slow-request log."""
+    if not _active:
+        return _NULL
+    return _Request(endpoint)
+
+
+def profiled(endpoint: str):
+    """Decorator form of request() for sync route functions."""
+    def deco(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not _active:
+                return fn(*args, **kwargs)
+            with _Request(endpoint):
+                return fn(*args, **kwargs)
+        return wrapper
+    return deco
+
+
+def lap(stage: str) -> None:
+    """Close the current stage of this thread's request (time since the previous lap)."""
+    if not _active:
+        return
+    rec = getattr(_local, "rec", None)
+    if rec is not None:
+        rec.lap(stage)
+
+
+def stages() -> Dict[str, float]:
+    """Stages lapped so far by this thread's request ({} when none is tracked)."""
+    rec = getattr(_local, "rec", None) if _active else None
+    out: Dict[str, float] = {}
+    for s, ms in (rec.stages if rec is not None else []):
+        out[s] = round(out.get(s, 0.0) + ms, 1)
+    return out
+
+
+def keep_stages(on: bool = True) -> None:
+    """Track request stages even when no slow threshold or profile is set."""
+    global _keep_stages
+    with _lock:
+        _keep_stages = on
+        _refresh_active()
+
+
+def _refresh_active() -> None:
+    global _active
+    _active = bool(_slow_default or _thresholds or _sampler is not None or _keep_stages)
+
+
+# ---------------- slow-request log ----------------
+def set_slow_threshold(ms: float, endpoint: Optional[str] = None) -> Dict:
+    """ms=0 turns logging off for the endpoint (or the default when endpoint is None)."""
+    global _slow_default
+    with _lock:
+        if endpoint is None:
+            _slow_default = ms
+        elif ms:
+            _thresholds[endpoint] = ms
+        else:
+            _thresholds.pop(endpoint, None)
+        _refresh_active()
+    return slow_config()
+
+
+def slow_config() -> Dict:
+    return {"default_ms": _slow_default, "endpoints": dict(_thresholds)}
+
+
+def slow_requests() -> List[Dict]:
+    return list(_slow_log)
+
+
+# ---------------- sampling profiler ----------------
+def _frame_name(code) -> str:
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class Sampler:
+    """
+    Walks sys._current_frames() every interval and counts root-to-leaf stacks.
+    requests=N: only threads inside request() are sampled, and sampling stops after
+    N of them finish; otherwise every non-idle thread is sampled for `seconds`.
+    """
+
+    def __init__(self, seconds: float, requests: int = 0, interval_ms: float = PROFILE_INTERVAL_MS):
+        self.seconds = seconds
+        self.requests = requests
+        self.interval = interval_ms / 1000.0
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self.finished_requests = 0
+        self._threads: Dict[int, int] = {}  # thread id -> open requests
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+
+    def request_started(self) -> None:
+        tid = threading.get_ident()
+        with self._lock:
+            self._threads[tid] = self._threads.get(tid, 0) + 1
+
+    def request_finished(self) -> None:
+        tid = threading.get_ident()
+        with self._lock:
+            n = self._threads.get(tid, 0) - 1
+            if n > 0:
+                self._threads[tid] = n
+            else:
+                self._threads.pop(tid, None)
+            self.finished_requests += 1
+            if self.requests and self.finished_requests >= self.requests:
+                self._done.set()
+
+    def _sample(self, me: int) -> None:
+        frames = sys._current_frames()
+        if self.requests:
+            with self._lock:
+                tids = [t for t in self._threads if t in frames]
+        else:
+            tids = [t for t in frames if t != me]
+        for tid in tids:
+            frame = frames[tid]
+            if not self.requests and os.path.basename(frame.f_code.co_filename) in _IDLE_FILES:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(_frame_name(frame.f_code))
+                frame = frame.f_back
+            self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def run(self) -> None:
+        me = threading.get_ident()
+        deadline = time.monotonic() + self.seconds
+        while not self._done.is_set() and time.monotonic() < deadline:
+            self._sample(me)
+            self._done.wait(self.interval)
+
+    def collapsed(self) -> str:
+        return "".join(f"{stack} {n}\n" for stack, n in self.stacks.most_common())
+
+
+_sampler: Optional[Sampler] = None
+_sampler_lock = threading.Lock()
+
+
+def profile_cpu(seconds: float = 10, requests: int = 0) -> Sampler:
+    """Run one capture on the calling thread (blocks) and return it. One capture at a time."""
+    global _sampler
+    seconds = min(seconds, PROFILE_MAX_SECONDS)
+    if not _sampler_lock.acquire(blocking=False):
+        raise RuntimeError("a CPU profile is already running")
+    try:
+        sampler = Sampler(seconds, requests)
+        with _lock:
+            _sampler = sampler
+            _refresh_active()
+        try:
+            sampler.run()
+        finally:
+            with _lock:
+                _sampler = None
+                _refresh_active()
+        return sampler
+    finally:
+        _sampler_lock.release()
+
+
+# ---------------- memory ----------------
+_last_snapshot: Optional[tracemalloc.Snapshot] = None
+
+
+def memory_start(frames: int = 10) -> Dict:
+    global _last_snapshot
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(frames)
+        _last_snapshot = None
+    return memory_status()
+
+
+def memory_stop() -> Dict:
+    global _last_snapshot
+    tracemalloc.stop()
+    _last_snapshot = None
+    return memory_status()
+
+
+def memory_status() -> Dict:
+    tracing = tracemalloc.is_tracing()
+    current, peak = tracemalloc.get_traced_memory() if tracing else (0, 0)
+    return {"tracing": tracing, "traced_bytes": current, "peak_bytes": peak}
+
+
+def memory_snapshot(top: int = 25, group_by: str = "lineno") -> Dict:
+    """Largest allocation sites, and growth since the previous snapshot."""
+    global _last_snapshot
+    if not tracemalloc.is_tracing():
+        raise RuntimeError("tracemalloc is not running; start it first")
+    snap = tracemalloc.take_snapshot().filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    ))
+    out = memory_status()
+    out["top"] = [{"where": str(s.traceback), "bytes": s.size, "count": s.count}
+                  for s in snap.statistics(group_by)[:top]]
+    if _last_snapshot is not None:
+        out["growth"] = [{"where": str(d.traceback), "bytes": d.size, "delta_bytes": d.size_diff,
+                          "count": d.count, "delta_count": d.count_diff}
+                         for d in snap.compare_to(_last_snapshot, group_by)[:top]]
+    _last_snapshot = snap
+    return out
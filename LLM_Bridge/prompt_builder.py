@@ -0,0 +1,155 @@
+# LLM_Bridge/prompt_builder.py
+# Token-budgeted prompts with a byte-identical prefix.
+#
+# The system message and few-shot exchange are rendered once into `prefix`; only the
+# last (question + snippets) message varies. Ollama reuses the KV cache for the
+# longest matching token prefix of the previous prompt, so keeping that part
+# stable means it is evaluated once per loaded model, not once per request.
+import os
+import re
+import threading
+from typing import Dict, List, Optional, Sequence, Tuple
+
+NUM_CTX = int(os.getenv("OLLAMA_NUM_CTX", "4096"))        # context window requested from Ollama
+NUM_PREDICT = int(os.getenv("OLLAMA_NUM_PREDICT", "512"))  # tokens reserved for the answer
+MIN_SNIPPET_TOKENS = int(os.getenv("PROMPT_MIN_SNIPPET_TOKENS", "40"))
+MAX_SNIPPET_TOKENS = int(os.getenv("PROMPT_MAX_SNIPPET_TOKENS", "200"))  # ~700 chars, as before
+# Optional HF tokenizer.json for the target model; otherwise ~CHARS_PER_TOKEN estimate
+TOKENIZER_PATH = os.getenv("PROMPT_TOKENIZER_PATH")
+CHARS_PER_TOKEN = float(os.getenv("PROMPT_CHARS_PER_TOKEN", "3.6"))
+
+# Same role labels LangChain uses when an LLM (completion) model gets chat messages
+_ROLE = {"system": "System", "user": "Human", "human": "Human", "assistant": "AI", "ai": "AI"}
+
+_tokenizer = None
+_tokenizer_lock = threading.Lock()
+
+
+def _get_tokenizer():
+    global _tokenizer
+    if _tokenizer is None and TOKENIZER_PATH:
+        with _tokenizer_lock:
+            if _tokenizer is None:
+                from tokenizers import Tokenizer
+                _tokenizer = Tokenizer.from_file(TOKENIZER_PATH)
+    return _tokenizer
+
+
+def count_tokens(text: str) -> int:
+    tok = _get_tokenizer()
+    if tok is not None:
+        return len(tok.encode(text, add_special_tokens=False).ids)
+    return int(len(text) / CHARS_PER_TOKEN) + 1
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Cut text to at most max_tokens, at a word boundary, marking the cut with '...'."""
+    if count_tokens(text) <= max_tokens:
+        return text
+    tok = _get_tokenizer()
+    if tok is not None:
+        enc = tok.encode(text, add_special_tokens=False)
+        cut = enc.offsets[max(0, max_tokens - 1)][0]
+    else:
+        cut = int(max_tokens * CHARS_PER_TOKEN)
+    head = text[:cut]
+    space = head.rfind(" ")
+    if space > cut * 0.6:
+        head = head[:space]
+    return head.rstrip() + "..."
+
+
+def _render(role: str, content: str) -> str:
+    return f"{_ROLE.get(role, role.capitalize())}: {content}"
+
+
+class PromptBuilder:
+    """
+    messages: [(role, text), ...] as for ChatPromptTemplate.from_messages; every
+    message but the last is fixed, the last is a str.format template with
+    {question} and {snippets}.
+    """
+
+    def __init__(self, messages: Sequence[Tuple[str, str]], num_ctx: int = NUM_CTX, num_predict: int = NUM_PREDICT):
+        *fixed, (self._role, self._template) = messages
+        self.prefix = "\n".join(_render(r, t) for r, t in fixed) + "\n"
+        self.num_ctx = num_ctx
+        self.num_predict = num_predict
+        self._prefix_tokens = None
+
+    @property
+    def prefix_tokens(self) -> int:
+        if self._prefix_tokens is None:
+            self._prefix_tokens = count_tokens(self.prefix)
+        return self._prefix_tokens
+
+    def _fit_snippets(self, rows: Sequence[Dict], budget: int) -> Tuple[List[str], List[int]]:
+        """Share the budget across snippets in rank order; drop those left with too little."""
+        blocks: List[str] = []
+        used: List[int] = []
+        for n, r in enumerate(rows):
+            title = r.get("title") or (r.get("url") or "Untitled")
+            url = r.get("url")
+            head = f"[{len(blocks) + 1}] {title} — "
+            tail = f" ({url})"
+            overhead = count_tokens(head + tail) + 2
+            share = min(MAX_SNIPPET_TOKENS, budget // (len(rows) - n) - overhead)
+            if share < MIN_SNIPPET_TOKENS:
+                continue
+            body = truncate_to_tokens(re.sub(r"\s+", " ", r.get("content", "")).strip(), share)
+            block = head + body + tail
+            budget -= count_tokens(block) + 2
+            blocks.append(block)
+            used.append(n)
+        return blocks, used
+
+    def build(self, question: str, rows: Sequence[Dict]) -> Tuple[str, Dict]:
+        """
+        Return (prompt, stats). stats["used"] are the indexes of the rows that made it
+        into the prompt, in citation order ([1] is rows[used[0]]).
+        """
+        empty = _render(self._role, self._template.format(question=question, snippets=""))
+        fixed = self.prefix_tokens + count_tokens(empty)
+        budget = max(0, self.num_ctx - self.num_predict - fixed)
+        blocks, used = self._fit_snippets(rows, budget)
+        suffix = _render(self._role, self._template.format(question=question, snippets="\n\n".join(blocks)))
+        prompt = self.prefix + suffix
+        stats = {
+            "prefix_tokens": self.prefix_tokens,
+            "prompt_tokens_est": self.prefix_tokens + count_tokens(suffix),
+            "snippets": len(blocks),
+            "used": used,
+            "snippet_budget": budget,
+        }
+        return prompt, stats
+
+
+# ---------------- Ollama token metrics ----------------
+_metrics_lock = threading.Lock()
+_metrics = {"calls": 0, "prompt_eval_count": 0, "eval_count": 0,
+            "prompt_eval_ms": 0.0, "eval_ms": 0.0, "load_ms": 0.0, "prompt_tokens_est": 0}
+
+
+def record_generation(info: Optional[Dict], prompt_tokens_est: int = 0) -> None:
+    """Accumulate the counters Ollama returns with the final (done) response."""
+    info = info or {}
+    with _metrics_lock:
+        _metrics["calls"] += 1
+        _metrics["prompt_eval_count"] += int(info.get("prompt_eval_count") or 0)
+        _metrics["eval_count"] += int(info.get("eval_count") or 0)
+        _metrics["prompt_eval_ms"] += (info.get("prompt_eval_duration") or 0) / 1e6
+        _metrics["eval_ms"] += (info.get("eval_duration") or 0) / 1e6
+        _metrics["load_ms"] += (info.get("load_duration") or 0) / 1e6
+        _metrics["prompt_tokens_est"] += prompt_tokens_est
+
+
+def metrics() -> Dict:
+    with _metrics_lock:
+        m = dict(_metrics)
+    n = m["calls"] or 1
+    m["avg_prompt_eval_count"] = m["prompt_eval_count"] / n
+    m["avg_eval_count"] = m["eval_count"] / n
+    # prompt_eval_count only counts tokens Ollama had to evaluate; the gap to the
+    # estimate is what the cached prefix saved
+    m["avg_prompt_tokens_est"] = m["prompt_tokens_est"] / n
+    return m
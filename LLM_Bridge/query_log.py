@@ -0,0 +1,187 @@
+# LLM_Bridge/query_log.py
+# Opt-in traffic log for tuning caches, thresholds and concurrency: one line per
+# /api/chat request with the time, normalized query, top KB score, the path that
+# produced the answer (cache | kb | fallback | busy) and the stage timings.
+#
+#   QUERY_LOG_DIR=/var/log/flexbo/queries   on; unset = off (log() returns at once)
+#
+# The request thread only puts a dict on a bounded queue (dropped and counted when
+# full); a writer thread appends them as NDJSON to gzip segments
+# queries-YYYYmmdd-HHMMSS.ndjson.gz, rotated by size or age, keeping the newest
+# QUERY_LOG_KEEP. The open segment is flushed every batch, so it can be read
+# (read() stops at its unfinished end) while the server runs.
+# Replay with query_replay.py.
+import os
+import glob
+import gzip
+import json
+import time
+import zlib
+import queue
+import threading
+from typing import Dict, Iterator, List, Optional
+
+try:
+    from .answer_store import normalize
+except ImportError:  # run as a script (query_replay.py)
+    from answer_store import normalize
+
+QUERY_LOG_DIR = os.getenv("QUERY_LOG_DIR", "")
+QUERY_LOG_MAX_MB = float(os.getenv("QUERY_LOG_MAX_MB", "64"))          # uncompressed size per segment
+QUERY_LOG_ROTATE_HOURS = float(os.getenv("QUERY_LOG_ROTATE_HOURS", "24"))
+QUERY_LOG_KEEP = int(os.getenv("QUERY_LOG_KEEP", "14"))                # segments kept
+QUERY_LOG_QUEUE = int(os.getenv("QUERY_LOG_QUEUE", "10000"))
+
+_PATTERN = "queries-*.ndjson.gz"
+
+
+class QueryLog:
+    """Bounded queue in front of a writer thread that owns the gzip segments."""
+
+    def __init__(self, directory: str, max_mb: float = QUERY_LOG_MAX_MB,
+                 rotate_hours: float = QUERY_LOG_ROTATE_HOURS, keep: int = QUERY_LOG_KEEP,
+                 queue_size: int = QUERY_LOG_QUEUE):
+        self.directory = directory
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.rotate_seconds = rotate_hours * 3600
+        self.keep = keep
+        self._queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self._file = None
+        self._opened = 0.0
+        self._bytes = 0
+        self._thread: Optional[threading.Thread] = None
+        self._drop_lock = threading.Lock()
+        self.stats = {"logged": 0, "dropped": 0, "segments": 0, "errors": 0}
+
+    # ---- request thread ----
+    def put(self, record: Dict) -> None:
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            with self._drop_lock:
+                self.stats["dropped"] += 1
+
+    # ---- writer thread ----
+    def _open(self) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        name = time.strftime("queries-%Y%m%d-%H%M%S.ndjson.gz")
+        path = os.path.join(self.directory, name)
+        n = 1
+        while os.path.exists(path):  # two rotations within one second
+            path = os.path.join(self.directory, name.replace(".ndjson", f"-{n}.ndjson"))
+            n += 1
+        self._file = gzip.open(path, "wb", compresslevel=6)
+        self._opened = time.time()
+        self._bytes = 0
+        self.stats["segments"] += 1
+        old = sorted(glob.glob(os.path.join(self.directory, _PATTERN)), key=os.path.getmtime)
+        for stale in old[:-self.keep] if self.keep > 0 else []:
+            try:
+                os.remove(stale)
+            except OSError:
+                pass
+
+    def _close(self) -> None:
+        if self._file is not None:
+            self._file.close()  # writes the gzip trailer
+            self._file = None
+
+    def _write(self, batch: List[Dict]) -> None:
+        if self._file is None or self._bytes >= self.max_bytes or time.time() - self._opened >= self.rotate_seconds:
+            self._close()
+            self._open()
+        data = "".join(json.dumps(r, ensure_ascii=False, separators=(",", ":")) + "\n" for r in batch).encode("utf-8")
+        self._file.write(data)
+        self._file.flush(zlib.Z_SYNC_FLUSH)  # complete lines readable from the open segment
+        self._bytes += len(data)
+        self.stats["logged"] += len(batch)
+
+    def _run(self) -> None:
+        while True:
+            record = self._queue.get()
+            if record is None:
+                break
+            batch = [record]
+            stop = False
+            while len(batch) < 500:
+                try:
+                    nxt = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if nxt is None:
+                    stop = True
+                    break
+                batch.append(nxt)
+            try:
+                self._write(batch)
+            except Exception as e:
+                self.stats["errors"] += 1
+                print(f"[QUERY LOG] write failed: {e}")
+                self._close()
+            if stop:
+                break
+        self._close()
+
+    def start(self) -> None:
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="query-log", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        if self._thread is not None:
+            self._queue.put(None)  # after everything already queued
+            self._thread.join(timeout=10)
+            self._thread = None
+
+
+_log: Optional[QueryLog] = QueryLog(QUERY_LOG_DIR) if QUERY_LOG_DIR else None
+
+
+def enabled() -> bool:
+    return _log is not None
+
+
+def start() -> None:
+    if _log is not None:
+        _log.start()
+
+
+def stop() -> None:
+    if _log is not None:
+        _log.stop()
+
+
+def log(query: str, path: str, top_score: Optional[float], ms: float, stages: Dict[str, float]) -> None:
+    """Queue one chat request; a no-op when QUERY_LOG_DIR is unset."""
+    if _log is None:
+        return
+    _log.put({"ts": round(time.time(), 3), "q": normalize(query), "path": path,
+              "score": None if top_score is None else round(top_score, 4),
+              "ms": round(ms, 1), "stages": stages})
+
+
+def stats() -> Optional[Dict]:
+    if _log is None:
+        return None
+    return {**_log.stats, "queued": _log._queue.qsize(), "dir": _log.directory}
+
+
+# ---------------- reading ----------------
+def segments(location: str) -> List[str]:
+    """A segment file, or every segment in a directory, oldest first."""
+    if os.path.isdir(location):
+        return sorted(glob.glob(os.path.join(location, _PATTERN)), key=os.path.getmtime)
+    return [location]
+
+
+def read(location: str) -> Iterator[Dict]:
+    """Records from one segment or a directory of them, in file order."""
+    for path in segments(location):
+        opener = gzip.open if path.endswith(".gz") else open
+        with opener(path, "rt", encoding="utf-8") as f:
+            try:
+                for line in f:
+                    if line.endswith("\n"):
+                        yield json.loads(line)
+            except EOFError:
+                pass  # the segment being written has no gzip trailer yet
@@ -0,0 +1,132 @@
+# LLM_Bridge/query_replay.py
+# Re-drive recorded /api/chat traffic (query_log.py) against a server, keeping the
+# original arrival pattern, to measure capacity under realistic load.
+#
+#   python LLM_Bridge/query_replay.py /var/log/flexbo/queries                 # original timing
+#   python LLM_Bridge/query_replay.py queries-20261019-000000.ndjson.gz --speed 4
+#   python LLM_Bridge/query_replay.py /var/log/flexbo/queries --rate 10 --limit 500
+#
+# Requests are sent open-loop: each is due at (recorded offset / speed) and does not
+# wait for earlier answers; "late" is how far the sender fell behind schedule (more
+# callers than --max-inflight). Each call is reported against the path the query took
+# when it was recorded (cache / kb / fallback / busy). The server applies its own rate
+# limits: replay with an exempt key (RATE_KEY_OVERRIDES) or RATE_LIMIT=false.
+import os
+import time
+import argparse
+import threading
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+import requests
+
+try:
+    from .query_log import read
+except ImportError:  # run as a script: python LLM_Bridge/query_replay.py
+    from query_log import read
+
+URL = os.getenv("CHAT_API_URL", "http://localhost:8000/api/chat")
+
+
+def _pct(values: List[float], p: float) -> float:
+    values = sorted(values) or [0.0]
+    return values[min(len(values) - 1, int(p * len(values)))]
+
+
+def load(location: str, limit: int = 0, skip_busy: bool = False) -> List[Dict]:
+    records = [r for r in read(location) if r.get("q") and not (skip_busy and r.get("path") == "busy")]
+    records.sort(key=lambda r: r["ts"])
+    return records[:limit] if limit else records
+
+
+def replay(records: List[Dict], url: str, speed: float = 1.0, rate: float = 0.0,
+           max_inflight: int = 64, timeout: float = 300, api_key: str = "") -> Dict:
+    local = threading.local()
+    results: List[Dict] = []
+    lock = threading.Lock()
+    headers = {"x-api-key": api_key} if api_key else {}
+
+    def call(rec: Dict, due: float) -> None:
+        session = getattr(local, "session", None)
+        if session is None:
+            session = local.session = requests.Session()
+        t0 = time.perf_counter()
+        try:
+            status = session.post(url, json={"message": rec["q"]}, headers=headers, timeout=timeout).status_code
+        except requests.RequestException:
+            status = 0
+        out = {"status": status, "s": time.perf_counter() - t0, "late": t0 - due,
+               "path": rec.get("path") or "-", "recorded_ms": rec.get("ms")}
+        with lock:
+            results.append(out)
+
+    ts0 = records[0]["ts"] if records else 0.0
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max_inflight) as pool:
+        for i, rec in enumerate(records):
+            offset = i / rate if rate else (rec["ts"] - ts0) / speed
+            due = start + offset
+            delay = due - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            pool.submit(call, rec, due)
+        sending = time.perf_counter() - start
+    wall = time.perf_counter() - start
+
+    ok = [r for r in results if r["status"] == 200]
+    by_path = defaultdict(list)
+    for r in ok:
+        by_path[r["path"]].append(r["s"])
+    recorded_s = (records[-1]["ts"] - ts0) if records else 0.0
+    return {
+        "requests": len(results),
+        "ok": len(ok),
+        "status": dict(Counter(r["status"] for r in results)),
+        "wall_s": wall,
+        "recorded_s": recorded_s,
+        "offered_rps": (len(records) - 1) / max(sending, 1e-9) if len(records) > 1 else None,
+        "ok_rps": len(ok) / max(wall, 1e-9),
+        "p50_s": _pct([r["s"] for r in ok], 0.50),
+        "p95_s": _pct([r["s"] for r in ok], 0.95),
+        "p99_s": _pct([r["s"] for r in ok], 0.99),
+        "late_p95_s": _pct([r["late"] for r in results], 0.95),
+        "by_path": {p: {"n": len(v), "p50_s": _pct(v, 0.5), "p95_s": _pct(v, 0.95),
+                        "recorded_p50_s": _pct([r["recorded_ms"] / 1000 for r in ok
+                                                if r["path"] == p and r["recorded_ms"] is not None], 0.5)}
+                    for p, v in sorted(by_path.items())},
+    }
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Replay a query_log.py capture against /api/chat")
+    ap.add_argument("log", help="a queries-*.ndjson.gz segment or the QUERY_LOG_DIR directory")
+    ap.add_argument("--url", default=URL)
+    ap.add_argument("--speed", type=float, default=1.0, help="time compression: 2 = twice as fast")
+    ap.add_argument("--rate", type=float, default=0.0, help="ignore recorded timing, send N req/s")
+    ap.add_argument("--limit", type=int, default=0, help="first N recorded queries only")
+    ap.add_argument("--max-inflight", type=int, default=64)
+    ap.add_argument("--skip-busy", action="store_true", help="leave out queries that got 503 when recorded")
+    ap.add_argument("--timeout", type=float, default=300)
+    ap.add_argument("--api-key", default=os.getenv("API_KEY", ""))
+    args = ap.parse_args()
+
+    records = load(args.log, args.limit, args.skip_busy)
+    if not records:
+        raise SystemExit("no queries in the log")
+    span = records[-1]["ts"] - records[0]["ts"]
+    mode = f"{args.rate:g} req/s" if args.rate else f"x{args.speed:g} ({span / args.speed:.0f}s)"
+    print(f"replaying {len(records)} queries recorded over {span:.0f}s at {mode} -> {args.url}")
+
+    r = replay(records, args.url, args.speed, args.rate, args.max_inflight, args.timeout, args.api_key)
+    print(f"ok {r['ok']}/{r['requests']}  status {r['status']}  wall {r['wall_s']:.1f}s")
+    offered = f"{r['offered_rps']:.2f}" if r["offered_rps"] is not None else "-"
+    print(f"offered {offered} req/s  served {r['ok_rps']:.2f} req/s  "
+          f"p50 {r['p50_s']:.2f}s  p95 {r['p95_s']:.2f}s  p99 {r['p99_s']:.2f}s  sender late p95 {r['late_p95_s']:.2f}s")
+    print(f"{'path':>9} {'n':>6} {'p50 s':>7} {'p95 s':>7} {'recorded p50 s':>15}")
+    for path, s in r["by_path"].items():
+        print(f"{path:>9} {s['n']:>6} {s['p50_s']:>7.2f} {s['p95_s']:>7.2f} {s['recorded_p50_s']:>15.2f}")
+
+
+if __name__ == "__main__":
+    main()
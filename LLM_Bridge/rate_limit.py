@@ -0,0 +1,287 @@
+# LLM_Bridge/rate_limit.py
+# Per-client admission control for the LLM endpoints.
+#   1) token buckets  - per API key and per client IP; a rejected request gets 429 with
+#                       Retry-After (seconds until a token is available)
+#   2) fair scheduler - at most GEN_SLOTS generations run at once; queued generations
+#                       of different clients take turns (fair queuing), so one busy
+#                       client (or a batch) can't starve the others
+# Buckets live in process memory; RATE_LIMIT_REDIS_URL shares them across workers/hosts.
+import os
+import math
+import time
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+
+RATE_LIMIT = os.getenv("RATE_LIMIT", "false").lower() == "true"
+# requests per minute / burst size; 0 = unlimited
+RATE_IP_RPM = float(os.getenv("RATE_IP_RPM", "20"))
+RATE_IP_BURST = int(os.getenv("RATE_IP_BURST", "10"))
+RATE_KEY_RPM = float(os.getenv("RATE_KEY_RPM", "0"))   # the widget key is shared: off by default
+RATE_KEY_BURST = int(os.getenv("RATE_KEY_BURST", "60"))
+# per-key overrides, e.g. "backoffice-key=600,partner-key=120"
+RATE_KEY_OVERRIDES = os.getenv("RATE_KEY_OVERRIDES", "")
+# a cost above the burst (a large batch) leaves the bucket in debt for at most this long
+RATE_MAX_DEBT_SECONDS = float(os.getenv("RATE_MAX_DEBT_SECONDS", "60"))
+# behind a reverse proxy: take the client IP from the first X-Forwarded-For hop
+RATE_TRUST_FORWARDED = os.getenv("RATE_TRUST_FORWARDED", "false").lower() == "true"
+RATE_LIMIT_REDIS_URL = os.getenv("RATE_LIMIT_REDIS_URL")
+
+GEN_SLOTS = int(os.getenv("GEN_SLOTS", "4"))                      # concurrent generations
+GEN_QUEUE_TIMEOUT = float(os.getenv("GEN_QUEUE_TIMEOUT", "60"))  # seconds waiting for a slot
+
+_PRUNE_SECONDS = 600  # how often local buckets that have refilled are dropped
+_warned_forwarded = False
+
+
+class RateLimited(Exception):
+    def __init__(self, scope: str, retry_after: float):
+        super().__init__(f"rate limit exceeded ({scope})")
+        self.scope = scope
+        self.retry_after = max(1, math.ceil(retry_after))
+
+
+class QueueTimeout(Exception):
+    def __init__(self, retry_after: float):
+        super().__init__("no generation slot available")
+        self.retry_after = max(1, math.ceil(retry_after))
+
+
+def _parse_overrides(spec: str) -> Dict[str, float]:
+    out = {}
+    for part in filter(None, (p.strip() for p in spec.split(","))):
+        key, _, rpm = part.rpartition("=")
+        out[key] = float(rpm)
+    return out
+
+
+# ---------------- Token buckets ----------------
+# take() checks every bucket of a request before it charges any, so a request refused
+# by its IP bucket doesn't also use up its API key's tokens. A cost above the burst
+# (a large batch) is admitted once the bucket is full and leaves it in debt, which
+# later requests wait out; the debt is capped at RATE_MAX_DEBT_SECONDS of refill.
+Bucket = Tuple[str, float, int]  # (key, tokens per second, burst)
+
+
+class LocalBuckets:
+    def __init__(self, max_debt: float = RATE_MAX_DEBT_SECONDS):
+        self.max_debt = max_debt
+        self._buckets: Dict[str, Tuple[float, float, float]] = {}  # key -> (tokens, updated, full at)
+        self._lock = threading.Lock()
+        self._last_prune = time.monotonic()
+
+    def take(self, buckets: List[Bucket], cost: float = 1.0) -> Tuple[int, float]:
+        """Take `cost` from all buckets or none: (-1, 0) on success, else (index of the
+        first bucket short of tokens, seconds until it has them)."""
+        now = time.monotonic()
+        with self._lock:
+            levels = []
+            for key, rate, burst in buckets:
+                tokens, updated, _ = self._buckets.get(key, (float(burst), now, now))
+                levels.append(min(float(burst), tokens + (now - updated) * rate))
+            for i, (key, rate, burst) in enumerate(buckets):
+                need = min(cost, burst)
+                if levels[i] < need:
+                    return i, (need - levels[i]) / rate
+            for (key, rate, burst), tokens in zip(buckets, levels):
+                left = max(tokens - cost, -rate * self.max_debt)
+                self._buckets[key] = (left, now, now + (burst - left) / rate)
+            if now - self._last_prune > _PRUNE_SECONDS:
+                # a full bucket is the same as no bucket; one still in debt is kept
+                self._buckets = {k: v for k, v in self._buckets.items() if v[2] > now}
+                self._last_prune = now
+        return -1, 0.0
+
+
+# Same algorithm as LocalBuckets, atomic in Redis.
+# KEYS = buckets, ARGV = cost, now, max debt seconds, then rate, burst for each bucket;
+# returns {index (0 = ok), wait}
+_REDIS_TAKE = """
+local cost, now, max_debt = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+local levels = {}
+for i = 1, #KEYS do
+  local rate, burst = tonumber(ARGV[2 * i + 2]), tonumber(ARGV[2 * i + 3])
+  local b = redis.call('HMGET', KEYS[i], 't', 'u')
+  local tokens = tonumber(b[1]) or burst
+  local updated = tonumber(b[2]) or now
+  levels[i] = math.min(burst, tokens + math.max(0, now - updated) * rate)
+end
+for i = 1, #KEYS do
+  local rate, burst = tonumber(ARGV[2 * i + 2]), tonumber(ARGV[2 * i + 3])
+  local need = math.min(cost, burst)
+  if levels[i] < need then return {i, tostring((need - levels[i]) / rate)} end
+end
+for i = 1, #KEYS do
+  local rate, burst = tonumber(ARGV[2 * i + 2]), tonumber(ARGV[2 * i + 3])
+  local left = math.max(levels[i] - cost, -rate * max_debt)
+  redis.call('HSET', KEYS[i], 't', left, 'u', now)
+  redis.call('EXPIRE', KEYS[i], math.ceil((burst - left) / rate) + 60)
+end
+return {0, '0'}
+"""
+
+
+class RedisBuckets:
+    def __init__(self, url: str, max_debt: float = RATE_MAX_DEBT_SECONDS):
+        import redis  # optional dependency, only with RATE_LIMIT_REDIS_URL
+        self.max_debt = max_debt
+        self._redis = redis.Redis.from_url(url, socket_timeout=0.5)
+        self._take = self._redis.register_script(_REDIS_TAKE)
+        self._fallback = LocalBuckets(max_debt)
+
+    def take(self, buckets: List[Bucket], cost: float = 1.0) -> Tuple[int, float]:
+        args = [cost, time.time(), self.max_debt]
+        for _, rate, burst in buckets:
+            args += [rate, burst]
+        try:
+            index, wait = self._take(keys=[f"ratelimit:{b[0]}" for b in buckets], args=args)
+            return int(index) - 1, float(wait)
+        except Exception as e:
+            # Redis down: keep limiting per process rather than failing every request
+            print(f"[RATE LIMIT] redis: {e}")
+            return self._fallback.take(buckets, cost)
+
+
+class RateLimiter:
+    def __init__(self, backend=None, ip_rpm: float = RATE_IP_RPM, ip_burst: int = RATE_IP_BURST,
+                 key_rpm: float = RATE_KEY_RPM, key_burst: int = RATE_KEY_BURST,
+                 key_overrides: Optional[Dict[str, float]] = None):
+        self.backend = backend or LocalBuckets()
+        self.ip = (ip_rpm / 60.0, ip_burst)
+        self.key = (key_rpm / 60.0, key_burst)
+        self.key_overrides = key_overrides or {}
+        self._lock = threading.Lock()
+        self._stats = {"allowed": 0, "rejected_ip": 0, "rejected_key": 0}
+
+    def check(self, api_key: Optional[str], ip: str, cost: float = 1.0) -> None:
+        """Charge `cost` to the key's and the IP's bucket, or raise RateLimited and charge neither."""
+        scopes, buckets = [], []
+        if api_key:
+            rpm = self.key_overrides.get(api_key)
+            rate = rpm / 60.0 if rpm is not None else self.key[0]
+            if rate > 0:
+                scopes.append("key")
+                buckets.append((f"key:{api_key}", rate, self.key[1]))
+        if self.ip[0] > 0:
+            scopes.append("ip")
+            buckets.append((f"ip:{ip}", self.ip[0], self.ip[1]))
+        if buckets:
+            index, wait = self.backend.take(buckets, cost)
+            if index >= 0:
+                with self._lock:
+                    self._stats[f"rejected_{scopes[index]}"] += 1
+                raise RateLimited(scopes[index], wait)
+        with self._lock:
+            self._stats["allowed"] += 1
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return dict(self._stats)
+
+
+# ---------------- Fair-share generation scheduler ----------------
+class FairScheduler:
+    """
+    Counting semaphore with start-time fair queuing: each waiter is tagged one past
+    the later of its client's previous tag and the tag last granted, so queued
+    requests from different clients interleave instead of running in arrival order.
+    Fewer running generations for the client wins first, then the tag, then arrival.
+    """
+
+    def __init__(self, slots: int = GEN_SLOTS):
+        self.slots = slots
+        self._running: Dict[str, int] = {}
+        self._waiting: List[Tuple[int, int, str]] = []  # (tag, arrival seq, client)
+        self._last_tag: Dict[str, int] = {}
+        self._vclock = 0  # tag of the last granted waiter
+        self._seq = 0
+        self._cond = threading.Condition()
+        self._stats = {"granted": 0, "timeouts": 0, "wait_ms_total": 0.0, "wait_ms_max": 0.0}
+
+    def _in_use(self) -> int:
+        return sum(self._running.values())
+
+    def _next(self) -> Tuple[int, int, str]:
+        return min(self._waiting, key=lambda w: (self._running.get(w[2], 0), w[0], w[1]))
+
+    @contextmanager
+    def slot(self, client: str, timeout: Optional[float] = GEN_QUEUE_TIMEOUT) -> Iterator[None]:
+        if self.slots <= 0:
+            yield
+            return
+        t0 = time.monotonic()
+        deadline = None if timeout is None else t0 + timeout
+        with self._cond:
+            self._seq += 1
+            tag = max(self._vclock, self._last_tag.get(client, 0)) + 1
+            self._last_tag[client] = tag
+            me = (tag, self._seq, client)
+            self._waiting.append(me)
+            try:
+                while not (self._in_use() < self.slots and self._next() == me):
+                    left = None if deadline is None else deadline - time.monotonic()
+                    if left is not None and left <= 0:
+                        self._stats["timeouts"] += 1
+                        raise QueueTimeout(timeout)
+                    self._cond.wait(left)
+            finally:
+                self._waiting.remove(me)
+                # the head of the queue may have changed
+                self._cond.notify_all()
+            self._vclock = max(self._vclock, tag)
+            # tags at or behind the clock carry no history; keep the map small
+            self._last_tag = {c: t for c, t in self._last_tag.items() if t > self._vclock}
+            self._running[client] = self._running.get(client, 0) + 1
+            wait_ms = (time.monotonic() - t0) * 1000
+            self._stats["granted"] += 1
+            self._stats["wait_ms_total"] += wait_ms
+            self._stats["wait_ms_max"] = max(self._stats["wait_ms_max"], wait_ms)
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._running[client] -= 1
+                if not self._running[client]:
+                    del self._running[client]
+                self._cond.notify_all()
+
+    def stats(self) -> Dict:
+        with self._cond:
+            s = dict(self._stats)
+            s.update(slots=self.slots, running=self._in_use(), waiting=len(self._waiting),
+                     clients_running=len(self._running))
+        s["wait_ms_avg"] = s["wait_ms_total"] / (s["granted"] or 1)
+        return s
+
+
+# ---------------- process-wide instances ----------------
+def client_ip(headers, peer: Optional[str]) -> str:
+    global _warned_forwarded
+    fwd = headers.get("x-forwarded-for")
+    if fwd and RATE_TRUST_FORWARDED:
+        return fwd.split(",")[0].strip()
+    if fwd and RATE_LIMIT and not _warned_forwarded:
+        _warned_forwarded = True
+        print(f"[RATE LIMIT] X-Forwarded-For present but RATE_TRUST_FORWARDED=false: every client "
+              f"behind the proxy shares the per-IP bucket of {peer}. Set RATE_TRUST_FORWARDED=true "
+              f"if the proxy is trusted.")
+    return peer or "unknown"
+
+
+def _make_limiter() -> RateLimiter:
+    backend = RedisBuckets(RATE_LIMIT_REDIS_URL) if RATE_LIMIT_REDIS_URL else None
+    return RateLimiter(backend, key_overrides=_parse_overrides(RATE_KEY_OVERRIDES))
+
+
+limiter = _make_limiter() if RATE_LIMIT else None
+scheduler = FairScheduler(GEN_SLOTS)
+
+
+def stats() -> Dict:
+    return {
+        "enabled": RATE_LIMIT,
+        "shared": bool(RATE_LIMIT_REDIS_URL),
+        "trust_forwarded": RATE_TRUST_FORWARDED,
+        "limits": limiter.stats() if limiter else None,
+        "generation_queue": scheduler.stats(),
+    }
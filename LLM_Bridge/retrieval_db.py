@@ -0,0 +1,171 @@
+# LLM_Bridge/retrieval_db.py
+# Read path to Postgres for search_kb: a dedicated engine whose connections are
+# read-only and autocommit (no BEGIN/COMMIT round trips per query), prepare the
+# vector query server-side, and carry the ANN search parameters as session settings.
+# get_write_engine() is the one ordinary (read-write) engine of the process, shared by
+# the admin ingestion publish and the answer store.
+import os
+import time
+import threading
+from contextlib import contextmanager
+from typing import Dict
+
+DB_URL = os.getenv("RAG_DB_URL")
+
+# FastAPI runs sync endpoints on a thread pool of WORKER_THREADS; no more
+# connections than that can ever be in use at once from one worker process.
+WORKER_THREADS = int(os.getenv("WORKER_THREADS", "40"))
+POOL_SIZE = int(os.getenv("KB_POOL_SIZE", str(max(2, WORKER_THREADS // 4))))
+POOL_OVERFLOW = int(os.getenv("KB_POOL_OVERFLOW", str(max(0, WORKER_THREADS - POOL_SIZE))))
+POOL_TIMEOUT = float(os.getenv("KB_POOL_TIMEOUT", "5"))      # seconds to wait for a connection
+POOL_RECYCLE = int(os.getenv("KB_POOL_RECYCLE", "1800"))
+# psycopg3: executions before a statement is prepared server-side (0 = first time).
+# Set to "none" behind a transaction-pooling PgBouncer.
+PREPARE_THRESHOLD = os.getenv("KB_PREPARE_THRESHOLD", "0")
+
+# ANN search knobs, SET once per pooled session
+IVFFLAT_PROBES = os.getenv("KB_IVFFLAT_PROBES")   # e.g. "10"
+HNSW_EF_SEARCH = os.getenv("KB_HNSW_EF_SEARCH")   # e.g. "64"
+
+WRITE_POOL_SIZE = int(os.getenv("KB_WRITE_POOL_SIZE", "2"))
+WRITE_POOL_OVERFLOW = int(os.getenv("KB_WRITE_POOL_OVERFLOW", "4"))
+
+_engine = None
+_engine_lock = threading.Lock()
+_write_engine = None
+
+_stats_lock = threading.Lock()
+_stats = {"queries": 0, "errors": 0, "wait_ms_total": 0.0, "wait_ms_max": 0.0,
+          "query_ms_total": 0.0, "query_ms_max": 0.0}
+
+
+def _session_settings():
+    settings = ["SET default_transaction_read_only = on"]
+    if IVFFLAT_PROBES:
+        settings.append(f"SET ivfflat.probes = {int(IVFFLAT_PROBES)}")
+    if HNSW_EF_SEARCH:
+        settings.append(f"SET hnsw.ef_search = {int(HNSW_EF_SEARCH)}")
+    return settings
+
+
+def _create_engine():
+    if not DB_URL:
+        raise RuntimeError("RAG_DB_URL not set (put it in LLM_Bridge/.env or export it)")
+    from sqlalchemy import create_engine, event
+    from pgvector.psycopg import register_vector
+
+    threshold = None if PREPARE_THRESHOLD.lower() == "none" else int(PREPARE_THRESHOLD)
+
+    engine = create_engine(
+        DB_URL,
+        future=True,
+        pool_size=POOL_SIZE,
+        max_overflow=POOL_OVERFLOW,
+        pool_timeout=POOL_TIMEOUT,
+        pool_recycle=POOL_RECYCLE,
+        pool_pre_ping=True,
+        connect_args={"prepare_threshold": threshold},
+    ).execution_options(isolation_level="AUTOCOMMIT")
+
+    settings = _session_settings()
+
+    @event.listens_for(engine, "connect")
+    def on_connect(dbapi_connection, connection_record):
+        try:
+            register_vector(dbapi_connection)  # registers pgvector for psycopg3
+        except Exception:
+            pass
+        prev = dbapi_connection.autocommit
+        dbapi_connection.autocommit = True
+        with dbapi_connection.cursor() as cur:
+            for stmt in settings:
+                cur.execute(stmt)
+        dbapi_connection.autocommit = prev
+
+    return engine
+
+
+def get_read_engine():
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = _create_engine()
+    return _engine
+
+
+def _create_write_engine():
+    if not DB_URL:
+        raise RuntimeError("RAG_DB_URL not set (put it in LLM_Bridge/.env or export it)")
+    from sqlalchemy import create_engine, event
+    from pgvector.psycopg import register_vector
+
+    engine = create_engine(DB_URL, future=True, pool_size=WRITE_POOL_SIZE,
+                           max_overflow=WRITE_POOL_OVERFLOW, pool_recycle=POOL_RECYCLE, pool_pre_ping=True)
+
+    @event.listens_for(engine, "connect")
+    def register_vector_on_connect(dbapi_connection, connection_record):
+        try:
+            register_vector(dbapi_connection)  # registers pgvector for psycopg3
+        except Exception:
+            pass
+
+    return engine
+
+
+def get_write_engine():
+    global _write_engine
+    if _write_engine is None:
+        with _engine_lock:
+            if _write_engine is None:
+                _write_engine = _create_write_engine()
+    return _write_engine
+
+
+@contextmanager
+def read_connection():
+    """Pooled read-only autocommit connection; records checkout wait and query time."""
+    engine = get_read_engine()
+    t0 = time.perf_counter()
+    conn = engine.connect()
+    t1 = time.perf_counter()
+    failed = False
+    try:
+        yield conn
+    except Exception:
+        failed = True
+        raise
+    finally:
+        conn.close()
+        t2 = time.perf_counter()
+        wait_ms, query_ms = (t1 - t0) * 1000, (t2 - t1) * 1000
+        with _stats_lock:
+            _stats["queries"] += 1
+            _stats["errors"] += int(failed)
+            _stats["wait_ms_total"] += wait_ms
+            _stats["wait_ms_max"] = max(_stats["wait_ms_max"], wait_ms)
+            _stats["query_ms_total"] += query_ms
+            _stats["query_ms_max"] = max(_stats["query_ms_max"], query_ms)
+
+
+def pool_stats() -> Dict:
+    with _stats_lock:
+        stats = dict(_stats)
+    n = stats["queries"] or 1
+    stats["wait_ms_avg"] = stats["wait_ms_total"] / n
+    stats["query_ms_avg"] = stats["query_ms_total"] / n
+    stats["pool_size"] = POOL_SIZE
+    stats["max_overflow"] = POOL_OVERFLOW
+    pool = _engine.pool if _engine is not None else None
+    if pool is not None:
+        stats["checked_out"] = pool.checkedout()
+        stats["checked_in"] = pool.checkedin()
+        stats["overflow"] = pool.overflow()
+        stats["utilization"] = pool.checkedout() / float(POOL_SIZE + POOL_OVERFLOW or 1)
+    return stats
+
+
+def dispose() -> None:
+    for engine in (_engine, _write_engine):
+        if engine is not None:
+            engine.dispose()
@@ -0,0 +1,188 @@
+# LLM_Bridge/retrieval_loadtest.py
+# Latency of the search_kb SQL under concurrency: the retrieval_db read path (sized pool,
+# read-only autocommit, prepared vector query) against the old one (default pool, a
+# read-write transaction per query). Needs RAG_DB_URL and a populated kb_chunks; no Ollama.
+#
+#   python LLM_Bridge/retrieval_loadtest.py                       # 1, 8 and 32 callers
+#   python LLM_Bridge/retrieval_loadtest.py --levels 16,64 --queries 2000 --path pooled
+#   python LLM_Bridge/retrieval_loadtest.py --mode binary --queries 200   # recall@k
+#
+# Query vectors are random unit vectors of EMBED_DIM, so only the database is measured.
+# Run it with the same WORKER_THREADS / KB_POOL_* settings as the server.
+#
+# --mode halfvec|binary measures a compact KB_VECTOR_MODE instead (kb_compact_indexes.sql):
+# recall@k of its top-k against an exact scan, and the latency of both. Queries are stored
+# chunk embeddings plus a little noise, which look like real questions to the index.
+import os
+import sys
+import time
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List
+
+import numpy as np
+
+try:
+    from . import retrieval_db
+    from .server import (EMBED_DIM, KB_TOPK, KB_RERANK_CANDIDATES, SEARCH_SQL, _search_params,
+                         _search_sql, _search_vec)
+except ImportError:  # run as a script: python LLM_Bridge/retrieval_loadtest.py
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from LLM_Bridge import retrieval_db
+    from LLM_Bridge.server import (EMBED_DIM, KB_TOPK, KB_RERANK_CANDIDATES, SEARCH_SQL, _search_params,
+                                   _search_sql, _search_vec)
+
+# "+ 0" keeps the planner off the ANN indexes: a sequential scan, the exact top-k
+EXACT_SQL = "SELECT id FROM kb_chunks ORDER BY (embedding <=> :vec) + 0 LIMIT :k"
+
+
+def _baseline() -> Callable[[List[float], int], List]:
+    """search_kb before retrieval_db: default engine, engine.begin() per query."""
+    from sqlalchemy import create_engine, event, text as sql_text, bindparam
+    from pgvector.psycopg import register_vector
+    from pgvector.sqlalchemy import Vector
+
+    engine = create_engine(retrieval_db.DB_URL, future=True)
+
+    @event.listens_for(engine, "connect")
+    def on_connect(dbapi_connection, connection_record):
+        register_vector(dbapi_connection)
+
+    def search(vec: List[float], k: int) -> List:
+        q = sql_text(SEARCH_SQL).bindparams(bindparam("vec", value=vec, type_=Vector(EMBED_DIM)),
+                                            *_search_params(k))
+        with engine.begin() as conn:
+            return conn.execute(q).mappings().all()
+
+    search.dispose = engine.dispose
+    return search
+
+
+def _pooled() -> Callable[[List[float], int], List]:
+    def search(vec: List[float], k: int) -> List:
+        return _search_vec(vec, k, SEARCH_SQL)
+
+    search.dispose = lambda: None
+    return search
+
+
+def run_level(search: Callable, callers: int, queries: int, k: int) -> Dict:
+    rng = np.random.default_rng(callers)
+    vecs = rng.standard_normal((queries, EMBED_DIM)).astype("float32")
+    vecs = (vecs / np.linalg.norm(vecs, axis=1, keepdims=True)).tolist()
+    lat: List[float] = []
+    errors = 0
+    lock = threading.Lock()
+
+    def one(vec):
+        nonlocal errors
+        t0 = time.perf_counter()
+        try:
+            search(vec, k)
+        except Exception as e:
+            with lock:
+                errors += 1
+                first = errors == 1
+            if first:
+                print(f"[LOADTEST] {e}")
+            return
+        dt = time.perf_counter() - t0
+        with lock:
+            lat.append(dt * 1000)
+
+    # warm the pool (connections, prepared statements) outside the timing
+    with ThreadPoolExecutor(max_workers=callers) as pool:
+        list(pool.map(one, vecs[:callers]))
+    lat.clear()
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=callers) as pool:
+        list(pool.map(one, vecs))
+    wall = time.perf_counter() - t0
+
+    ok = len(lat)
+    lat = sorted(lat) or [0.0]
+    pct = lambda p: lat[min(len(lat) - 1, int(p * len(lat)))]
+    return {"callers": callers, "queries": queries, "errors": errors, "qps": ok / wall,
+            "p50_ms": pct(0.50), "p95_ms": pct(0.95), "p99_ms": pct(0.99), "max_ms": lat[-1]}
+
+
+def _sample_queries(n: int, noise: float = 0.02) -> List[List[float]]:
+    from sqlalchemy import text as sql_text
+    with retrieval_db.read_connection() as conn:
+        rows = conn.execute(sql_text("SELECT embedding FROM kb_chunks ORDER BY random() LIMIT :n"),
+                            {"n": n}).scalars().all()
+    if not rows:
+        sys.exit("kb_chunks is empty")
+    vecs = np.array([np.asarray(r, dtype="float32") for r in rows])
+    vecs += np.random.default_rng(0).standard_normal(vecs.shape).astype("float32") * noise
+    return (vecs / np.linalg.norm(vecs, axis=1, keepdims=True)).tolist()
+
+
+def run_recall(mode: str, queries: int, k: int) -> Dict:
+    """Mean and worst recall@k of `mode` against the exact top-k, and the latency of each."""
+    sql = _search_sql(mode=mode)
+    recalls: List[float] = []
+    lat: Dict[str, List[float]] = {"exact": [], mode: []}
+    for vec in _sample_queries(queries):
+        t0 = time.perf_counter()
+        exact = {r["id"] for r in _search_vec(vec, k, EXACT_SQL, mode="full")}
+        t1 = time.perf_counter()
+        got = {r["id"] for r in _search_vec(vec, k, sql, mode=mode)}
+        t2 = time.perf_counter()
+        lat["exact"].append((t1 - t0) * 1000)
+        lat[mode].append((t2 - t1) * 1000)
+        if exact:
+            recalls.append(len(exact & got) / len(exact))
+    out = {"mode": mode, "k": k, "candidates": max(k, KB_RERANK_CANDIDATES), "queries": len(recalls),
+           "recall": sum(recalls) / max(1, len(recalls)), "recall_min": min(recalls, default=0.0)}
+    for name, ms in lat.items():
+        ms.sort()
+        out[f"{name}_p50_ms"] = ms[len(ms) // 2]
+        out[f"{name}_p95_ms"] = ms[min(len(ms) - 1, int(0.95 * len(ms)))]
+    return out
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Load test for the search_kb read path")
+    ap.add_argument("--levels", default="1,8,32")
+    ap.add_argument("--queries", type=int, default=500, help="queries per level")
+    ap.add_argument("--k", type=int, default=KB_TOPK)
+    ap.add_argument("--path", choices=("both", "baseline", "pooled"), default="both")
+    ap.add_argument("--mode", choices=("halfvec", "binary"),
+                    help="measure recall@k of this KB_VECTOR_MODE against exact search instead")
+    args = ap.parse_args()
+    if not retrieval_db.DB_URL:
+        sys.exit("RAG_DB_URL not set")
+
+    if args.mode:
+        r = run_recall(args.mode, args.queries, args.k)
+        print(f"{r['mode']}: recall@{r['k']} {r['recall']:.3f} (min {r['recall_min']:.2f}) over "
+              f"{r['queries']} queries, {r['candidates']} candidates re-ranked (KB_RERANK_CANDIDATES)")
+        print(f"{'':>8} {'p50 ms':>8} {'p95 ms':>8}")
+        for name in ("exact", r["mode"]):
+            print(f"{name:>8} {r[name + '_p50_ms']:>8.1f} {r[name + '_p95_ms']:>8.1f}")
+        return
+
+    paths = {"baseline": _baseline, "pooled": _pooled}
+    names = list(paths) if args.path == "both" else [args.path]
+    print(f"pool_size={retrieval_db.POOL_SIZE} max_overflow={retrieval_db.POOL_OVERFLOW} "
+          f"prepare_threshold={retrieval_db.PREPARE_THRESHOLD} k={args.k}")
+    print(f"{'path':>8} {'callers':>7} {'queries':>7} {'err':>4} {'q/s':>8} "
+          f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    for name in names:
+        search = paths[name]()
+        try:
+            for callers in (int(x) for x in args.levels.split(",")):
+                r = run_level(search, callers, args.queries, args.k)
+                print(f"{name:>8} {r['callers']:>7} {r['queries']:>7} {r['errors']:>4} {r['qps']:>8.1f} "
+                      f"{r['p50_ms']:>8.1f} {r['p95_ms']:>8.1f} {r['p99_ms']:>8.1f} {r['max_ms']:>8.1f}")
+        finally:
+            search.dispose()
+    if "pooled" in names:
+        s = retrieval_db.pool_stats()
+        print(f"pooled: checkout wait avg {s['wait_ms_avg']:.2f} ms, max {s['wait_ms_max']:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,23 +1,23 @@
 # LLM_Bridge/server.py
 import os
+import sys
 import time
+import json
 import threading
-from typing import Dict, List, Optional
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import asynccontextmanager
+from typing import Annotated, Callable, Dict, List, Optional, Tuple
 
-from fastapi import FastAPI, HTTPException, Request
+from fastapi import FastAPI, File, HTTPException, Request, UploadFile
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel, Field
+from starlette.concurrency import run_in_threadpool
 
 from dotenv import load_dotenv
 
-from sqlalchemy import create_engine, text as sql_text, bindparam, event
-from pgvector.sqlalchemy import Vector
-from pgvector.psycopg import register_vector
-
-from langchain_community.llms import Ollama
-from langchain_community.embeddings import OllamaEmbeddings
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.output_parsers import StrOutputParser
+# SQLAlchemy, pgvector and LangChain are imported inside the get_*() factories
+# below, so importing this module (worker boot) stays cheap; see "Infra".
 
 # --- utils ---
 from .polish_answer import polish_answer   # ensure LLM_Bridge/polish_answer.py exists
@@ -27,10 +27,22 @@ from .polish_answer import polish_answer   # ensure LLM_Bridge/polish_answer.py
 # Load .env that sits next to this file
 load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), ".env"))
 
+# These read their settings from the environment at import, so they come after .env
+from . import retrieval_db
+from .ollama_warmup import OllamaWarmup, KEEP_ALIVE
+from .ollama_router import get_router, routed_embeddings
+from . import diversify
+from . import prompt_builder
+from . import rate_limit
+from . import ingest_admin
+from . import profiling
+from .profiling import lap
+from . import answer_store
+from . import query_log
+
 DB_URL = os.getenv("RAG_DB_URL")
-if not DB_URL:
-    raise RuntimeError("RAG_DB_URL not set (put it in LLM_Bridge/.env or export it)")
 
+# OLLAMA_HOSTS="url=gen,embed;url=embed" spreads load over several hosts (ollama_router.py)
 MODEL_NAME = os.getenv("OLLAMA_MODEL", "llama3.2:latest")
 EMBED_MODEL = os.getenv("EMBED_MODEL", "nomic-embed-text")
 OLLAMA_HOST = os.getenv("OLLAMA_HOST", "http://127.0.0.1:11434")
@@ -38,31 +50,62 @@ os.environ["OLLAMA_HOST"] = OLLAMA_HOST  # let LangChain pick it up
 
 API_KEY = os.getenv("API_KEY", "secret")
 REQUIRE_API_KEY = os.getenv("REQUIRE_API_KEY", "false").lower() == "true"
+# /api/admin/* needs x-admin-key; the admin API is disabled when this is unset
+ADMIN_API_KEY = os.getenv("ADMIN_API_KEY")
 ALLOW_ORIGINS = os.getenv("ALLOW_ORIGINS", "*").split(",")
 
 KB_TOPK = int(os.getenv("KB_TOPK", "5"))
 KB_CONFIDENCE = float(os.getenv("KB_CONFIDENCE", "0.65"))
 EMBED_DIM = int(os.getenv("EMBED_DIM", "768"))  # nomic-embed-text = 768
+# Candidate search on a compact index, then exact re-rank: full | halfvec | binary
+# (needs the matching expression index from kb_compact_indexes.sql)
+KB_VECTOR_MODE = os.getenv("KB_VECTOR_MODE", "full").lower()
+KB_RERANK_CANDIDATES = int(os.getenv("KB_RERANK_CANDIDATES", "40"))
+
+# Post-retrieval MMR + adaptive k (diversify.py): fetch KB_MMR_FETCH rows, send <= KB_TOPK
+KB_MMR = os.getenv("KB_MMR", "true").lower() == "true"
+KB_MMR_FETCH = int(os.getenv("KB_MMR_FETCH", str(KB_TOPK * 2)))
+
+# /api/chat/batch: max questions per request, concurrent LLM generations per request
+BATCH_MAX = int(os.getenv("BATCH_MAX", "1000"))
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "4"))
+BATCH_QUESTION_MAX = int(os.getenv("BATCH_QUESTION_MAX", "2000"))  # characters per question
+BATCH_K_MAX = int(os.getenv("BATCH_K_MAX", "50"))                  # chunks per question
+
+# true: build engine/embeddings/chains during startup instead of on first request
+EAGER_INIT = os.getenv("EAGER_INIT", "false").lower() == "true"
+# Preload + keep-alive both Ollama models; /api/health answers 503 until they are warm
+OLLAMA_WARMUP = os.getenv("OLLAMA_WARMUP", "true").lower() == "true"
+HEALTH_REQUIRE_WARM = os.getenv("HEALTH_REQUIRE_WARM", "true").lower() == "true"
+
+if query_log.enabled():
+    profiling.keep_stages()  # the query log records each chat's stage timings
 
 CONTACT_MESSAGE = os.getenv(
     "CONTACT_MESSAGE",
     "This seems outside my current knowledge base. Please reach out via the Contact page (/contact) and we’ll get back to you quickly."
 )
 
-print(f"Using DB_URL: {DB_URL}")
-print(f"Using OLLAMA_HOST: {OLLAMA_HOST}")
-
 # ---------------- Infra ----------------
-engine = create_engine(DB_URL, future=True)
-
-@event.listens_for(engine, "connect")
-def register_vector_on_connect(dbapi_connection, connection_record):
-    try:
-        register_vector(dbapi_connection)  # registers pgvector for psycopg3
-    except Exception:
-        pass
-
-emb = OllamaEmbeddings(model=EMBED_MODEL)
+# Heavy components are created on first use, once per process.
+_components: Dict[str, object] = {}
+_init_lock = threading.Lock()
+
+def _lazy(name: str, factory: Callable[[], object]):
+    obj = _components.get(name)
+    if obj is None:
+        with _init_lock:
+            obj = _components.get(name)
+            if obj is None:
+                obj = factory()
+                _components[name] = obj
+    return obj
+
+def _create_emb():
+    return routed_embeddings(EMBED_MODEL)
+
+def get_emb():
+    return _lazy("emb", _create_emb)
 
 def _guard_api_key(headers) -> None:
     if not REQUIRE_API_KEY:
@@ -70,8 +113,69 @@ def _guard_api_key(headers) -> None:
     if headers.get("x-api-key") != API_KEY:
         raise HTTPException(status_code=401, detail="Invalid API key")
 
+def _guard_admin(headers) -> None:
+    if not ADMIN_API_KEY:
+        raise HTTPException(status_code=403, detail="Admin API disabled (set ADMIN_API_KEY)")
+    if headers.get("x-admin-key") != ADMIN_API_KEY:
+        raise HTTPException(status_code=401, detail="Invalid admin key")
+
+def _client(request: Request) -> str:
+    """Who to charge for a request: API key (if any) and client IP."""
+    key = request.headers.get("x-api-key") or "-"
+    ip = rate_limit.client_ip(request.headers, request.client.host if request.client else None)
+    return f"{key}@{ip}"
+
+def _rate_limit(request: Request, cost: int = 1) -> str:
+    """Token-bucket check per API key and per IP (`cost` tokens); returns the client id for scheduling."""
+    client = _client(request)
+    if rate_limit.limiter is not None:
+        key, _, ip = client.rpartition("@")
+        try:
+            rate_limit.limiter.check(None if key == "-" else key, ip, cost)
+        except rate_limit.RateLimited as e:
+            raise HTTPException(status_code=429, detail=str(e),
+                                headers={"Retry-After": str(e.retry_after)})
+    return client
+
 # ---------------- App ----------------
-app = FastAPI(title="Flexbo RAG Backend", version="3.0.0")
+router = get_router()
+# one warm-up per host, for the models of the roles it serves
+warmups = [
+    OllamaWarmup(b.url,
+                 MODEL_NAME if "gen" in b.roles else None,
+                 EMBED_MODEL if "embed" in b.roles else None)
+    for b in router.backends
+]
+
+def models_ready() -> bool:
+    """Warm if at least one host has each model loaded."""
+    return (any(w.is_ready(MODEL_NAME) for w in warmups)
+            and any(w.is_ready(EMBED_MODEL) for w in warmups))
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    print(f"Using DB_URL: {(DB_URL or 'NOT SET').split('@')[-1]}")
+    print(f"Using OLLAMA_HOST: {OLLAMA_HOST}")
+    router.start()
+    if OLLAMA_WARMUP:
+        for w in warmups:
+            w.start()
+    if EAGER_INIT:
+        retrieval_db.get_read_engine()
+        get_emb()
+        get_answer_llm()
+    warmer.start()
+    query_log.start()
+    yield
+    query_log.stop()
+    warmer.stop()
+    ingest_admin.manager.shutdown()
+    router.stop()
+    for w in warmups:
+        w.stop()
+    retrieval_db.dispose()
+
+app = FastAPI(title="Flexbo RAG Backend", version="3.0.0", lifespan=lifespan)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=ALLOW_ORIGINS,
@@ -81,26 +185,8 @@ app.add_middleware(
 )
 
 # ---------------- LLM ----------------
-def build_llm():
-    """
-    Generic chat chain (for non-RAG use). Brand voice: crisp, client-oriented, no meta-commentary.
-    """
-    prompt = ChatPromptTemplate.from_messages(
-        [
-            ("system",
-             "You are FLEXBO Assistant. Speak like a helpful product specialist. "
-             "Be concise, confident, and client-oriented. Never mention 'context', 'snippets', "
-             "or your internal reasoning. Avoid hedging or apologies unless necessary."),
-            ("user", "Prompt: {query}")
-        ]
-    )
-    llm = Ollama(model=MODEL_NAME, temperature=0.2)
-    return prompt | llm | StrOutputParser()
-
-base_chain = build_llm()
-
 # Few-shot, client-oriented, no meta commentary; inline [#] citations
-CITED_ANSWER_PROMPT = ChatPromptTemplate.from_messages([
+CITED_ANSWER_MESSAGES = [
     ("system",
      "You are FLEXBO Assistant. Write a client-oriented answer using ONLY the context snippets.\n"
      "STYLE RULES:\n"
@@ -131,34 +217,132 @@ CITED_ANSWER_PROMPT = ChatPromptTemplate.from_messages([
     # Actual task
     ("user",
      "QUESTION:\n{question}\n\nCONTEXT SNIPPETS (ordered):\n{snippets}\n"),
-])
+]
+
+# System + few-shot rendered once (stable, KV-cacheable prefix); snippets fitted to the
+# OLLAMA_NUM_CTX budget minus OLLAMA_NUM_PREDICT reserved for the answer
+cited_prompt = prompt_builder.PromptBuilder(CITED_ANSWER_MESSAGES)
+
+def get_answer_llm(base_url: str = OLLAMA_HOST):
+    def build():
+        from langchain_community.llms import Ollama
+        return Ollama(model=MODEL_NAME, base_url=base_url, temperature=0.2, keep_alive=KEEP_ALIVE,
+                      num_ctx=prompt_builder.NUM_CTX, num_predict=prompt_builder.NUM_PREDICT)
+    return _lazy(f"answer_llm:{base_url}", build)
 
 # ---------------- Search (pgvector) ----------------
-def search_kb(query: str, k: int):
-    vec = emb.embed_query(query)  # list[float], length EMBED_DIM
-    q = sql_text("""
-        SELECT id, source_type, url, title, section_anchor, content,
-               1 - (embedding <=> :vec) AS score
-        FROM kb_chunks
-        ORDER BY embedding <=> :vec
+# Compact modes order by a halfvec / binary-quantized expression index to pick
+# KB_RERANK_CANDIDATES rows, then re-rank those by exact float32 cosine distance.
+_CANDIDATE_ORDER = {
+    "halfvec": f"embedding::halfvec({EMBED_DIM}) <=> CAST({{vec}} AS halfvec({EMBED_DIM}))",
+    "binary": f"binary_quantize(embedding)::bit({EMBED_DIM}) <~> binary_quantize(CAST({{vec}} AS vector({EMBED_DIM})))",
+}
+
+def _search_sql(vec: str = ":vec", with_embedding: bool = False, mode: str = KB_VECTOR_MODE):
+    """
+    Top-:k query for one query vector; `vec` is the SQL expression holding it.
+    with_embedding also returns each row's vector (for the MMR stage).
+    """
+    emb_col = ", embedding" if with_embedding else ""
+    order = _CANDIDATE_ORDER.get(mode)
+    if not order:
+        return f"""
+            SELECT id, source_type, url, title, section_anchor, content{emb_col},
+                   1 - (embedding <=> {vec}) AS score
+            FROM kb_chunks
+            ORDER BY embedding <=> {vec}
+            LIMIT :k
+        """
+    return f"""
+        WITH cand AS (
+            SELECT id, source_type, url, title, section_anchor, content, embedding
+            FROM kb_chunks
+            ORDER BY {order.format(vec=vec)}
+            LIMIT :cand
+        )
+        SELECT id, source_type, url, title, section_anchor, content{emb_col},
+               1 - (embedding <=> {vec}) AS score
+        FROM cand
+        ORDER BY embedding <=> {vec}
         LIMIT :k
-    """).bindparams(
+    """
+
+SEARCH_SQL = _search_sql()
+SEARCH_SQL_EMB = _search_sql(with_embedding=KB_MMR)
+
+# All query vectors travel as one vector[] parameter; each gets its own top-k via LATERAL.
+SEARCH_BATCH_SQL = f"""
+    SELECT q.ord, r.*
+    FROM unnest(CAST(:vecs AS vector[])) WITH ORDINALITY AS q(vec, ord)
+    CROSS JOIN LATERAL ({_search_sql("q.vec", with_embedding=KB_MMR)}) r
+    ORDER BY q.ord, r.score DESC
+"""
+
+def _search_params(k: int, mode: str = KB_VECTOR_MODE):
+    from sqlalchemy import bindparam
+    params = [bindparam("k", value=k)]
+    if mode in _CANDIDATE_ORDER:
+        params.append(bindparam("cand", value=max(k, KB_RERANK_CANDIDATES)))
+    return params
+
+def _search_vec(vec: List[float], k: int, sql: str, mode: str = KB_VECTOR_MODE):
+    from sqlalchemy import text as sql_text, bindparam
+    from pgvector.sqlalchemy import Vector
+
+    q = sql_text(sql).bindparams(
         bindparam("vec", value=vec, type_=Vector(EMBED_DIM)),
-        bindparam("k", value=k)
+        *_search_params(k, mode),
     )
-    with engine.begin() as conn:
-        rows = conn.execute(q).mappings().all()
+    with retrieval_db.read_connection() as conn:
+        return conn.execute(q).mappings().all()
+
+def search_kb(query: str, k: int):
+    vec = get_emb().embed_query(query)  # list[float], length EMBED_DIM
+    lap("embed")
+    rows = _search_vec(vec, k, SEARCH_SQL)
+    lap("search")
     return rows
 
-def rows_to_snippets(rows):
-    blocks = []
-    for i, r in enumerate(rows, start=1):
-        title = r.get("title") or (r.get("url") or "Untitled")
-        url = r.get("url")
-        body = r.get("content", "")
-        snippet = body if len(body) <= 700 else body[:700] + "..."
-        blocks.append(f"[{i}] {title} — {snippet} ({url})")
-    return "\n\n".join(blocks)
+def retrieve(query: str):
+    """Rows to show the LLM: KB_TOPK nearest, or fewer and more diverse with KB_MMR."""
+    if not KB_MMR:
+        return search_kb(query, k=KB_TOPK)
+    vec = get_emb().embed_query(query)
+    lap("embed")
+    rows = _search_vec(vec, max(KB_TOPK, KB_MMR_FETCH), SEARCH_SQL_EMB)
+    lap("search")
+    rows = diversify.diversify(vec, rows, KB_TOPK)
+    lap("mmr")
+    return rows
+
+def embed_queries(queries: List[str]) -> List[List[float]]:
+    """
+    Embed many queries in one Ollama /api/embed call, with the same query prefix
+    embed_query() uses. Falls back to one call per query on Ollama < 0.3.
+    """
+    emb = get_emb()
+    inputs = [f"{emb.query_instruction}{q}" for q in queries]
+    return router.embed(EMBED_MODEL, inputs, batch=True, keep_alive=KEEP_ALIVE)
+
+def search_kb_batch(queries: List[str], k: int) -> List[List[Dict]]:
+    """retrieve() for many queries: one embedding call, one SQL round trip."""
+    from sqlalchemy import text as sql_text, bindparam
+
+    if not queries:
+        return []
+    vecs = embed_queries(queries)
+    literal = "{" + ",".join('"[' + ",".join(map(repr, map(float, v))) + ']"' for v in vecs) + "}"
+    fetch = max(k, KB_MMR_FETCH) if KB_MMR else k
+    q = sql_text(SEARCH_BATCH_SQL).bindparams(bindparam("vecs", value=literal), *_search_params(fetch))
+    with retrieval_db.read_connection() as conn:
+        rows = conn.execute(q).mappings().all()
+    out: List[List[Dict]] = [[] for _ in queries]
+    for r in rows:
+        r = dict(r)
+        out[r.pop("ord") - 1].append(r)
+    if KB_MMR:
+        out = [diversify.diversify(v, rs, k) for v, rs in zip(vecs, out)]
+    return out
 
 # ---------------- Models ----------------
 class Message(BaseModel):
@@ -176,6 +360,18 @@ class ChatRequest(BaseModel):
     message: str = Field(..., min_length=1)
     thread_id: Optional[int] = None
 
+class BatchChatRequest(BaseModel):
+    questions: List[Annotated[str, Field(min_length=1, max_length=BATCH_QUESTION_MAX)]] = Field(..., min_length=1)
+    k: Optional[int] = Field(None, ge=1, le=BATCH_K_MAX)
+
+class SitemapJobRequest(BaseModel):
+    url: str = Field(..., min_length=1)
+    workers: int = Field(1, ge=1, le=32)
+
+class CrawlJobRequest(BaseModel):
+    seeds: List[str] = Field(..., min_length=1)
+    max_pages: int = Field(100, ge=1)
+
 class ChatResponse(BaseModel):
     thread_id: int
     response: str
@@ -183,6 +379,77 @@ class ChatResponse(BaseModel):
     messages: List[Message]
     sources: Optional[List[Source]] = None
 
+# ---------------- RAG answer ----------------
+def generate_answer(question: str, rows, client: str = "-",
+                    queue_timeout: Optional[float] = rate_limit.GEN_QUEUE_TIMEOUT,
+                    strict: bool = False) -> Tuple[Optional[str], List[Source]]:
+    """
+    Cited LLM answer from retrieved rows; (None, []) when the KB isn't confident.
+    The generation waits for a fair-share slot (rate_limit.scheduler) on behalf of
+    `client`; QueueTimeout propagates to the caller. strict: LLM errors propagate
+    too, instead of answering with the top snippet.
+    """
+    sources: List[Source] = []
+    output: Optional[str] = None
+
+    if rows:
+        top_score = float(rows[0].get("score") or 0.0)
+        if top_score >= KB_CONFIDENCE:
+            used = list(range(len(rows)))
+            try:
+                prompt, pstats = cited_prompt.build(question, rows)
+                used = pstats["used"] or used
+                lap("prompt")
+                with rate_limit.scheduler.slot(client, queue_timeout), router.use("gen") as backend:
+                    lap("queue")
+                    gen = get_answer_llm(backend.url).generate([prompt]).generations[0][0]
+                    lap("generate")
+                prompt_builder.record_generation(gen.generation_info, pstats["prompt_tokens_est"])
+                # polish style (strip meta-talk, collapse blanks)
+                output = polish_answer(gen.text)
+                lap("polish")
+            except rate_limit.QueueTimeout:
+                raise
+            except Exception as e:
+                if strict:
+                    raise
+                print(f"[KB LLM ERROR] {e}")
+                output = rows[0].get("content")[:600] + "..."
+
+            # top 3 typed sources, numbered like the [#] citations in the prompt
+            for i, r in enumerate([rows[n] for n in used[:3]], start=1):
+                sources.append(Source(
+                    index=i,
+                    title=(r.get("title") or r.get("url") or "Untitled"),
+                    url=r.get("url"),
+                    score=float(r.get("score") or 0.0),
+                    source_type=r.get("source_type"),
+                ))
+    return output, sources
+
+# ---------------- Ingestion publish hooks ----------------
+def _refresh_faq_index(job: Dict) -> None:
+    """A published CSV becomes the FAQ; rebuild the FAISS index if this process uses it."""
+    loader = sys.modules.get(f"{__package__}.knowledge_loader")
+    if job["kind"] == "csv" and loader is not None and loader.current_manifest() is not None:
+        loader.reload_vectorstore_async(job["params"]["path"])
+
+ingest_admin.manager.on_publish(_refresh_faq_index)
+
+# ---------------- Answer store ----------------
+def _warm_answer(question: str, rows) -> Tuple[Optional[str], List[Dict]]:
+    # one fair-share client for the whole job, never timing out behind chats
+    output, sources = generate_answer(question, rows, "answer-warmer", queue_timeout=None, strict=True)
+    return output, [s.model_dump() for s in sources]
+
+warmer = answer_store.Warmer(retrieve, _warm_answer, busy=lambda: ingest_admin.manager.busy.value)
+
+def _refresh_answers(job: Dict) -> None:
+    """Chunks were replaced: re-check the pre-generated answers built from them."""
+    warmer.run_async("refresh")
+
+ingest_admin.manager.on_publish(_refresh_answers)
+
 # ---------------- In-memory threads ----------------
 _threads: Dict[int, Dict] = {}
 _next_id = 1
@@ -191,19 +458,43 @@ _lock = threading.Lock()
 # ---------------- Routes ----------------
 @app.get("/api/health")
 def health():
-    return {
+    ready = models_ready() if OLLAMA_WARMUP else None
+    body = {
         "status": "ok",
+        "models_ready": ready,
+        "hosts": [w.status() for w in warmups] if OLLAMA_WARMUP else None,
         "model": MODEL_NAME,
         "embed_model": EMBED_MODEL,
-        "db": DB_URL.split("@")[-1],  # hide credentials
+        "db": (DB_URL or "").split("@")[-1],  # hide credentials
         "kb_topk": KB_TOPK,
         "kb_confidence": KB_CONFIDENCE,
         "embed_dim": EMBED_DIM,
+        "kb_vector_mode": KB_VECTOR_MODE,
+    }
+    if ready is False and HEALTH_REQUIRE_WARM:
+        # keep the load balancer away until the models are loaded
+        body["status"] = "warming"
+        return JSONResponse(status_code=503, content=body)
+    return body
+
+@app.get("/api/metrics")
+def metrics(request: Request):
+    _guard_api_key(request.headers)
+    return {
+        "kb_pool": retrieval_db.pool_stats(),
+        "retrieval": diversify.stats(),
+        "llm_tokens": prompt_builder.metrics(),
+        "ollama_hosts": router.status(),
+        "rate_limit": rate_limit.stats(),
+        "answer_store": answer_store.stats(),
+        "query_log": query_log.stats(),
     }
 
 @app.post("/api/chat", response_model=ChatResponse)
+@profiling.profiled("/api/chat")
 def chat(req: ChatRequest, request: Request):
     _guard_api_key(request.headers)
+    client = _rate_limit(request)
     start = time.time()
 
     # Ensure thread
@@ -217,40 +508,34 @@ def chat(req: ChatRequest, request: Request):
         if tid not in _threads:
             raise HTTPException(status_code=404, detail="Thread not found")
         _threads[tid]["messages"].append({"type": "user", "content": req.message})
-
-    # 1) RAG retrieval
-    sources: List[Source] = []
-    output: Optional[str] = None
-
-    try:
-        rows = search_kb(req.message, k=KB_TOPK)
-    except Exception as e:
-        rows = []
-        print(f"[KB SEARCH ERROR] {e}")
-
-    if rows:
-        top_score = float(rows[0].get("score") or 0.0)
-        if top_score >= KB_CONFIDENCE:
+    lap("thread")
+
+    # background ingestion holds its embedding calls while this request is in flight
+    with ingest_admin.manager.serving():
+        # 0) pre-generated answer (answer_store.py)
+        answer_store.record(req.message)
+        stored = answer_store.lookup(req.message)
+        lap("answer_store")
+        top_score = None
+        if stored is not None:
+            output, sources = stored[0], [Source(**s) for s in stored[1]]
+            path = "cache"
+        else:
+            # 1) RAG retrieval
             try:
-                snippets = rows_to_snippets(rows)
-                llm = Ollama(model=MODEL_NAME, temperature=0.2)
-                prompt_msgs = CITED_ANSWER_PROMPT.format_messages(question=req.message, snippets=snippets)
-                output = StrOutputParser().invoke(llm.invoke(prompt_msgs))
-                # polish style (strip meta-talk, collapse blanks)
-                output = polish_answer(output)
+                rows = retrieve(req.message)
             except Exception as e:
-                print(f"[KB LLM ERROR] {e}")
-                output = rows[0].get("content")[:600] + "..."
+                rows = []
+                print(f"[KB SEARCH ERROR] {e}")
+            top_score = float(rows[0].get("score") or 0.0) if rows else None
 
-            # top 3 typed sources
-            for i, r in enumerate(rows[:3], start=1):
-                sources.append(Source(
-                    index=i,
-                    title=(r.get("title") or r.get("url") or "Untitled"),
-                    url=r.get("url"),
-                    score=float(r.get("score") or 0.0),
-                    source_type=r.get("source_type"),
-                ))
+            try:
+                output, sources = generate_answer(req.message, rows, client)
+            except rate_limit.QueueTimeout as e:
+                query_log.log(req.message, "busy", top_score, (time.time() - start) * 1000, profiling.stages())
+                raise HTTPException(status_code=503, detail="Server busy, please retry",
+                                    headers={"Retry-After": str(e.retry_after)})
+            path = "kb" if output else "fallback"
 
     # 2) Fallback
     if not output:
@@ -261,6 +546,7 @@ def chat(req: ChatRequest, request: Request):
         msgs = [Message(**m) for m in _threads[tid]["messages"]]
 
     elapsed_ms = int((time.time() - start) * 1000)
+    query_log.log(req.message, path, top_score, elapsed_ms, profiling.stages())
     return ChatResponse(
         thread_id=tid,
         response=output,
@@ -269,6 +555,60 @@ def chat(req: ChatRequest, request: Request):
         sources=sources if sources else None
     )
 
+@app.post("/api/chat/batch")
+@profiling.profiled("/api/chat/batch")
+def chat_batch(req: BatchChatRequest, request: Request):
+    """
+    Answer many questions without threads. Retrieval for the whole batch is one
+    embedding call and one SQL query; generations run BATCH_CONCURRENCY at a time
+    and each result is streamed as an NDJSON line as soon as it finishes.
+    """
+    _guard_api_key(request.headers)
+    if len(req.questions) > BATCH_MAX:
+        raise HTTPException(status_code=413, detail=f"At most {BATCH_MAX} questions per batch")
+    client = _rate_limit(request, cost=max(1, len(req.questions)))  # one token per question
+    k = req.k or KB_TOPK
+
+    start = time.time()
+    try:
+        all_rows = search_kb_batch(req.questions, k=k)
+    except Exception as e:
+        print(f"[KB BATCH SEARCH ERROR] {e}")
+        all_rows = [[] for _ in req.questions]
+    retrieval_ms = int((time.time() - start) * 1000)
+
+    def answer(i: int):
+        t0 = time.time()
+        # queued as one client, without a timeout: a batch gets its fair share of
+        # generation slots instead of crowding out interactive chats
+        output, sources = generate_answer(req.questions[i], all_rows[i], client, queue_timeout=None)
+        return {
+            "index": i,
+            "question": req.questions[i],
+            "response": output or CONTACT_MESSAGE,
+            "sources": [s.model_dump() for s in sources] or None,
+            "retrieval_ms": retrieval_ms,
+            "elapsed_ms": int((time.time() - t0) * 1000),
+        }
+
+    def stream():
+        # not a `with` block: a client that disconnects closes this generator, and the
+        # questions not started yet are cancelled instead of generated for nobody
+        pool = ThreadPoolExecutor(max_workers=BATCH_CONCURRENCY)
+        try:
+            futures = {pool.submit(answer, i): i for i in range(len(req.questions))}
+            for f in as_completed(futures):
+                try:
+                    line = f.result()
+                except Exception as e:
+                    print(f"[BATCH ERROR] question {futures[f]}: {e}")
+                    line = {"index": futures[f], "error": str(e) or type(e).__name__}
+                yield json.dumps(line, ensure_ascii=False) + "\n"
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
 @app.post("/api/thread", response_model=Dict[str, int])
 def create_thread(request: Request):
     _guard_api_key(request.headers)
@@ -286,3 +626,116 @@ def get_thread(thread_id: int, request: Request):
     if not t:
         raise HTTPException(status_code=404, detail="Thread not found")
     return {"messages": [Message(**m) for m in t["messages"]]}
+
+# ---------------- Admin: ingestion ----------------
+def _submit_job(kind: str, params: Dict) -> Dict:
+    try:
+        return ingest_admin.manager.submit(kind, params)
+    except RuntimeError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+@app.post("/api/admin/ingest/csv")
+async def ingest_csv_job(request: Request, file: UploadFile = File(...)):
+    """Upload a Question/Answer CSV; it replaces the CSV chunks once fully embedded."""
+    _guard_admin(request.headers)
+    path = ingest_admin.save_upload(await file.read(), file.filename)
+    return await run_in_threadpool(_submit_job, "csv", {"path": path})  # first submit checks the schema
+
+@app.post("/api/admin/ingest/sitemap")
+def ingest_sitemap_job(req: SitemapJobRequest, request: Request):
+    _guard_admin(request.headers)
+    return _submit_job("sitemap", req.model_dump())
+
+@app.post("/api/admin/ingest/crawl")
+def ingest_crawl_job(req: CrawlJobRequest, request: Request):
+    _guard_admin(request.headers)
+    return _submit_job("crawl", req.model_dump())
+
+@app.get("/api/admin/ingest/jobs")
+def ingest_jobs(request: Request):
+    _guard_admin(request.headers)
+    return {"jobs": ingest_admin.manager.list()}
+
+@app.get("/api/admin/ingest/jobs/{job_id}")
+def ingest_job(job_id: str, request: Request):
+    _guard_admin(request.headers)
+    job = ingest_admin.manager.status(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+# ---------------- Admin: answer store ----------------
+@app.get("/api/admin/answers")
+def answers_status(request: Request):
+    _guard_admin(request.headers)
+    return warmer.status()
+
+@app.post("/api/admin/answers/{kind}")
+def answers_run(kind: str, request: Request):
+    """Start a warm (missing FAQ/popular answers) or refresh (changed chunks) in the background."""
+    _guard_admin(request.headers)
+    if kind not in ("warm", "refresh"):
+        raise HTTPException(status_code=404, detail="Use /warm or /refresh")
+    if not DB_URL:
+        raise HTTPException(status_code=503, detail="RAG_DB_URL not set")
+    if warmer.running:
+        if kind == "refresh":
+            warmer.refresh_pending = True  # runs when the current one finishes
+            return {"pending": kind}
+        raise HTTPException(status_code=409, detail=f"{warmer.running} already running")
+    warmer.run_async(kind)
+    return {"started": kind}
+
+# ---------------- Admin: profiling ----------------
+@app.get("/api/admin/profile/cpu", response_class=PlainTextResponse)
+def profile_cpu(request: Request, seconds: float = 10, requests: int = 0):
+    """
+    Sample stacks for `seconds`, or until the next `requests` chat requests finish
+    (then only their threads are sampled). Returns collapsed stacks:
+    flamegraph.pl profile.txt > profile.svg, or open in speedscope.
+    """
+    _guard_admin(request.headers)
+    try:
+        sampler = profiling.profile_cpu(seconds=seconds, requests=requests)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return PlainTextResponse(sampler.collapsed(), headers={
+        "X-Profile-Samples": str(sampler.samples),
+        "X-Profile-Requests": str(sampler.finished_requests),
+    })
+
+@app.get("/api/admin/profile/slow")
+def profile_slow(request: Request):
+    _guard_admin(request.headers)
+    return {"config": profiling.slow_config(), "requests": profiling.slow_requests()}
+
+@app.post("/api/admin/profile/slow")
+def profile_slow_threshold(request: Request, threshold_ms: float, endpoint: Optional[str] = None):
+    """Log requests slower than threshold_ms (0 = off), for one endpoint or by default."""
+    _guard_admin(request.headers)
+    return profiling.set_slow_threshold(threshold_ms, endpoint)
+
+@app.post("/api/admin/profile/memory/start")
+def profile_memory_start(request: Request, frames: int = 10):
+    _guard_admin(request.headers)
+    return profiling.memory_start(frames)
+
+@app.post("/api/admin/profile/memory/stop")
+def profile_memory_stop(request: Request):
+    _guard_admin(request.headers)
+    return profiling.memory_stop()
+
+@app.get("/api/admin/profile/memory")
+def profile_memory(request: Request, top: int = 25, group_by: str = "lineno"):
+    """Top allocation sites and growth since the previous call, plus thread store size."""
+    _guard_admin(request.headers)
+    if group_by not in ("lineno", "filename", "traceback"):
+        raise HTTPException(status_code=400, detail="group_by: lineno | filename | traceback")
+    try:
+        out = profiling.memory_snapshot(top, group_by)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    with _lock:
+        out["threads"] = {"count": len(_threads),
+                          "messages": sum(len(t["messages"]) for t in _threads.values())}
+    return out
@@ -0,0 +1,66 @@
+# LLM_Bridge/server_import_check.py
+# Keeps server.py cheap to import: SQLAlchemy, the Postgres driver and LangChain must
+# load on first use, not when a worker starts.
+#
+#   python LLM_Bridge/server_import_check.py
+#   python LLM_Bridge/server_import_check.py --max-ms 1000 --max-rss-mb 100
+#
+# Imports LLM_Bridge.server in a fresh interpreter (nothing preloaded) and fails,
+# naming the culprits, if any of the deferred packages ended up in sys.modules, or
+# if the import took longer than IMPORT_BUDGET_MS or the interpreter's peak RSS grew
+# past IMPORT_BUDGET_RSS_MB (0 = no budget).
+import os
+import sys
+import json
+import argparse
+import subprocess
+
+IMPORT_BUDGET_MS = float(os.getenv("IMPORT_BUDGET_MS", "2000"))
+IMPORT_BUDGET_RSS_MB = float(os.getenv("IMPORT_BUDGET_RSS_MB", "150"))
+
+DEFERRED = ("sqlalchemy", "langchain", "langchain_core", "langchain_ollama", "langchain_community",
+            "pgvector", "psycopg", "psycopg2")
+
+# ru_maxrss is KiB on Linux, bytes on macOS
+_PROBE = """
+import sys, json, time, resource
+t0 = time.perf_counter()
+import LLM_Bridge.server
+ms = (time.perf_counter() - t0) * 1000
+rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024)
+print(json.dumps({"ms": ms, "rss_mb": rss, "modules": sorted({m.split(".")[0] for m in sys.modules})}))
+"""
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Import cost check for LLM_Bridge.server")
+    ap.add_argument("--max-ms", type=float, default=IMPORT_BUDGET_MS, help="import time budget")
+    ap.add_argument("--max-rss-mb", type=float, default=IMPORT_BUDGET_RSS_MB, help="peak RSS budget")
+    args = ap.parse_args()
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [root, os.getenv("PYTHONPATH")])),
+               EAGER_INIT="false")
+    out = subprocess.run([sys.executable, "-c", _PROBE], env=env, cwd=root,
+                         capture_output=True, text=True, check=True)
+    probe = json.loads(out.stdout.strip().splitlines()[-1])
+    loaded = sorted(set(DEFERRED) & set(probe["modules"]))
+    print(f"import LLM_Bridge.server: {probe['ms']:.0f} ms, peak RSS {probe['rss_mb']:.0f} MB, "
+          f"{len(probe['modules'])} top-level modules")
+    failed = []
+    if loaded:
+        failed.append(f"loaded at import time: {', '.join(loaded)} "
+                      f"(find the importer with: python -X importtime -c \"import LLM_Bridge.server\")")
+    else:
+        print(f"ok   none of {', '.join(DEFERRED)} loaded")
+    for what, value, budget, unit in (("import time", probe["ms"], args.max_ms, "ms"),
+                                      ("peak RSS", probe["rss_mb"], args.max_rss_mb, "MB")):
+        if budget and value > budget:
+            failed.append(f"{what} {value:.0f} {unit} over the {budget:.0f} {unit} budget")
+        elif budget:
+            print(f"ok   {what} within {budget:.0f} {unit}")
+    if failed:
+        sys.exit("\n".join(f"FAIL {f}" for f in failed))
+
+
+if __name__ == "__main__":
+    main()
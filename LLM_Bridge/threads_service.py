@@ -1,10 +1,18 @@
 # threads_service.py
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
 from pydantic import BaseModel
-from typing import List, Dict
+from typing import List, Dict, Union
 from fastapi.middleware.cors import CORSMiddleware
 import threading
+import time
+
+try:
+    from . import tracing
+except ImportError:  # uvicorn threads_service:app from LLM_Bridge/
+    import tracing
+
+tracing.set_service("threads_service")
 
 app = FastAPI()
 
@@ -37,26 +45,36 @@ app.add_middleware(
 
 # 1) UI posts here to start a new thread
 @app.post("/api/thread", response_model=Dict[str, int])
-def create_thread(req: CreateThreadRequest):
+def create_thread(req: CreateThreadRequest, request: Request):
     global next_id
+    # the "thread" span lasts until the answer is posted; the bridge's spans join its trace
+    incoming = tracing.extract(request.headers)
+    span = tracing.span("thread", parent=incoming)
     with lock:
         thread_id = next_id
         next_id += 1
         # initialize with the user’s message
         threads[thread_id] = {
             "messages": [{"type": "user", "content": req.content}],
-            "answered": False
+            "answered": False,
+            "created": time.time(),
+            "span": span,
+            "trace": span.context or incoming,
         }
+    span.set(thread_id=thread_id)
     return {"id": thread_id}
 
 # 2) bridge.py polls this for all threads yet unanswered
-@app.get("/api/thread/pending", response_model=List[Dict[str, int]])
+@app.get("/api/thread/pending", response_model=List[Dict[str, Union[int, str]]])
 def get_pending_threads():
     pending = []
     with lock:
         for tid, data in threads.items():
             if not data["answered"]:
-                pending.append({"id": tid})
+                item = {"id": tid}
+                if data["trace"] is not None:
+                    item["traceparent"] = data["trace"].traceparent
+                pending.append(item)
     return pending
 
 # 3) bridge.py fetches the conversation so far
@@ -65,6 +83,11 @@ def get_thread_messages(thread_id: int):
     thread = threads.get(thread_id)
     if not thread:
         raise HTTPException(status_code=404, detail="Thread not found")
+    if not thread.get("picked"):
+        # first fetch by the bridge: the question waited this long to be picked up
+        thread["picked"] = True
+        tracing.span("thread.queue_wait", parent=thread["trace"], start=thread["created"],
+                     thread_id=thread_id).end()
     return {"messages": thread["messages"]}
 
 # 4) bridge.py posts the LLM’s reply here
@@ -76,6 +99,8 @@ def post_answer(thread_id: int, req: AnswerRequest):
             raise HTTPException(status_code=404, detail="Thread not found")
         thread["messages"].append({"type": "bot", "content": req.content})
         thread["answered"] = True
+    thread["span"].set(answer_chars=len(req.content))
+    thread["span"].end()
     return {"status": "ok"}
 
 if __name__ == "__main__":
@@ -0,0 +1,222 @@
+# LLM_Bridge/tracing.py
+# W3C trace context (traceparent header) across the answer path:
+#   widget -> threads_service.py -> UI/bridge.py -> llm_app.py -> Ollama
+# Each service records spans as one JSON object per line, to stdout or a local file,
+# so a slow answer can be rebuilt hop by hop without a collector:
+#
+#   TRACE_EXPORT=stdout                    spans on stdout
+#   TRACE_EXPORT=/var/log/flexbo/spans.ndjson   appended to a file (several services may share it)
+#   python -m LLM_Bridge.tracing timeline spans.ndjson [trace_id]
+#
+# Off by default: span() returns a shared no-op and headers() only forwards the
+# incoming traceparent, so downstream services still join the caller's trace.
+import os
+import re
+import sys
+import json
+import time
+import secrets
+import threading
+from typing import Dict, List, Mapping, Optional
+
+TRACE_EXPORT = os.getenv("TRACE_EXPORT", "")  # "" = off, "stdout", or a file path
+SERVICE_NAME = os.getenv("TRACE_SERVICE", "")  # overrides the name set by the service
+
+_TRACEPARENT = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+_local = threading.local()
+_write_lock = threading.Lock()
+_service = SERVICE_NAME or "flexbo"
+
+
+class Context:
+    """trace id, span id and sampled flag of one span, as carried by traceparent."""
+
+    __slots__ = ("trace_id", "span_id", "sampled")
+
+    def __init__(self, trace_id: str, span_id: str, sampled: bool = True):
+        self.trace_id = trace_id
+        self.span_id = span_id
+        self.sampled = sampled
+
+    @property
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-{'01' if self.sampled else '00'}"
+
+
+def set_service(name: str) -> None:
+    """Service name written on every span (TRACE_SERVICE wins when set)."""
+    global _service
+    _service = SERVICE_NAME or name
+
+
+def enabled() -> bool:
+    return bool(TRACE_EXPORT)
+
+
+def parse(value: Optional[str]) -> Optional[Context]:
+    """Context from a traceparent value; None when missing or malformed."""
+    m = _TRACEPARENT.match((value or "").strip().lower())
+    if not m or m.group(1) == "0" * 32 or m.group(2) == "0" * 16:
+        return None
+    return Context(m.group(1), m.group(2), bool(int(m.group(3), 16) & 1))
+
+
+def extract(headers: Mapping) -> Optional[Context]:
+    """Context from incoming request headers (Flask/Starlette/requests header objects)."""
+    return parse(headers.get("traceparent"))
+
+
+def current() -> Optional[Context]:
+    stack = getattr(_local, "stack", None)
+    return stack[-1].context if stack else None
+
+
+def headers(parent: Optional[Context] = None) -> Dict[str, str]:
+    """traceparent for an outgoing request: the current span, else `parent`."""
+    ctx = current() or parent
+    return {"traceparent": ctx.traceparent} if ctx else {}
+
+
+# ---------------- export ----------------
+def _export(record: Dict) -> None:
+    line = json.dumps(record, separators=(",", ":"), default=str) + "\n"
+    with _write_lock:
+        if TRACE_EXPORT == "stdout":
+            sys.stdout.write(line)
+            sys.stdout.flush()
+            return
+        try:
+            # one write per line in append mode, so services sharing the file don't interleave
+            with open(TRACE_EXPORT, "a", encoding="utf-8") as f:
+                f.write(line)
+        except OSError as e:
+            print(f"[TRACE] could not write span to {TRACE_EXPORT}: {e}")
+
+
+# ---------------- spans ----------------
+class Span:
+    """
+    One timed operation. Use as a context manager (it becomes the current span of the
+    thread, so headers() and nested spans pick it up) or call end() yourself when the
+    work finishes elsewhere, e.g. in a streaming generator.
+    """
+
+    def __init__(self, name: str, parent: Optional[Context] = None, start: Optional[float] = None,
+                 **attrs):
+        parent = parent or current()
+        trace_id = parent.trace_id if parent else secrets.token_hex(16)
+        self.context = Context(trace_id, secrets.token_hex(8), parent.sampled if parent else True)
+        self.parent_id = parent.span_id if parent else None
+        self.name = name
+        self.attrs = attrs
+        self.error: Optional[str] = None
+        self.start = time.time() if start is None else start  # wall clock: spans come from several hosts
+        self._t0 = time.perf_counter() - (time.time() - self.start)
+        self._ended = False
+
+    def set(self, **attrs) -> None:
+        self.attrs.update(attrs)
+
+    def fail(self, exc: BaseException) -> None:
+        self.error = f"{type(exc).__name__}: {exc}"
+
+    def end(self) -> None:
+        if self._ended:
+            return
+        self._ended = True
+        if not self.context.sampled:
+            return
+        _export({
+            "trace_id": self.context.trace_id, "span_id": self.context.span_id,
+            "parent_id": self.parent_id, "name": self.name, "service": _service,
+            "start": round(self.start, 6), "ms": round((time.perf_counter() - self._t0) * 1000, 3),
+            "error": self.error, "attrs": self.attrs,
+        })
+
+    def __enter__(self):
+        if not hasattr(_local, "stack"):
+            _local.stack = []
+        _local.stack.append(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        stack = _local.stack
+        if stack and stack[-1] is self:
+            stack.pop()
+        if exc is not None and self.error is None:
+            self.fail(exc)
+        self.end()
+        return False
+
+
+class _NullSpan:
+    """Shared no-op returned while tracing is off."""
+
+    context = None
+
+    def set(self, **attrs) -> None:
+        pass
+
+    def fail(self, exc: BaseException) -> None:
+        pass
+
+    def end(self) -> None:
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL = _NullSpan()
+
+
+def span(name: str, parent: Optional[Context] = None, start: Optional[float] = None, **attrs):
+    """Span named `name` under `parent` (default: this thread's current span)."""
+    if not TRACE_EXPORT:
+        return _NULL
+    return Span(name, parent, start, **attrs)
+
+
+# ---------------- timeline ----------------
+def _timeline(path: str, trace_id: Optional[str] = None) -> None:
+    spans: List[Dict] = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                spans.append(json.loads(line))
+            except ValueError:
+                continue  # a stdout export may contain log lines too
+    traces: Dict[str, List[Dict]] = {}
+    for s in spans:
+        if "trace_id" in s and (trace_id is None or s["trace_id"] == trace_id):
+            traces.setdefault(s["trace_id"], []).append(s)
+    if not traces:
+        sys.exit("no matching spans")
+
+    for tid, group in sorted(traces.items(), key=lambda kv: min(s["start"] for s in kv[1])):
+        t0 = min(s["start"] for s in group)
+        end = max(s["start"] + s["ms"] / 1000 for s in group)
+        print(f"trace {tid}  {(end - t0) * 1000:.0f} ms")
+        ids = {s["span_id"] for s in group}
+        children: Dict[Optional[str], List[Dict]] = {}
+        for s in group:
+            # a parent we have no span for (another host's file, the widget) -> show as a root
+            children.setdefault(s["parent_id"] if s["parent_id"] in ids else None, []).append(s)
+
+        def show(parent: Optional[str], depth: int) -> None:
+            for s in sorted(children.get(parent, []), key=lambda s: s["start"]):
+                err = f"  ERROR {s['error']}" if s.get("error") else ""
+                print(f"  {(s['start'] - t0) * 1000:>9.1f} ms {s['ms']:>9.1f} ms  "
+                      f"{'  ' * depth}{s['service']}: {s['name']}{err}")
+                show(s["span_id"], depth + 1)
+
+        show(None, 0)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3 or sys.argv[1] != "timeline":
+        sys.exit("usage: python -m LLM_Bridge.tracing timeline <spans.ndjson> [trace_id]")
+    _timeline(sys.argv[2], sys.argv[3] if len(sys.argv) > 3 else None)